@@ -0,0 +1,87 @@
+"""
+user-018: size and load cost of the binary checkpoint (hierarchy.bin) versus the JSON shards.
+
+The standard library tree gets a synthetic document on every object and is checkpointed in both formats.
+Each format is then loaded with MetaInfo.from_checkpoint_path in a fresh process (best of 3) in three modes:
+open only (lazy, only the index is read), walk every object, and to_hierarchy_json of the whole tree.
+The load time and the growth of the resident set are printed.
+
+Usage: python benchmarks/bench_binary_checkpoint.py
+"""
+import gc
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import common
+
+from doc_meta_info import MetaInfo
+
+REPEAT = 3
+
+
+def rss_kb():
+    with open("/proc/self/status") as reader:
+        return int(next(line for line in reader if line.startswith("VmRSS")).split()[1])
+
+
+def load(checkpoint_dir, mode):
+    """Runs in the child process: loads checkpoint_dir and prints "seconds rss_growth_mb" as the last line."""
+    gc.collect()
+    rss_before = rss_kb()
+    start = time.perf_counter()
+    meta_info = MetaInfo.from_checkpoint_path(checkpoint_dir)
+    if mode == "walk":
+        sum(1 for _ in meta_info.target_repo_hierarchical_tree.iter_preorder())
+    elif mode == "full":
+        meta_info.to_hierarchy_json()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    print(f"{elapsed:.3f} {(rss_kb() - rss_before) / 1024:.1f}")
+
+
+def dir_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def main():
+    meta_info = MetaInfo.from_project_hierarchy_json(common.parse_stdlib())
+    meta_info.repo_path = common.STDLIB_DIR
+    for item in meta_info.target_repo_hierarchical_tree.iter_preorder():
+        if item.content:
+            item.md_content.append(f"Generated documentation paragraph for {item.obj_name}. " * 6)
+
+    work_dir = tempfile.mkdtemp(prefix="bench_checkpoint_")
+    try:
+        checkpoints = {"json": os.path.join(work_dir, "json"), "binary": os.path.join(work_dir, "binary")}
+        for kind, checkpoint_dir in checkpoints.items():
+            start = time.perf_counter()
+            meta_info.checkpoint(checkpoint_dir, flash_reference_relation=True, binary=kind == "binary")
+            print(f"{kind:<6} write {time.perf_counter() - start:.2f} s")
+        print(
+            f"size on disk: json shards {dir_size(os.path.join(checkpoints['json'], 'hierarchy')) / 1e6:.1f} MB, "
+            f"binary {dir_size(os.path.join(checkpoints['binary'], 'hierarchy.bin')) / 1e6:.1f} MB"
+        )
+        print(f"{'mode':<6} {'format':<7} {'load s':>8} {'+RSS MB':>8}")
+        for mode in ("lazy", "walk", "full"):
+            for kind, checkpoint_dir in checkpoints.items():
+                runs = [
+                    subprocess.check_output([sys.executable, __file__, checkpoint_dir, mode]).decode().splitlines()[-1].split()
+                    for _ in range(REPEAT)
+                ]
+                elapsed, rss_growth = min(runs, key=lambda run: float(run[0]))
+                print(f"{mode:<6} {kind:<7} {elapsed:>8} {rss_growth:>8}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        load(sys.argv[1], sys.argv[2])
+    else:
+        main()
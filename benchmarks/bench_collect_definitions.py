@@ -0,0 +1,83 @@
+"""
+user-005: extracting functions and classes in one AST traversal versus the original extraction.
+
+The original get_functions_and_classes attached a parent to every AST node, recomputed the end line of every
+definition by walking its subtree, and rebuilt the list of names found so far for each definition. This script
+keeps it as a reference implementation, times both on generated nested functions (3 per level), and checks
+that (type, name, start line, end line) of every definition and their order are the same.
+
+Usage: python benchmarks/bench_collect_definitions.py [depth ...]
+"""
+import ast
+import sys
+import time
+
+import common  # noqa: F401
+
+from file_handler import FileHandler
+
+
+def original_functions_and_classes(code_content):
+    """The original get_functions_and_classes, reference implementation."""
+
+    def add_parent_references(node):
+        for child in ast.iter_child_nodes(node):
+            child.parent = node
+            add_parent_references(child)
+
+    def get_end_lineno(node):
+        if not hasattr(node, "lineno"):
+            return -1
+        end_lineno = node.lineno
+        for child in ast.iter_child_nodes(node):
+            child_end = getattr(child, "end_lineno", None) or get_end_lineno(child)
+            if child_end > -1:
+                end_lineno = max(end_lineno, child_end)
+        return end_lineno
+
+    tree = ast.parse(code_content)
+    add_parent_references(tree)
+    functions_and_classes = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)):
+            parameters = [arg.arg for arg in node.args.args] if "args" in dir(node) else []
+            all_names = [item[1] for item in functions_and_classes]  # noqa: F841 原实现中每个定义都重建一次
+            functions_and_classes.append((type(node).__name__, node.name, node.lineno, get_end_lineno(node), parameters))
+    return functions_and_classes
+
+
+def generate_nested_functions(depth, width=3):
+    lines = []
+
+    def emit(level, indent, prefix):
+        for i in range(width):
+            name = f"{prefix}_{i}"
+            lines.append(f"{indent}def {name}(a, b):")
+            lines.append(f"{indent}    x = a + b")
+            if level < depth:
+                emit(level + 1, indent + "    ", name)
+            lines.append(f"{indent}    return x")
+
+    emit(0, "", "f")  # 最外层是第 0 层, 共 depth + 1 层
+    return "\n".join(lines) + "\n"
+
+
+def main(depths):
+    file_handler = FileHandler(common.STDLIB_DIR, None)
+    print(f"{'depth':>5} {'defs':>7} {'original':>9} {'one traversal':>14} {'speedup':>8}")
+    for depth in depths:
+        code = generate_nested_functions(depth)
+        start = time.perf_counter()
+        expected = original_functions_and_classes(code)
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        definitions = file_handler.collect_definitions(code)
+        new_time = time.perf_counter() - start
+        assert [item[:4] for item in expected] == [
+            (definition.type, definition.name, definition.start_line, definition.end_line) for definition in definitions
+        ], "the two extractions disagree"
+        print(f"{depth:>5} {len(definitions):>7} {old_time:>8.2f}s {new_time:>13.2f}s {old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [6, 8])
@@ -0,0 +1,128 @@
+"""
+user-012: memory of the DocItem tree with __slots__ and lazily allocated collections versus the original
+dataclass layout.
+
+The standard library is parsed and its tree is built once with MetaInfo. Every node is then copied, under
+tracemalloc, into a replica of the original @dataclass DocItem (whose collections are allocated at construction)
+and into the current DocItem; both copies share the content dicts and documents prepared beforehand, so only the
+nodes themselves are counted. The second figure adds the output of to_hierarchy_json (the original one wrote
+into the content dicts in place, the current one copies them).
+
+Usage: python benchmarks/bench_docitem_memory.py
+"""
+import gc
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import common
+
+from doc_meta_info import DocItem, DocItemStatus, DocItemType, MetaInfo
+
+
+@dataclass(eq=False)
+class OriginalDocItem:
+    """The fields of the original DocItem dataclass, reference implementation."""
+    item_type: DocItemType = DocItemType._class_function
+    item_status: DocItemStatus = DocItemStatus.doc_has_not_been_generated
+    obj_name: str = ""
+    code_start_line: int = -1
+    code_end_line: int = -1
+    md_content: List[str] = field(default_factory=list)
+    content: Dict[Any, Any] = field(default_factory=dict)
+    children: Dict[str, "OriginalDocItem"] = field(default_factory=dict)
+    father: Any = None
+    depth: int = 0
+    euler_in: int = -1
+    euler_out: int = -1
+    max_reference_ansce: Any = None
+    reference_who: List["OriginalDocItem"] = field(default_factory=list)
+    who_reference_me: List["OriginalDocItem"] = field(default_factory=list)
+    special_reference_type: List[bool] = field(default_factory=list)
+    reference_who_name_list: List[str] = field(default_factory=list)
+    who_reference_me_name_list: List[str] = field(default_factory=list)
+    has_task: bool = False
+    _full_name: Optional[str] = field(default=None, init=False, repr=False)
+    _strict_full_name: Optional[str] = field(default=None, init=False, repr=False)
+
+
+def copy_tree(item: DocItem, node_class, contents, father=None):
+    """Copies the subtree of item into node_class nodes, taking content and md_content from contents."""
+    content, md_content = contents.get(item, (None, None))
+    kwargs = dict(
+        item_type=item.item_type, item_status=item.item_status, obj_name=item.obj_name,
+        code_start_line=item.code_start_line, code_end_line=item.code_end_line,
+        father=father, depth=item.depth, euler_in=item.euler_in, euler_out=item.euler_out,
+    )
+    if content is not None:
+        kwargs.update(content=content, md_content=md_content)
+    copied = node_class(**kwargs)
+    if item.children:
+        copied.children = {name: copy_tree(child, node_class, contents, copied) for name, child in item.children.items()}
+    return copied
+
+
+def original_to_hierarchy_json(root: OriginalDocItem):
+    """The original to_hierarchy_json: content dicts are updated in place and collected per file."""
+    hierarchy_json, stack = {}, [root]
+    while stack:
+        file_item = stack.pop()
+        if file_item.item_type != DocItemType._file:
+            stack.extend(file_item.children.values())
+            continue
+        file_content, object_stack = [], list(reversed(file_item.children.values()))
+        while object_stack:
+            now_obj = object_stack.pop()
+            temp_json_obj = now_obj.content
+            temp_json_obj["name"] = now_obj.obj_name
+            temp_json_obj["type"] = now_obj.item_type.to_str()
+            temp_json_obj["md_content"] = now_obj.md_content
+            temp_json_obj["item_status"] = now_obj.item_status.name
+            temp_json_obj["who_reference_me"] = now_obj.who_reference_me_name_list
+            temp_json_obj["reference_who"] = now_obj.reference_who_name_list
+            file_content.append(temp_json_obj)
+            object_stack.extend(reversed(now_obj.children.values()))
+        hierarchy_json[id(file_item)] = file_content
+    return hierarchy_json
+
+
+def current_to_hierarchy_json(root: DocItem):
+    return MetaInfo(target_repo_hierarchical_tree=root).to_hierarchy_json()
+
+
+def measure(meta_info: MetaInfo, node_class, to_json, original_contents: bool):
+    items = [item for item in meta_info.target_repo_hierarchical_tree.iter_preorder() if item.content]
+    if original_contents:  # 原来的 content 中也保存了 md_content, 文档是普通列表
+        contents = {item: (dict(item.content, md_content=list(item.md_content)), None) for item in items}
+        contents = {item: (content, content["md_content"]) for item, (content, _) in contents.items()}
+    else:
+        contents = {item: (dict(item.content), item.md_content) for item in items}
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    root = copy_tree(meta_info.target_repo_hierarchical_tree, node_class, contents)
+    gc.collect()
+    tree_bytes = tracemalloc.get_traced_memory()[0] - base
+    hierarchy_json = to_json(root)
+    gc.collect()
+    total_bytes = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    del hierarchy_json, root
+    return tree_bytes, total_bytes
+
+
+def main():
+    meta_info = MetaInfo.from_project_hierarchy_json(common.parse_stdlib())
+    node_count = sum(1 for _ in meta_info.target_repo_hierarchical_tree.iter_preorder())
+    results = {
+        "original dataclass": measure(meta_info, OriginalDocItem, original_to_hierarchy_json, True),
+        "__slots__ + lazy": measure(meta_info, DocItem, current_to_hierarchy_json, False),
+    }
+    print(f"{node_count} nodes")
+    print(f"{'layout':<20} {'tree B/node':>12} {'+ to_hierarchy_json B/node':>27}")
+    for name, (tree_bytes, total_bytes) in results.items():
+        print(f"{name:<20} {tree_bytes / node_count:>12.0f} {total_bytes / node_count:>27.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+user-002: reading each file once into a SourceBuffer versus reading the file again for every object.
+
+Generates a file of N three-line functions and times generate_file_structure (one SourceBuffer shared by
+every object) against a copy of the original get_obj_code_info, which opened the file and called readlines()
+for every object. Both must agree on the fields they share (have_return, name_column and the line range).
+
+Usage: python benchmarks/bench_source_buffer.py [N ...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import common
+
+from file_handler import FileHandler
+
+
+def write_workload(repo_path, function_count):
+    with open(os.path.join(repo_path, "big.py"), "w", encoding="utf-8") as writer:
+        for i in range(function_count):
+            writer.write(f"def func_{i}(a, b):\n    x = a + b\n    return x\n\n")
+
+
+def original_obj_code_info(repo_path, file_path, code_type, code_name, start_line, end_line, params):
+    """The original get_obj_code_info, reference implementation."""
+    with open(os.path.join(repo_path, file_path), "r", encoding="utf-8") as code_file:
+        lines = code_file.readlines()
+        code_content = "".join(lines[start_line - 1 : end_line])
+        return {
+            "type": code_type,
+            "name": code_name,
+            "code_start_line": start_line,
+            "code_end_line": end_line,
+            "params": params,
+            "have_return": "return" in code_content,
+            "code_content": code_content,
+            "name_column": lines[start_line - 1].find(code_name),
+        }
+
+
+def per_object_read(file_handler, file_path):
+    """The original loop: the whole file is read again for every object."""
+    with open(os.path.join(file_handler.repo_path, file_path), "r", encoding="utf-8") as reader:
+        structures = file_handler.get_functions_and_classes(reader.read())
+    return [original_obj_code_info(file_handler.repo_path, file_path, *structure) for structure in structures]
+
+
+def shared_fields(code_info):
+    return tuple(code_info[key] for key in ("type", "name", "code_start_line", "code_end_line", "have_return", "name_column"))
+
+
+def main(function_counts):
+    repo_path = tempfile.mkdtemp(prefix="bench_source_buffer_")
+    common.use_target_repo(repo_path)
+    file_handler = FileHandler(repo_path, "big.py")
+    print(f"{'N':>6} {'per-object read':>16} {'shared buffer':>14} {'speedup':>8}")
+    for function_count in function_counts:
+        write_workload(repo_path, function_count)
+        start = time.perf_counter()
+        expected = per_object_read(file_handler, "big.py")
+        old_time = time.perf_counter() - start
+        start = time.perf_counter()
+        file_objects = file_handler.generate_file_structure("big.py")
+        new_time = time.perf_counter() - start
+        assert list(map(shared_fields, file_objects)) == list(map(shared_fields, expected)), "the two paths disagree"
+        print(f"{function_count:>6} {old_time:>15.2f}s {new_time:>13.2f}s {old_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [2000, 4000, 8000])
@@ -0,0 +1,52 @@
+"""
+Shared setup of the benchmark scripts: the environment read by settings at import time, and the
+standard library workload. Import this module before any module of the tool.
+"""
+import os
+import sys
+import sysconfig
+import tempfile
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+STDLIB_DIR = Path(sysconfig.get_paths()["stdlib"])
+# 标准库中不参与基准测试的目录: 测试、第三方包和体积很大但与被测代码无关的工具
+STDLIB_IGNORE_LIST = ["test", "site-packages", "idlelib", "lib2to3", "tkinter", "turtledemo", "ensurepip"]
+
+os.environ.setdefault("target_repo_path", str(STDLIB_DIR))
+os.environ.setdefault("hierarchy_path", ".project_doc_record")
+os.environ.setdefault("markdown_docs_path", "markdown_docs")
+os.environ.setdefault("BASE-URL", "https://example.org")
+os.environ.setdefault("MODEL", "gpt-3.5-turbo")
+os.environ.setdefault("API-KEY", "benchmark-key")
+sys.path.insert(0, str(PACKAGE_DIR))
+
+from log import logger  # noqa: E402
+from settings import setting  # noqa: E402
+
+logger.remove()
+
+
+def use_target_repo(repo_path, hierarchy_dir=None):
+    """
+    Points the settings at repo_path. The hierarchy (parse cache, source snapshots) goes to hierarchy_dir,
+    a new temporary directory by default, so the benchmarks never write into the measured repository.
+    """
+    setting.project.target_repo = Path(repo_path)
+    setting.project.hierarchy_name = str(hierarchy_dir or tempfile.mkdtemp(prefix="bench_hierarchy_"))
+    setting.project.use_parse_cache = False
+    return setting.project.hierarchy_name
+
+
+def parse_stdlib():
+    """Parses the standard library of the running interpreter, returns {file path: file_objects}."""
+    from file_handler import FileHandler
+
+    use_target_repo(STDLIB_DIR)
+    setting.project.ignore_list = list(STDLIB_IGNORE_LIST)
+    with open(os.devnull, "w") as devnull:  # 不显示 tqdm 进度条
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            return FileHandler(STDLIB_DIR, None).generate_overall_structure({}, [])
+        finally:
+            sys.stderr = stderr
@@ -0,0 +1,292 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from contextlib import ExitStack
+
+from doc_store import DocStore
+from log import logger
+
+_HEADER = struct.Struct("<8sIQQ4x")  # magic, 版本, 索引的偏移, 索引的长度
+_SEGMENT_HEADER = struct.Struct("<III4x")  # 字符串数, 列表项数, 对象数
+# 一个对象的定长记录: name, type, item_status 的字符串编号; code_start_line, code_end_line, name_column;
+# code_hash, source_hash 的字符串编号; params, md_content, who_reference_me, reference_who,
+# special_reference_type 五个列表的 (起点, 长度); 其他字段的 JSON 的字符串编号; 字段是否存在的位图; have_return
+_RECORD = struct.Struct("<3I3i13IHBx")
+_NONE = 0xFFFFFFFF
+
+# 定长记录中保存的字段, 顺序与 MetaInfo.file_to_json 输出的顺序相同, 位置即在位图中的位置
+_STR_FIELDS = ("type", "name", "item_status", "code_hash", "source_hash")
+_INT_FIELDS = ("code_start_line", "code_end_line", "name_column")
+_STR_LIST_FIELDS = ("params", "md_content", "who_reference_me", "reference_who")
+_FIELD_ORDER = (
+    "type", "name", "md_content", "code_start_line", "code_end_line", "params", "have_return",
+    "code_hash", "source_hash", "name_column", "item_status", "who_reference_me", "reference_who",
+    "special_reference_type",
+)
+_FIELD_BIT = {key: 1 << pos for pos, key in enumerate(_FIELD_ORDER)}
+(
+    _BIT_TYPE, _BIT_NAME, _BIT_MD_CONTENT, _BIT_CODE_START_LINE, _BIT_CODE_END_LINE, _BIT_PARAMS, _BIT_HAVE_RETURN,
+    _BIT_CODE_HASH, _BIT_SOURCE_HASH, _BIT_NAME_COLUMN, _BIT_ITEM_STATUS, _BIT_WHO_REFERENCE_ME, _BIT_REFERENCE_WHO,
+    _BIT_SPECIAL_REFERENCE_TYPE,
+) = _FIELD_BIT.values()
+
+
+def _is_record_value(key, value) -> bool:
+    """Whether value fits in the fixed-width record, anything else is kept in the JSON of the other fields."""
+    if key in _STR_FIELDS:
+        return type(value) is str
+    if key in _INT_FIELDS:
+        return type(value) is int and -(2**31) <= value < 2**31
+    if key in _STR_LIST_FIELDS:
+        return type(value) in (list, tuple) and all(type(element) is str for element in value)
+    if key == "special_reference_type":
+        return type(value) in (list, tuple) and all(type(element) is bool for element in value)
+    if key == "have_return":
+        return type(value) is bool
+    return False
+
+
+def encode_segment(file_content) -> bytes:
+    """
+    Encodes the objects of one file (a value of project_hierarchy.json) into a self-contained segment:
+    a string table (offsets + utf-8 data, names/hashes deduplicated, docs stored as entries too),
+    a table of list items and one fixed-width record per object.
+    """
+    string_ids = {}
+    string_parts = []
+    string_offsets = array("I", [0])
+    list_items = array("I")
+
+    def string_id(text):
+        sid = string_ids.get(text)
+        if sid is None:
+            sid = string_ids[text] = len(string_parts)
+            encoded = text.encode("utf-8")
+            string_parts.append(encoded)
+            string_offsets.append(string_offsets[-1] + len(encoded))
+        return sid
+
+    def list_span(values):
+        start = len(list_items)
+        list_items.extend(values)
+        return start, len(values)
+
+    records = bytearray()
+    for value in file_content:
+        present = 0
+        extra = {}
+        for key, field_value in value.items():
+            if key in _FIELD_BIT and _is_record_value(key, field_value):
+                present |= _FIELD_BIT[key]
+            else:
+                extra[key] = field_value
+
+        def get_str(key):
+            return string_id(value[key]) if present & _FIELD_BIT[key] else _NONE
+
+        def get_int(key):
+            return value[key] if present & _FIELD_BIT[key] else 0
+
+        def get_list(key):
+            if not present & _FIELD_BIT[key]:
+                return 0, 0
+            if key == "special_reference_type":
+                return list_span([int(flag) for flag in value[key]])
+            return list_span([string_id(text) for text in value[key]])
+
+        records += _RECORD.pack(
+            get_str("name"), get_str("type"), get_str("item_status"),
+            get_int("code_start_line"), get_int("code_end_line"), get_int("name_column"),
+            get_str("code_hash"), get_str("source_hash"),
+            *get_list("params"), *get_list("md_content"), *get_list("who_reference_me"),
+            *get_list("reference_who"), *get_list("special_reference_type"),
+            string_id(json.dumps(extra, ensure_ascii=False)) if extra else _NONE,
+            present,
+            bool(value["have_return"]) if present & _FIELD_BIT["have_return"] else 0,
+        )
+
+    return b"".join([
+        _SEGMENT_HEADER.pack(len(string_parts), len(list_items), len(file_content)),
+        string_offsets.tobytes(),
+        list_items.tobytes(),
+        bytes(records),
+        *string_parts,
+    ])
+
+
+def decode_segment(segment: memoryview):
+    """Decodes a segment written by `encode_segment` back into the list of object dicts."""
+    string_count, list_item_count, object_count = _SEGMENT_HEADER.unpack_from(segment, 0)
+    pos = _SEGMENT_HEADER.size
+    string_offsets = segment[pos : pos + (string_count + 1) * 4].cast("I")
+    pos += (string_count + 1) * 4
+    list_items = segment[pos : pos + list_item_count * 4].cast("I")
+    pos += list_item_count * 4
+    records_start = pos
+    string_data = segment[records_start + object_count * _RECORD.size :]
+    strings = {}
+
+    def get_string(sid):
+        text = strings.get(sid)
+        if text is None:
+            text = strings[sid] = str(string_data[string_offsets[sid] : string_offsets[sid + 1]], "utf-8")
+        return text
+
+    file_content = []
+    for record_pos in range(records_start, records_start + object_count * _RECORD.size, _RECORD.size):
+        (
+            name, item_type, item_status, code_start_line, code_end_line, name_column, code_hash, source_hash,
+            params_start, params_count, md_start, md_count, who_start, who_count,
+            reference_start, reference_count, special_start, special_count,
+            extra, present, have_return,
+        ) = _RECORD.unpack_from(segment, record_pos)
+        value = {}
+        if present & _BIT_TYPE:
+            value["type"] = get_string(item_type)
+        if present & _BIT_NAME:
+            value["name"] = get_string(name)
+        if present & _BIT_MD_CONTENT:
+            value["md_content"] = [get_string(sid) for sid in list_items[md_start : md_start + md_count]]
+        if present & _BIT_CODE_START_LINE:
+            value["code_start_line"] = code_start_line
+        if present & _BIT_CODE_END_LINE:
+            value["code_end_line"] = code_end_line
+        if present & _BIT_PARAMS:
+            value["params"] = [get_string(sid) for sid in list_items[params_start : params_start + params_count]]
+        if present & _BIT_HAVE_RETURN:
+            value["have_return"] = bool(have_return)
+        if present & _BIT_CODE_HASH:
+            value["code_hash"] = get_string(code_hash)
+        if present & _BIT_SOURCE_HASH:
+            value["source_hash"] = get_string(source_hash)
+        if present & _BIT_NAME_COLUMN:
+            value["name_column"] = name_column
+        if extra != _NONE:  # 其他字段放在解析得到的字段之后, 与 file_to_json 的顺序一致
+            value.update(json.loads(get_string(extra)))
+        if present & _BIT_ITEM_STATUS:
+            value["item_status"] = get_string(item_status)
+        if present & _BIT_WHO_REFERENCE_ME:
+            value["who_reference_me"] = [get_string(sid) for sid in list_items[who_start : who_start + who_count]]
+        if present & _BIT_REFERENCE_WHO:
+            value["reference_who"] = [
+                get_string(sid) for sid in list_items[reference_start : reference_start + reference_count]
+            ]
+        if present & _BIT_SPECIAL_REFERENCE_TYPE:
+            value["special_reference_type"] = [
+                bool(flag) for flag in list_items[special_start : special_start + special_count]
+            ]
+        file_content.append(value)
+    return file_content
+
+
+class BinaryCheckpoint:
+    """
+    二进制格式的层级信息(hierarchy.bin), 只依赖标准库, 读取时内存映射, 按文件懒解码。
+
+    文件由头部、每个源文件一个自包含的段(见 `encode_segment`)以及末尾的 JSON 索引组成,
+    索引记录每个源文件的深度以及段的偏移和长度。打开时只读取索引就能建立到file节点为止的树,
+    与 ShardStore 一样作为file节点的分片来源, 文件中的对象在第一次被访问时才解码。
+    重写时没有加载过的文件直接复制原来的段, 不需要解码。
+    """
+
+    file_name = "hierarchy.bin"
+    magic = b"RADOCBIN"
+    format_version = 1
+
+    def __init__(self, checkpoint_dir):
+        self.root = os.path.join(os.fspath(checkpoint_dir), self.file_name)
+        self.loaded_count = 0  # 解码过的段数
+        self.doc_store = DocStore(checkpoint_dir)  # 段中 md_history 引用的文档旧版本
+        self._file = None
+        self._mmap = None
+        self._files = None  # 相对路径 -> [深度, 段的偏移, 段的长度]
+        self._lock = threading.RLock()  # 生成文档的线程解码时, 写检查点的线程不能关闭映射
+
+    def exists(self) -> bool:
+        return os.path.exists(self.root)
+
+    def _open(self):
+        if self._mmap is not None:
+            return
+        self._file = open(self.root, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, index_offset, index_length = _HEADER.unpack_from(self._mmap, 0)
+        if magic != self.magic or version != self.format_version:
+            self.close()
+            raise ValueError(f"{self.root} is not a supported binary checkpoint")
+        index = json.loads(self._mmap[index_offset : index_offset + index_length])
+        if index["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"{self.root} was written on a machine with a different byte order")
+        self._files = index["files"]
+
+    def close(self):
+        """Unmaps the file, it is mapped again by the next read (which sees the file replaced in the meantime, if any)."""
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.close()
+                self._file.close()
+            self._mmap = self._file = None
+
+    def read_manifest(self):
+        """Same format as `ShardStore.read_manifest`: file path -> {"depth": depth of the file node}."""
+        with self._lock:
+            self._open()
+            return {file_name: {"depth": depth} for file_name, (depth, _, _) in self._files.items()}
+
+    def read_segment(self, file_name: str) -> memoryview:
+        """The raw bytes of a segment. The view must be released before the store is closed."""
+        with self._lock:
+            self._open()
+            _, offset, length = self._files[file_name]
+            return memoryview(self._mmap)[offset : offset + length]
+
+    def read_shard(self, file_name: str):
+        with self._lock:
+            segment = self.read_segment(file_name)
+            try:
+                file_content = decode_segment(segment)
+            finally:
+                segment.release()  # 否则 mmap 无法关闭
+            self.loaded_count += 1
+        return file_content
+
+    def write(self, segments, replaced_stores=()):
+        """
+        Writes a new checkpoint.
+
+        Args:
+            segments: Iterable of (file path, depth, segment bytes) in tree order.
+            replaced_stores: Stores mapping the old file, closed right before it is replaced
+                (Windows cannot replace a mapped file). Their segments must have been read already.
+        """
+        os.makedirs(os.path.dirname(self.root), exist_ok=True)
+        tmp_path = self.root + ".tmp"
+        files = {}
+        with open(tmp_path, "wb") as writer:
+            writer.write(b"\0" * _HEADER.size)
+            offset = _HEADER.size
+            for file_name, depth, segment in segments:
+                length = len(segment)
+                files[file_name] = [depth, offset, length]
+                writer.write(segment)
+                if isinstance(segment, memoryview):
+                    segment.release()  # 复制自旧文件的段, 释放后旧文件才能关闭
+                padding = -length % 8  # 每个段按8字节对齐
+                writer.write(b"\0" * padding)
+                offset += length + padding
+            index = json.dumps({"byteorder": sys.byteorder, "files": files}, ensure_ascii=False).encode("utf-8")
+            writer.write(index)
+            writer.seek(0)
+            writer.write(_HEADER.pack(self.magic, self.format_version, offset, len(index)))
+        with ExitStack() as stack:  # 替换完成之前其他线程不能通过旧的对象重新映射旧文件
+            for store in replaced_stores:
+                stack.enter_context(store._lock)
+                store.close()
+            self.close()
+            os.replace(tmp_path, self.root)
+        logger.info(f"Binary checkpoint written: {len(files)} files, {offset + len(index)} bytes")
@@ -7,6 +7,7 @@ from dataclasses import dataclass
 import tiktoken
 from openai import APIConnectionError, OpenAI
 
+from code_store import CodeStore
 from doc_meta_info import DocItem
 from log import logger
 from prompt import SYS_PROMPT, USR_PROMPT
@@ -34,6 +35,13 @@ class ChatEngine:
 
     def __init__(self, project_manager):
         self.project_manager = project_manager
+        self.code_store = CodeStore(
+            setting.project.target_repo, setting.project.target_repo / setting.project.hierarchy_name
+        )
+
+    def get_code_content(self, doc_item: DocItem) -> str:
+        """The source code of doc_item, sliced from its file (or the saved snapshot of it) on demand."""
+        return self.code_store.get_code_content(doc_item.get_file_name(), doc_item.content)
 
     def num_tokens_from_string(self, string: str, encoding_name="cl100k_base") -> int:
         """Returns the number of tokens in a text string."""
@@ -138,7 +146,7 @@ class ChatEngine:
 
         code_type = code_info["type"]
         code_name = code_info["name"]
-        code_content = code_info["code_content"]
+        code_content = self.get_code_content(doc_item)
         have_return = code_info["have_return"]
         who_reference_me = doc_item.who_reference_me_name_list
         reference_who = doc_item.reference_who_name_list
@@ -166,7 +174,7 @@ class ChatEngine:
             ]
             for k, reference_item in enumerate(doc_item.reference_who):
                 instance_prompt = (
-                    f"""obj: {reference_item.get_full_name()}\nDocument: \n{reference_item.md_content[-1] if len(reference_item.md_content) > 0 else 'None'}\nRaw code:```\n{reference_item.content['code_content'] if 'code_content' in reference_item.content.keys() else ''}\n```"""
+                    f"""obj: {reference_item.get_full_name()}\nDocument: \n{reference_item.md_content[-1] if len(reference_item.md_content) > 0 else 'None'}\nRaw code:```\n{self.get_code_content(reference_item)}\n```"""
                     + "=" * 10
                 )
                 prompt.append(instance_prompt)
@@ -180,7 +188,7 @@ class ChatEngine:
             ]
             for k, referencer_item in enumerate(doc_item.who_reference_me):
                 instance_prompt = (
-                    f"""obj: {referencer_item.get_full_name()}\nDocument: \n{referencer_item.md_content[-1] if len(referencer_item.md_content) > 0 else 'None'}\nRaw code:```\n{referencer_item.content['code_content'] if 'code_content' in referencer_item.content.keys() else 'None'}\n```"""
+                    f"""obj: {referencer_item.get_full_name()}\nDocument: \n{referencer_item.md_content[-1] if len(referencer_item.md_content) > 0 else 'None'}\nRaw code:```\n{self.get_code_content(referencer_item)}\n```"""
                     + "=" * 10
                 )
                 prompt.append(instance_prompt)
@@ -0,0 +1,66 @@
+import json
+import os
+
+from log import logger
+
+
+class CheckpointJournal:
+    """
+    检查点的预写日志, 保存在层级目录下, 每行一条 JSON 记录。
+    生成文档的过程中每个对象的 item_status / md_content 变化只追加一条记录,
+    不再每次都重写整个层级快照; 合并(MetaInfo.checkpoint)时写出完整快照并清空日志。
+
+    每条记录带有递增的 seq, 快照在 meta-info.json 中记下它已经包含的最后一个 seq,
+    因此即使在写快照和清空日志之间崩溃, 重放时也只会应用快照之后的记录。
+    记录保存的是对象的完整状态而不是增量, 重复应用也不会出错。
+    """
+
+    journal_file_name = "project_hierarchy.journal.jsonl"
+
+    def __init__(self, journal_dir, last_seq: int = 0):
+        self.journal_path = os.path.join(journal_dir, self.journal_file_name)
+        self.last_seq = last_seq  # 最后写入(或重放)的记录的 seq
+        self.pending_count = 0  # 上次合并之后写入日志的记录数
+
+    def append(self, key_path, item_status: str, md_content, md_history=()) -> int:
+        """Appends the state of one object and returns the seq of the new record. md_history: hashes of the older documents."""
+        self.last_seq += 1
+        record = {
+            "seq": self.last_seq,
+            "key_path": key_path,
+            "item_status": item_status,
+            "md_content": md_content,
+        }
+        if md_history:
+            record["md_history"] = list(md_history)
+        with open(self.journal_path, "a", encoding="utf-8") as writer:
+            writer.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.pending_count += 1
+        return self.last_seq
+
+    def read_records(self, after_seq: int):
+        """
+        Returns the records whose seq is larger than after_seq, in the order they were written.
+        Reading stops at the first incomplete line, which is what a crash in the middle of `append` leaves behind.
+        """
+        if not os.path.exists(self.journal_path):
+            return []
+        records = []
+        with open(self.journal_path, "r", encoding="utf-8") as reader:
+            for line_number, line in enumerate(reader, 1):
+                try:
+                    if not line.endswith("\n"):
+                        raise ValueError("missing line break")
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Checkpoint journal is truncated at line {line_number}, the rest is ignored")
+                    break
+                if record["seq"] > after_seq:
+                    records.append(record)
+        return records
+
+    def truncate(self):
+        """Called after a full snapshot has been written: every record is contained in the snapshot now."""
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.pending_count = 0
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from log import logger
+
+
+@dataclass
+class CheckpointSnapshot:
+    """
+    A point-in-time copy of a MetaInfo, taken by `MetaInfo.take_snapshot` and written later by the writer thread.
+
+    每个已经加载的文件保存一份 file_to_json 的结果(复制出来的 dict/list, 与树上的对象不共享可变状态);
+    分片还没有加载的文件只记下它所在的快照, 写出时直接复用原来的分片/段, 不会在内存中复制。
+    """
+
+    files: List[Tuple[str, int, Optional[List[Dict[str, Any]]], Any]]  # (文件路径, 深度, 文件中的对象 或 None, 还没有加载时的分片来源 或 None)
+    pending_file_items: List[Any]  # 拍快照时还没有加载分片的file节点, 写出后改为从新的快照加载
+    meta: Dict[str, Any]  # meta-info.json 的内容, journal_seq 在写出时填入
+    binary: bool
+    doc_blobs: Dict[str, Any] = field(default_factory=dict)  # 快照中引用的文档旧版本: hash -> 保存它的 DocStore
+
+
+class CheckpointWriter:
+    """
+    后台写检查点的线程, 生成文档的线程只需要提交快照或日志记录, 不会等待磁盘。
+
+    - 快照合并: 等待写出的快照只保留最新的一个, 写出期间提交的多个快照只会再写一次。
+    - 日志记录合并: 记录保存的是对象的完整状态, 同一个对象还没有写出的旧记录直接被新记录替换;
+      提交快照时, 所有还没有写出的记录都已经包含在快照中, 直接丢弃。
+    - 写出的顺序与提交的顺序一致: 等待中的记录总是排在等待中的快照之后。
+    - 日志合并: `request_compaction` 只做一个标记, 由这个线程调用 compact 拍快照并提交,
+      生成文档的线程不需要复制整棵树。
+
+    线程在有任务时启动, 队列为空时退出; 它不是守护线程, 解释器退出前会写完已经提交的内容。
+    """
+
+    def __init__(
+        self,
+        target_dir_path,
+        write_snapshot: Callable[[CheckpointSnapshot], None],
+        write_records: Callable[[List[tuple]], None],
+        pending_record_count: int = 0,
+        compact: Optional[Callable[["CheckpointWriter"], None]] = None,
+    ):
+        self.target_dir_path = target_dir_path
+        self._write_snapshot = write_snapshot
+        self._write_records = write_records
+        self._compact = compact  # compact(writer) 拍一个快照并提交给 writer, 在这个线程中调用
+        self._compaction_requested = False
+        self._condition = threading.Condition()
+        self._snapshot: Optional[CheckpointSnapshot] = None  # 等待写出的快照
+        self._records: OrderedDict = OrderedDict()  # tuple(key_path) -> 日志记录, 见 MetaInfo.record_item_update
+        self._thread: Optional[threading.Thread] = None
+        self._error: Optional[BaseException] = None
+        self.pending_record_count = pending_record_count  # 上一个快照之后提交的记录数, 用来决定何时合并日志
+        self.written_snapshot_count = 0
+        self.coalesced_snapshot_count = 0  # 被更新的快照替换而没有写出的快照数
+        self.coalesced_record_count = 0  # 被同一对象的新记录或快照替换而没有写出的记录数
+
+    def submit_snapshot(self, snapshot: CheckpointSnapshot):
+        with self._condition:
+            if self._snapshot is not None:
+                self.coalesced_snapshot_count += 1
+            self._snapshot = snapshot
+            self._compaction_requested = False  # 这个快照已经包含了所有的记录
+            self.coalesced_record_count += len(self._records)
+            self._records.clear()
+            self.pending_record_count = 0
+            self._start()
+
+    def submit_record(self, key_path: List[str], record: tuple) -> int:
+        """Queues the state of the object at key_path for the journal, returns the number of records since the last snapshot."""
+        key = tuple(key_path)
+        with self._condition:
+            if self._records.pop(key, None) is not None:
+                self.coalesced_record_count += 1
+            self._records[key] = record
+            self.pending_record_count += 1
+            self._start()
+            return self.pending_record_count
+
+    def request_compaction(self):
+        """Asks the writer thread to compact the journal into a snapshot, see `compact`. Returns immediately."""
+        with self._condition:
+            if self._compact is None or self._compaction_requested or self._snapshot is not None:
+                return
+            self._compaction_requested = True
+            self._start()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer")
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                snapshot, self._snapshot = self._snapshot, None
+                compaction, self._compaction_requested = self._compaction_requested, False
+                records = []
+                if snapshot is None and not compaction:
+                    records = list(self._records.values())
+                    self._records.clear()
+                if snapshot is None and not compaction and not records:
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+            try:
+                if snapshot is not None:
+                    self._write_snapshot(snapshot)
+                    self.written_snapshot_count += 1
+                elif compaction:
+                    self._compact(self)  # 提交的快照在下一轮写出
+                else:
+                    self._write_records(records)
+            except Exception as e:
+                logger.error(f"Failed to write the checkpoint to {self.target_dir_path}: {e}")
+                with self._condition:
+                    self._error = e
+
+    def flush(self):
+        """Blocks until everything submitted so far is on disk, re-raises the first error of the writer thread."""
+        with self._condition:
+            while self._thread is not None:
+                self._condition.wait()
+            error, self._error = self._error, None
+        if error is not None:
+            raise error
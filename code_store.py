@@ -0,0 +1,188 @@
+import hashlib
+import os
+import zlib
+from collections import OrderedDict
+
+from log import logger
+
+
+class SourceBuffer:
+    """
+    一个文件的源码只读取一次, 并建立行偏移表, 该文件内的所有对象共享这一份数据。
+    行号均从1开始, 与ast的lineno一致; 行的划分方式与readlines()相同(只按"\n"划分)。
+    """
+    def __init__(self, text):
+        self.text = text
+        line_offsets = [0]
+        find = text.find
+        pos = find("\n")
+        while pos != -1:
+            line_offsets.append(pos + 1)
+            pos = find("\n", pos + 1)
+        if line_offsets[-1] != len(text):
+            line_offsets.append(len(text))  # 最后一行没有换行符
+        self.line_offsets = line_offsets
+
+    @staticmethod
+    def from_file(abs_file_path):
+        with open(abs_file_path, "r", encoding="utf-8") as f:
+            return SourceBuffer(f.read())
+
+    @staticmethod
+    def from_bytes(raw: bytes):
+        """Decodes the raw content of a file, translating newlines the same way as open() in text mode."""
+        return SourceBuffer(raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n"))
+
+    @property
+    def line_count(self):
+        return len(self.line_offsets) - 1
+
+    def span(self, start_line, end_line):
+        """
+        Get the character span [begin, end) of the lines start_line..end_line (inclusive),
+        clamped the same way as slicing readlines()[start_line - 1 : end_line].
+        """
+        line_count = self.line_count
+        begin = self.line_offsets[min(max(start_line - 1, 0), line_count)]
+        end = self.line_offsets[min(max(end_line, 0), line_count)]
+        return begin, max(begin, end)
+
+    def get_lines(self, start_line, end_line):
+        begin, end = self.span(start_line, end_line)
+        return self.text[begin:end]
+
+    def contains(self, word, start_line, end_line):
+        begin, end = self.span(start_line, end_line)
+        return self.text.find(word, begin, end) != -1
+
+    def find_in_line(self, word, line):
+        """Column of word in the given line, or -1 if it does not appear."""
+        begin, end = self.span(line, line)
+        pos = self.text.find(word, begin, end)
+        return pos - begin if pos != -1 else -1
+
+
+def hash_code(code_content: str) -> str:
+    """The code_hash of an object: sha1 hex digest of its source text."""
+    return hashlib.sha1(code_content.encode("utf-8")).hexdigest()
+
+
+class CodeStore:
+    """
+    按需读取对象的源码。层级信息中每个对象只记录行号范围、自身源码的 code_hash
+    以及所在文件内容的 source_hash, 不再保存 code_content(类的源码包含了它的所有方法, 会被重复保存多次)。
+
+    读取时优先从仓库中的当前文件切片; 如果文件在生成层级信息之后被修改过, 则从层级目录下的
+    源码快照(source_blobs/)中读取生成时的版本, 因此文档与代码总是对应同一个版本。
+    快照以文件内容的 hash 为键, zlib 压缩保存, 内容相同的文件只保存一份。
+    """
+
+    blob_dir_name = "source_blobs"
+
+    def __init__(self, repo_path, hierarchy_dir, cache_size: int = 64):
+        self.repo_path = repo_path
+        self.blob_dir = os.path.join(os.fspath(hierarchy_dir), self.blob_dir_name)
+        self.cache_size = cache_size
+        self._sources = OrderedDict()  # source_hash -> SourceBuffer, 最近使用的在最后
+        self._current_hashes = {}  # 相对路径 -> (mtime_ns, size, source_hash)
+
+    def _blob_path(self, source_hash: str) -> str:
+        return os.path.join(self.blob_dir, source_hash[:2], source_hash)
+
+    def has_source(self, source_hash: str) -> bool:
+        return os.path.exists(self._blob_path(source_hash))
+
+    def put_source(self, source_hash: str, text: str):
+        """Saves the text of a file under its content hash, unless it is already saved."""
+        blob_path = self._blob_path(source_hash)
+        if os.path.exists(blob_path):
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        tmp_path = f"{blob_path}.{os.getpid()}.tmp"  # 解析进程池中的多个进程可能同时写同一个文件
+        with open(tmp_path, "wb") as writer:
+            writer.write(zlib.compress(text.encode("utf-8")))
+        os.replace(tmp_path, blob_path)
+
+    def prune(self, source_hashes):
+        """Removes the saved sources whose hash is not in source_hashes."""
+        if not os.path.isdir(self.blob_dir):
+            return
+        source_hashes = set(source_hashes)
+        removed_count = 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            for blob_name in os.listdir(prefix_dir):
+                if blob_name not in source_hashes:
+                    os.remove(os.path.join(prefix_dir, blob_name))
+                    removed_count += 1
+        if removed_count:
+            logger.info(f"Removed {removed_count} source snapshots of old file versions")
+
+    def remove(self, source_hashes):
+        """Removes the saved sources of the given hashes, e.g. of file versions replaced in watch mode."""
+        removed_count = 0
+        for source_hash in source_hashes:
+            try:
+                os.remove(self._blob_path(source_hash))
+                removed_count += 1
+            except FileNotFoundError:
+                pass
+            self._sources.pop(source_hash, None)
+        if removed_count:
+            logger.info(f"Removed {removed_count} source snapshots of replaced file versions")
+
+    def _get_source(self, file_path: str, source_hash: str):
+        """The SourceBuffer of file_path at the version source_hash, or None if that version is not available."""
+        source = self._sources.get(source_hash)
+        if source is not None:
+            self._sources.move_to_end(source_hash)
+            return source
+
+        abs_file_path = os.path.join(self.repo_path, file_path)
+        try:
+            stat = os.stat(abs_file_path)
+            cached = self._current_hashes.get(file_path)
+            if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                current_hash = cached[2]
+                raw = None
+            else:
+                with open(abs_file_path, "rb") as reader:
+                    raw = reader.read()
+                current_hash = hashlib.sha1(raw).hexdigest()
+                self._current_hashes[file_path] = (stat.st_mtime_ns, stat.st_size, current_hash)
+        except OSError:
+            current_hash, raw = None, None
+
+        if current_hash == source_hash:
+            source = SourceBuffer.from_bytes(raw) if raw is not None else SourceBuffer.from_file(abs_file_path)
+        elif self.has_source(source_hash):  # 文件已经被修改, 使用生成层级信息时的版本
+            with open(self._blob_path(source_hash), "rb") as reader:
+                source = SourceBuffer(zlib.decompress(reader.read()).decode("utf-8"))
+        else:
+            return None
+
+        self._sources[source_hash] = source
+        if len(self._sources) > self.cache_size:
+            self._sources.popitem(last=False)
+        return source
+
+    def get_code_content(self, file_path: str, content) -> str:
+        """
+        Returns the source code of an object.
+
+        Args:
+            file_path (str): The path of the file defining the object, relative to the repository.
+            content (dict): The content of the DocItem, i.e. its entry in the hierarchy.
+        """
+        if "code_content" in content:  # 旧版本的层级信息直接保存了源码
+            return content["code_content"]
+        if "source_hash" not in content:  # file节点等没有源码的对象
+            return ""
+        source = self._get_source(file_path, content["source_hash"])
+        if source is None:
+            logger.warning(f"The version of {file_path} the hierarchy was built from is not available, using the current file")
+            try:
+                source = SourceBuffer.from_file(os.path.join(self.repo_path, file_path))
+            except OSError:
+                return ""
+        return source.get_lines(content["code_start_line"], content["code_end_line"])
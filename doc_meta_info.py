@@ -1,14 +1,33 @@
 from __future__ import annotations
 import threading
+import heapq
 import json
+import multiprocessing
 import os
+import shutil
+import sys
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from dataclasses import dataclass, field
 from enum import Enum, auto, unique
-from typing import Any, Callable, Dict, List, Optional
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 from settings import setting
 from colorama import Fore, Style
 from file_handler import FileHandler
+from checkpoint_journal import CheckpointJournal
+from checkpoint_writer import CheckpointSnapshot, CheckpointWriter
+from hierarchy_shards import ShardStore
+from binary_checkpoint import BinaryCheckpoint, encode_segment
+from code_store import CodeStore, hash_code
+from doc_store import DocHistory, DocStore
+from ignore_matcher import IgnoreMatcher
+from identifier_index import IdentifierIndex
+from reference_cache import ReferenceCache
+from reference_resolver import ReferenceResolver, init_reference_worker, resolve_file_references
+from static_resolver import StaticReferenceResolver
+from reference_graph import ReferenceGraph, find_strongly_connected_components, group_edges
 from log import logger
 from tqdm import tqdm
 from prettytable import PrettyTable
@@ -64,54 +83,207 @@ class DocItemStatus(Enum):
     add_new_referencer = auto()  
     referencer_not_exist = auto()  
 
-def need_to_generate(doc_item: DocItem, ignore_list: List[str]  = []) -> bool:
-    """只生成item的，文件及更高粒度都跳过。另外如果属于一个blacklist的文件也跳过"""
+def need_to_generate(doc_item: DocItem, ignore_list: List[str] | IgnoreMatcher = []) -> bool:
+    """只生成item的，文件及更高粒度都跳过。另外如果属于一个blacklist的文件也跳过
+    ignore_list 可以是路径列表, 也可以是已经编译好的 IgnoreMatcher"""
     if doc_item.item_status == DocItemStatus.doc_up_to_date:
         return False
-    rel_file_path = doc_item.get_full_name()
     if doc_item.item_type in [DocItemType._file, DocItemType._dir, DocItemType._repo]: #暂时不生成file及以上的doc
         return False
     doc_item = doc_item.father
     while doc_item:
         if doc_item.item_type == DocItemType._file:
             # 如果当前文件在忽略列表中，或者在忽略列表某个文件路径下，则跳过
-            if any(
-                rel_file_path.startswith(ignore_item) for ignore_item in ignore_list
-            ):
-                return False
-            else:
-                return True
+            return not compile_ignore_list(ignore_list).is_ignored(doc_item.get_full_name())
         doc_item = doc_item.father
     return False
 
-@dataclass
-class DocItem:
-    item_type: DocItemType = DocItemType._class_function #The type of the documentation item, defaulting to _class_function from the DocItemType enum.
-    item_status: DocItemStatus = DocItemStatus.doc_has_not_been_generated #item_status: The status of the documentation item, defaulting to doc_has_not_been_generated from the DocItemStatus enum.
+def compile_ignore_list(ignore_list: List[str] | IgnoreMatcher) -> IgnoreMatcher:
+    if isinstance(ignore_list, IgnoreMatcher):
+        return ignore_list
+    return _compile_ignore_list(tuple(ignore_list))
 
-    obj_name: str = ""  #The name of the object, defaulting to an empty string.
-    code_start_line: int = -1 #The starting line number of the code, defaulting to -1.
-    code_end_line: int = -1 #The ending line number of the code, defaulting to -1.
-    md_content: List[str] = field(default_factory=list)  #A list of strings representing markdown content, defaulting to an empty list.
-    content: Dict[Any,Any] = field(default_factory=dict) #A dictionary representing the content of the documentation item, defaulting to an empty dictionary.
+@lru_cache(maxsize=32)
+def _compile_ignore_list(ignore_list: tuple) -> IgnoreMatcher:
+    matcher = IgnoreMatcher()
+    matcher.add_ignore_list(ignore_list)
+    return matcher
 
-    children: Dict[str, DocItem] = field(default_factory=dict)  #A dictionary mapping string keys to DocItem instances, defaulting to an empty dictionary.
-    father: Any[DocItem] = None #The parent DocItem instance, defaulting to None.
+_shard_load_lock = threading.RLock()  # 加载分片以及把file节点改为从新的快照加载时持有, 见 DocItem.load_shard
+_SHARD_LOADING = object()  # 正在加载分片的file节点的 _shard_store
 
-    depth: int = 0 #The depth of the item in the tree, defaulting to 0.
-    tree_path: List[DocItem] = field(default_factory=list)   #A list of DocItem instances representing the path from the root to the item, defaulting to an empty list.
-    max_reference_ansce: Any[DocItem] = None #The DocItem instance representing the maximum reference ancestor, defaulting to None.
+class _LazyCollection:
+    """
+    DocItem 上按需分配的 list/dict 属性: 槽位里默认是 None, 第一次读取时才创建空容器并存回槽位,
+    因此读写方式与普通属性完全相同(append、clear、下标赋值等都作用在存下来的容器上)。
+    """
 
-    reference_who: List[DocItem] = field(default_factory=list) # i am taking whose reference - A list of DocItem instances representing the references to the item, defaulting to an empty list.
-    who_reference_me: List[DocItem] = field(default_factory=list) # Who are all taking reference from me - A list of DocItem instances that reference this item, defaulting to an empty list.
-    special_reference_type: List[bool] = field(default_factory=list) #A list of boolean values representing special reference types, defaulting to an empty list.
+    def __init__(self, factory):
+        self.factory = factory
 
-    reference_who_name_list: List[str] = field(default_factory=list) #A list of strings representing the names of the references to the item, defaulting to an empty list.
-    who_reference_me_name_list: List[str] = field(default_factory=list) #A list of strings representing the names of the items that reference this item, defaulting to an empty list.
+    def __set_name__(self, owner, name):
+        self.slot = owner.__dict__["_" + name]  # 类创建时生成的槽位描述符
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        value = self.slot.__get__(instance, owner)
+        if value is None:
+            value = self.factory()
+            self.slot.__set__(instance, value)
+        return value
+
+    def __set__(self, instance, value):
+        self.slot.__set__(instance, value)
+
+
+class _ShardChildren(_LazyCollection):
+    """DocItem.children: 分片还没有加载的file节点在第一次访问时先加载分片, 见 DocItem.load_shard"""
+
+    def __get__(self, instance, owner=None):
+        if instance is not None and instance._shard_store is not None:
+            instance.load_shard()
+        return super().__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        instance._shard_store = None  # 直接替换了子节点, 分片中的内容作废
+        super().__set__(instance, value)
+
+
+class _DocHistoryAttribute(_LazyCollection):
+    """DocItem.md_content: 赋值为列表时转换成 DocHistory(列表中最后一个是最新的版本)"""
+
+    def __set__(self, instance, value):
+        if value is not None and not isinstance(value, DocHistory):
+            value = DocHistory.from_versions(value)
+        super().__set__(instance, value)
+
+
+class DocItem:
+    """
+    层级树中的一个节点: 仓库、目录、文件或者文件中的类/函数。
+
+    大型仓库中会有几十万个节点, 因此这里手写 __slots__ 而没有用 dataclass: 没有实例 __dict__,
+    大多数节点上为空的 list/dict 属性(children、引用列表等)只在第一次被访问时才分配。
+    dataclass(slots=True) 做不到后者, 因为 default_factory 在构造时就会分配, 而与字段同名的描述符又会和生成的槽位冲突。
+    对象名会被 intern, 大量同名的对象(__init__、forward 等)共享同一个字符串。
+    相等与哈希以对象本身为准, 可以放进 set/dict。
+    """
+
+    __slots__ = (
+        "item_type",
+        "item_status",
+        "obj_name",
+        "code_start_line",
+        "code_end_line",
+        "_md_content",
+        "_content",
+        "_children",
+        "father",
+        "depth",
+        "euler_in",
+        "euler_out",
+        "max_reference_ansce",
+        "_reference_graph",  # 记录引用关系的 ReferenceGraph, 没有参与任何引用时为 None
+        "_reference_node_id",  # 在 _reference_graph 中的编号
+        "_reference_who_name_list",
+        "_who_reference_me_name_list",
+        "has_task",
+        "multithread_task_id",
+        "_full_name",  # get_full_name() 的缓存, 由 parse_tree_path 清空
+        "_strict_full_name",  # get_full_name(strict=True) 的缓存
+        "_shard_store",  # 还没有加载子节点的file节点上是它所在的 ShardStore, 其他节点为 None
+    )
+
+    md_content: DocHistory = _DocHistoryAttribute(DocHistory)  #The versions of the markdown document, used like a list of strings (the latest version is md_content[-1]), see DocHistory.
+    content: Dict[Any,Any] = _LazyCollection(dict) #A dictionary representing the content of the documentation item, defaulting to an empty dictionary.
+    children: Dict[str, DocItem] = _ShardChildren(dict)  #A dictionary mapping string keys to DocItem instances, defaulting to an empty dictionary.
+
+    reference_who_name_list: List[str] = _LazyCollection(list) #A list of strings representing the names of the references to the item, defaulting to an empty list.
+    who_reference_me_name_list: List[str] = _LazyCollection(list) #A list of strings representing the names of the items that reference this item, defaulting to an empty list.
+
+    def __init__(
+        self,
+        item_type: DocItemType = DocItemType._class_function, #The type of the documentation item, defaulting to _class_function from the DocItemType enum.
+        item_status: DocItemStatus = DocItemStatus.doc_has_not_been_generated, #item_status: The status of the documentation item, defaulting to doc_has_not_been_generated from the DocItemStatus enum.
+        obj_name: str = "", #The name of the object, defaulting to an empty string.
+        code_start_line: int = -1, #The starting line number of the code, defaulting to -1.
+        code_end_line: int = -1, #The ending line number of the code, defaulting to -1.
+        md_content: Optional[DocHistory | List[str]] = None,
+        content: Optional[Dict[Any,Any]] = None,
+        children: Optional[Dict[str, DocItem]] = None,
+        father: Optional[DocItem] = None, #The parent DocItem instance, defaulting to None.
+        depth: int = 0, #The depth of the item in the tree, defaulting to 0.
+        euler_in: int = -1, #The position of the item in the pre-order traversal of the whole tree, assigned by parse_tree_path.
+        euler_out: int = -1, #The largest euler_in inside the subtree of the item, assigned by parse_tree_path.
+        max_reference_ansce: Optional[DocItem] = None, #The DocItem instance representing the maximum reference ancestor, defaulting to None.
+        reference_who_name_list: Optional[List[str]] = None,
+        who_reference_me_name_list: Optional[List[str]] = None,
+        has_task: bool = False, #A boolean value indicating whether the item has a task, defaulting to False.
+        multithread_task_id: int = -1, #The id of the item in the task_dict of the latest get_task_manager, -1 if it has no task.
+    ):
+        self.item_type = item_type
+        self.item_status = item_status
+        self.obj_name = sys.intern(obj_name)
+        self.code_start_line = code_start_line
+        self.code_end_line = code_end_line
+        self._md_content = md_content if md_content is None or isinstance(md_content, DocHistory) else DocHistory.from_versions(md_content)
+        self._content = content
+        self._children = children
+        self.father = father
+        self.depth = depth
+        self.euler_in = euler_in
+        self.euler_out = euler_out
+        self.max_reference_ansce = max_reference_ansce
+        self._reference_who_name_list = reference_who_name_list
+        self._who_reference_me_name_list = who_reference_me_name_list
+        self.has_task = has_task
+        self.multithread_task_id = multithread_task_id
+        self._full_name = None
+        self._strict_full_name = None
+        self._reference_graph = None
+        self._reference_node_id = -1
+        self._shard_store = None
+
+    @property
+    def reference_who(self) -> Tuple[DocItem, ...]:
+        """i am taking whose reference - 当前对象引用的对象, 按发现的顺序; 只读, 修改请通过 MetaInfo.reference_graph"""
+        return self._reference_graph.get_callees(self) if self._reference_graph is not None else ()
+
+    @property
+    def who_reference_me(self) -> Tuple[DocItem, ...]:
+        """Who are all taking reference from me - 引用当前对象的对象, 按发现的顺序"""
+        return self._reference_graph.get_callers(self) if self._reference_graph is not None else ()
+
+    @property
+    def special_reference_type(self) -> Tuple[bool, ...]:
+        """与 reference_who 一一对应, 是否是特殊引用(函数定义行上的引用, 例如参数的类型标注)"""
+        return self._reference_graph.get_special_flags(self) if self._reference_graph is not None else ()
+
+    def __repr__(self):
+        return f"DocItem({self.item_type.name}, {self.obj_name!r})"
+
+    @property
+    def tree_path(self) -> List[DocItem]:
+        """从根节点到当前节点(包含两端)的路径, 每次访问时沿father向上计算"""
+        path = []
+        now = self
+        while now is not None:
+            path.append(now)
+            now = now.father
+        return path[::-1]
+
+    def is_ancestor_of(self, other: DocItem) -> bool:
+        """Whether self is other or one of its ancestors. O(1) with the Euler-tour indices of parse_tree_path."""
+        if self.euler_in < 0 or other.euler_in < 0:  # 还没有建立索引, 沿father向上查找
+            now = other
+            while now is not None:
+                if now is self:
+                    return True
+                now = now.father
+            return False
+        return self.euler_in <= other.euler_in <= self.euler_out
 
-    has_task: bool = False #A boolean value indicating whether the item has a task, defaulting to False.
-    
-    
     @staticmethod
     def has_ans_relation(now_a: DocItem, now_b: DocItem):
         """Check if there is an ancestor relationship between two nodes and return the earlier node if exists.
@@ -123,51 +295,126 @@ class DocItem:
         Returns:
             DocItem or None: The earlier node if an ancestor relationship exists, otherwise None.
         """
-        if now_b in now_a.tree_path:
+        if now_b.is_ancestor_of(now_a):
             return now_b
-        if now_a in now_b.tree_path:
+        if now_a.is_ancestor_of(now_b):
             return now_a
         return None
 
 
+    def iter_preorder(self):
+        """按照先序遍历的顺序迭代子树中的所有节点, 根节点在第一个。
+        迭代实现, 不复制列表, 也不受递归深度限制。经过的file节点如果还没有加载分片会先加载"""
+        stack = [self]
+        while stack:
+            now = stack.pop()
+            yield now
+            if now._shard_store is not None:
+                now.load_shard()
+            if now._children:
+                stack.extend(reversed(now._children.values()))
+
+    def iter_postorder(self, load_shards=True):
+        """按照后序遍历的顺序迭代子树中的所有节点, 每个节点都在它的所有子节点之后, 根节点在最后一个。
+        load_shards 为 False 时不加载分片, 还没有加载的file节点当作叶子"""
+        stack = [(self, False)]
+        while stack:
+            now, children_visited = stack.pop()
+            if children_visited:
+                yield now
+                continue
+            stack.append((now, True))
+            if load_shards and now._shard_store is not None:
+                now.load_shard()
+            if now._children:
+                stack.extend((child, False) for child in reversed(now._children.values()))
+
+    def iter_items(self, *item_types: DocItemType):
+        """先序迭代子树中类型属于 item_types 的节点, 不指定类型时迭代所有节点"""
+        if not item_types:
+            yield from self.iter_preorder()
+            return
+        for now in self.iter_preorder():
+            if now.item_type in item_types:
+                yield now
+
+    def iter_files(self):
+        """先序迭代子树中所有的file节点, 不会进入file节点内部"""
+        stack = [self]
+        while stack:
+            now = stack.pop()
+            if now.item_type == DocItemType._file:
+                yield now
+                continue
+            if now._children:
+                stack.extend(reversed(now._children.values()))
+
     def get_travel_list(self):
         '''按照先序遍历的顺序，根节点在第一个'''
-        now_list = [self]
-        for _, child in self.children.items():
-            now_list = now_list + child.get_travel_list()
-        return now_list
+        return list(self.iter_preorder())
     
     def check_depth(self):
         """
-        Recursively calculates the depth of the node in the tree.
+        Calculates the depth (height of the subtree) of every node under this one, in post order.
 
         Returns:
             int: The depth of the node.
         """
-        if len(self.children) == 0:
-            self.depth = 0
-            return self.depth
-        max_child_depth = 0
-        for _, child in self.children.items():
-            child_depth = child.check_depth()
-            max_child_depth = max(child_depth, max_child_depth)
-        self.depth = max_child_depth + 1
+        for now in self.iter_postorder(load_shards=False):
+            if now._shard_store is not None:
+                continue  # 没有加载的file节点保留 manifest 中记录的深度
+            now.depth = max((child.depth + 1 for child in now._children.values()), default=0) if now._children else 0
         return self.depth
 
-    def parse_tree_path(self, now_path):
+    def load_shard(self):
+        """
+        Loads the objects of a lazily loaded file node from its shard, see `MetaInfo.from_shard_store`.
+        The new nodes are not Euler-indexed until the next `parse_tree_path`, `is_ancestor_of` still works on them.
+        """
+        with _shard_load_lock:
+            shard_store = self._shard_store
+            if shard_store is None or shard_store is _SHARD_LOADING:  # 已经被别的线程加载, 或者是本线程正在加载
+                return
+            # 加载期间其他线程看到的仍然是没有加载的节点, 会在锁上等待, 不会遍历到一半的子节点
+            self._shard_store = _SHARD_LOADING
+            try:
+                _attach_file_objects(self, shard_store.read_shard(self.get_full_name()), shard_store.doc_store)
+            except BaseException:
+                self._shard_store = shard_store
+                raise
+            self._shard_store = None
+        self.check_depth()
+        now = self
+        while now.father is not None and now.father.depth < now.depth + 1:
+            now.father.depth = now.depth + 1
+            now = now.father
+
+    def parse_tree_path(self, now_path=None):
         """
-        Recursively parses the tree path by appending the current node to the given path.
+        Re-indexes the tree after it was restructured: assigns the Euler-tour indices (euler_in, euler_out)
+        used by `is_ancestor_of` and clears the cached full names. Must be called on the root.
 
         Args:
-            now_path (list): The current path in the tree.
+            now_path (list): Unused, kept for compatibility with the old tree_path based implementation.
 
         Returns:
             None
         """
-        self.tree_path = now_path + [self]
-        for key, child in self.children.items():
-            child.parse_tree_path(self.tree_path)
-        
+        euler_index = 0
+        stack = [(self, False)]
+        while stack:
+            now, children_visited = stack.pop()
+            if children_visited:
+                now.euler_out = euler_index - 1
+                continue
+            now.euler_in = euler_index
+            euler_index += 1
+            now._full_name = None
+            now._strict_full_name = None
+            stack.append((now, True))
+            if now._children:
+                stack.extend((child, False) for child in reversed(now._children.values()))
+
     def find(self, recursive_file_path: list) -> Optional[DocItem]:
         """
         从repo根节点根据path_list找到对应的文件, 否则返回False
@@ -188,64 +435,158 @@ class DocItem:
             pos += 1
         return now
     
+    def get_key_path(self) -> List[str]:
+        """从根节点到当前节点经过的children的key(重名对象会被重命名为xxx_i, 因此与obj_name不一定相同)"""
+        key_path = []
+        now = self
+        while now.father != None:
+            for key, child in now.father.children.items():
+                if child is now:
+                    key_path.append(key)
+                    break
+            now = now.father
+        return key_path[::-1]
+
     def get_file_name(self):
         full_name = self.get_full_name()
         return full_name.split(".py")[0] + ".py"
 
     def get_full_name(self, strict = False):
-            """获取从下到上所有的obj名字
+            """获取从下到上所有的obj名字, 结果会被缓存直到下一次 parse_tree_path
+
+            Args:
+                strict (bool): 如果当前对象因为重名被重命名过, 在名字后面加上 "(name_duplicate_version)"
 
             Returns:
                 str: 从下到上所有的obj名字，以斜杠分隔
             """
             if self.father == None:
                 return self.obj_name
-            name_list = []
-            now = self
-            while now != None:
-                self_name = now.obj_name
-                if strict:
+            if strict:
+                if self._strict_full_name is None:
+                    self_name = self.obj_name
                     for name, item in self.father.children.items():
-                        if item == now:
+                        if item is self:
                             self_name = name
                             break
-                    if self_name != now.obj_name:
+                    if self_name != self.obj_name:
                         self_name = self_name + "(name_duplicate_version)"
-                name_list = [self_name] + name_list
-                now = now.father
-
-            name_list = name_list[1:]
-            return "/".join(name_list)
+                    father_name = self.father.get_full_name()
+                    self._strict_full_name = self_name if self.father.father == None else father_name + "/" + self_name
+                return self._strict_full_name
+
+            if self._full_name is None:
+                # 向上找到第一个已经缓存了名字的祖先, 再从上往下依次填充缓存
+                uncached = []
+                now = self
+                while now.father != None and now._full_name is None:
+                    uncached.append(now)
+                    now = now.father
+                for item in reversed(uncached):
+                    if item.father.father == None:
+                        item._full_name = item.obj_name
+                    else:
+                        item._full_name = item.father._full_name + "/" + item.obj_name
+            return self._full_name
+
+
+def _find_code_fathers(items: List[DocItem]) -> List[Optional[DocItem]]:
+    """为每个对象找到代码范围包含它的最小对象, 没有则为None; 代码范围完全相同的对象之间不算包含。
+
+    对象的行范围来自AST, 两两之间要么嵌套要么不相交, 因此按 (起始行, -结束行, 原顺序) 排序后
+    用一个栈扫描即可, 栈中始终是包含当前对象的所有对象, 复杂度 O(n log n)。
+    范围完全相同的一组对象只有原顺序最靠前的一个入栈, 与逐对比较时"相同大小取先出现者"的结果一致。
+    """
+    order = sorted(
+        range(len(items)),
+        key=lambda i: (items[i].code_start_line, -items[i].code_end_line, i),
+    )
+    fathers: List[Optional[DocItem]] = [None] * len(items)
+    stack = []  # (item在items中的下标, item)
+    for i in order:
+        item = items[i]
+        while stack and stack[-1][1].code_end_line < item.code_end_line:
+            stack.pop()
+        if stack and (stack[-1][1].code_start_line, stack[-1][1].code_end_line) == (item.code_start_line, item.code_end_line):
+            fathers[i] = fathers[stack[-1][0]]
+            continue
+        fathers[i] = stack[-1][1] if stack else None
+        stack.append((i, item))
+    return fathers
 
 
 def find_all_referencer(
     repo_path, variable_name, file_path, line_number, column_number, in_file_only=False
 ):
-    """复制过来的之前的实现"""
-    script = jedi.Script(path=os.path.join(repo_path, file_path))
-    try:
-        if in_file_only:
-            references = script.get_references(
-                line=line_number, column=column_number, scope="file"
-            )
-        else:
-            references = script.get_references(line=line_number, column=column_number)
-        # 过滤出变量名为 variable_name 的引用，并返回它们的位置
-        variable_references = [ref for ref in references if ref.name == variable_name]
-        # if variable_name == "need_to_generate": 
-        #     import pdb; pdb.set_trace()
-        return [
-            (os.path.relpath(ref.module_path, repo_path), ref.line, ref.column)
-            for ref in variable_references
-            if not (ref.line == line_number and ref.column == column_number)
-        ]
-    except Exception as e:
-        # 打印错误信息和相关参数
-        logger.info(f"Error occurred: {e}")
-        logger.info(
-            f"Parameters: variable_name={variable_name}, file_path={file_path}, line_number={line_number}, column_number={column_number}"
-        )
-        return []
+    """复制过来的之前的实现; 只查找一个对象, 需要查找多个对象时请使用 ReferenceResolver 复用 jedi.Script"""
+    return ReferenceResolver(repo_path).find_references(
+        variable_name, file_path, line_number, column_number, in_file_only
+    )
+
+def _code_hash(content: Dict[str, Any]) -> Optional[str]:
+    """The code_hash of an object, also for hierarchies written before code_content was replaced by hashes."""
+    if "code_hash" in content:
+        return content["code_hash"]
+    if "code_content" in content:
+        return hash_code(content["code_content"])
+    return None
+
+
+def _attach_file_objects(file_item: DocItem, file_content: List[Dict[str, Any]], doc_store: Optional[DocStore] = None):
+    """
+    Creates the objects of one file (a value of project_hierarchy.json) under its file node.
+    The older document versions listed in md_history are read from doc_store when they are needed.
+    """
+    # 然后parse file内容
+    assert type(file_content) == list
+
+    obj_item_list: List[DocItem] = []
+    for value in file_content:
+        # 文档只保存在 DocItem.md_content 中, content 中不再保留一份
+        md_content = DocHistory.from_versions(value["md_content"], value.get("md_history", ()), doc_store)
+        value = {key: field_value for key, field_value in value.items() if key != "md_content" and key != "md_history"}
+        obj_doc_item = DocItem(
+                                obj_name=value["name"],
+                                content = value,
+                                md_content=md_content,
+                                code_start_line=value["code_start_line"],
+                                code_end_line=value["code_end_line"],
+                            )
+        if "item_status" in value.keys():
+            obj_doc_item.item_status = DocItemStatus[value["item_status"]]
+        if "reference_who" in value.keys():
+            obj_doc_item.reference_who_name_list = value["reference_who"]
+        if "who_reference_me" in value.keys():
+            obj_doc_item.who_reference_me_name_list = value["who_reference_me"]
+        obj_item_list.append(obj_doc_item)
+
+    #接下里寻找可能的父亲
+    for item, potential_father in zip(obj_item_list, _find_code_fathers(obj_item_list)):
+        if potential_father == None:
+            potential_father = file_item
+        item.father = potential_father
+        child_name = item.obj_name
+        if child_name in potential_father.children.keys(): 
+            # 如果存在同层次的重名问题，就重命名成 xxx_i的形式
+            now_name_id = 0
+            while (child_name + f"_{now_name_id}") in potential_father.children.keys():
+                now_name_id += 1
+            child_name = child_name + f"_{now_name_id}"
+            logger.warning(f"Name duplicate in {file_item.get_full_name()}: rename to {item.obj_name}->{child_name}")
+        potential_father.children[child_name] = item
+        # print(f"{potential_father.get_full_name()} -> {item.get_full_name()}")
+    
+    for now_item in file_item.iter_preorder():  # 父节点总是先于子节点确定类型
+        if now_item.item_type != DocItemType._file:
+            if now_item.content["type"] == "ClassDef":
+                now_item.item_type = DocItemType._class
+            elif now_item.content["type"] == "FunctionDef":
+                now_item.item_type = DocItemType._function
+                if now_item.father.item_type == DocItemType._class:
+                    now_item.item_type = DocItemType._class_function
+                elif now_item.father.item_type in [ DocItemType._function, DocItemType._sub_function]:
+                    now_item.item_type = DocItemType._sub_function
+
 
 @dataclass
 class MetaInfo:
@@ -257,7 +598,15 @@ class MetaInfo:
     jump_files: List[str] = field(default_factory=list)
     deleted_items_from_older_meta: List[List] = field(default_factory=list)
     in_generation_process: bool = False
-    #checkpoint_lock: threading.Lock = threading.Lock()
+    reference_graph: ReferenceGraph = field(default_factory=ReferenceGraph, repr=False) # 所有对象之间的引用关系
+    line_index: Dict[str, tuple] = field(default_factory=dict, repr=False) # 文件路径 -> (file节点, 行号到最内层对象的数组), 见 get_line_index
+    journal_seq: int = 0 # 已经写入检查点日志的最后一条记录的 seq
+    journal: Optional[CheckpointJournal] = field(default=None, repr=False) # 当前层级目录的检查点日志, 见 record_item_update
+    checkpoint_lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False) # 拍快照与提交日志记录时持有, 修改对象的文档时也应持有
+    checkpoint_writer: Optional[CheckpointWriter] = field(default=None, repr=False, compare=False) # 在后台写检查点的线程, 见 checkpoint
+    doc_store: DocStore = field(default_factory=DocStore, repr=False, compare=False) # 文档旧版本的存储, 见 DocHistory
+    jedi_project: Optional[jedi.Project] = field(default=None, repr=False, compare=False) # 查找引用时使用的 jedi.Project, 为 None 时以 repo_path 新建一个
+    reference_resolver: Optional[Union[ReferenceResolver, StaticReferenceResolver]] = field(default=None, repr=False, compare=False) # 最近一次查找引用使用的 resolver, 见 new_reference_resolver
 
     @staticmethod
     def init_meta_info(file_path_reflections, jump_files) -> MetaInfo:
@@ -265,126 +614,274 @@ class MetaInfo:
         project_abs_path = setting.project.target_repo
         print(f"{Fore.LIGHTRED_EX}Initializing MetaInfo: {Style.RESET_ALL}from {project_abs_path}")
         file_handler = FileHandler(project_abs_path, None)
-        repo_structure = file_handler.generate_overall_structure(file_path_reflections, jump_files)
-        metainfo = MetaInfo.from_project_hierarchy_json(repo_structure)
+        # 每个文件解析完成后立即挂到DocItem树上, 不需要先在内存中拼出整个仓库的结构
+        file_structures = file_handler.iter_file_structures(file_path_reflections, jump_files)
+        metainfo = MetaInfo.from_project_hierarchy_json(file_structures)
         metainfo.repo_path = project_abs_path
         metainfo.fake_file_reflection = file_path_reflections
         metainfo.jump_files = jump_files
         return metainfo
     
     @staticmethod
-    def from_project_hierarchy_json(project_hierarchy_json) -> MetaInfo:
+    def from_project_hierarchy_json(project_hierarchy_json, doc_store: Optional[DocStore] = None) -> MetaInfo:
+        """
+        Builds the MetaInfo tree from a project hierarchy.
+
+        Args:
+            project_hierarchy_json: Either the dict loaded from project_hierarchy.json, or any iterable of
+                (file_name, file_content) pairs, e.g. `FileHandler.iter_file_structures`, in which case each
+                file is attached to the tree as soon as it is produced.
+            doc_store (DocStore, optional): Where the older document versions listed in md_history are saved.
+        """
         target_meta_info = MetaInfo(
             # repo_path=repo_path,
             target_repo_hierarchical_tree=DocItem(  # 根节点
                 item_type=DocItemType._repo,
                 obj_name="full_repo",
-            )
+            ),
+            doc_store=doc_store if doc_store is not None else DocStore(),
         )
 
-        for file_name, file_content in tqdm(project_hierarchy_json.items(),desc="parsing parent relationship"): 
-            # 首先parse file archi
-            if not os.path.exists(os.path.join(setting.project.target_repo, file_name)):
-                logger.info(f"deleted content: {file_name}")
-                continue
-            elif os.path.getsize(os.path.join(setting.project.target_repo, file_name)) == 0:
-                logger.info(f"blank content: {file_name}")
-                continue
+        if isinstance(project_hierarchy_json, dict):
+            file_structures = tqdm(project_hierarchy_json.items(), desc="parsing parent relationship")
+        else:
+            file_structures = project_hierarchy_json
+        for file_name, file_content in file_structures:
+            target_meta_info.add_file_structure(file_name, file_content)
 
-            recursive_file_path = file_name.split("/")
-            pos = 0
-            now_structure = target_meta_info.target_repo_hierarchical_tree
-            while pos < len(recursive_file_path) - 1:
-                if recursive_file_path[pos] not in now_structure.children.keys():
-                    now_structure.children[recursive_file_path[pos]] = DocItem(
-                        item_type=DocItemType._dir,
-                        md_content="",
-                        obj_name=recursive_file_path[pos],
-                    )
-                    now_structure.children[
-                        recursive_file_path[pos]
-                    ].father = now_structure
-                now_structure = now_structure.children[recursive_file_path[pos]]
-                pos += 1
-            if recursive_file_path[-1] not in now_structure.children.keys():
+        target_meta_info.target_repo_hierarchical_tree.parse_tree_path(now_path=[])
+        target_meta_info.target_repo_hierarchical_tree.check_depth()
+        return target_meta_info
+
+    def add_file_structure(self, file_name, file_content):
+        """
+        Attaches the objects of one file (a value of project_hierarchy.json) to the tree.
+        `parse_tree_path` and `check_depth` of the root must be called once all files are attached.
+        """
+        file_item = self.add_file_node(file_name)
+        if file_item is not None:
+            _attach_file_objects(file_item, file_content, self.doc_store)
+
+    def add_file_node(self, file_name) -> Optional[DocItem]:
+        """
+        Creates the file node of file_name and its missing directory nodes, without the objects of the file.
+
+        Returns:
+            Optional[DocItem]: The file node, or None if the file was deleted or is empty.
+        """
+        # 首先parse file archi
+        if not os.path.exists(os.path.join(setting.project.target_repo, file_name)):
+            logger.info(f"deleted content: {file_name}")
+            return None
+        elif os.path.getsize(os.path.join(setting.project.target_repo, file_name)) == 0:
+            logger.info(f"blank content: {file_name}")
+            return None
+
+        recursive_file_path = file_name.split("/")
+        pos = 0
+        now_structure = self.target_repo_hierarchical_tree
+        while pos < len(recursive_file_path) - 1:
+            if recursive_file_path[pos] not in now_structure.children.keys():
                 now_structure.children[recursive_file_path[pos]] = DocItem(
-                    item_type=DocItemType._file,
-                    obj_name=recursive_file_path[-1],
+                    item_type=DocItemType._dir,
+                    md_content="",
+                    obj_name=recursive_file_path[pos],
                 )
-                now_structure.children[recursive_file_path[pos]].father = now_structure
-
-            # 然后parse file内容
-            assert type(file_content) == list
-            file_item = target_meta_info.target_repo_hierarchical_tree.find(recursive_file_path)
-            assert file_item.item_type == DocItemType._file
-
-            obj_item_list: List[DocItem] = []
-            for value in file_content:
-                obj_doc_item = DocItem(
-                                        obj_name=value["name"],
-                                        content = value,
-                                        md_content=value["md_content"],
-                                        code_start_line=value["code_start_line"],
-                                        code_end_line=value["code_end_line"],
-                                    )
-                if "item_status" in value.keys():
-                    obj_doc_item.item_status = DocItemStatus[value["item_status"]]
-                if "reference_who" in value.keys():
-                    obj_doc_item.reference_who_name_list = value["reference_who"]
-                if "special_reference_type" in value.keys():
-                    obj_doc_item.special_reference_type = value["special_reference_type"]
-                if "who_reference_me" in value.keys():
-                    obj_doc_item.who_reference_me_name_list = value["who_reference_me"]
-                obj_item_list.append(obj_doc_item)
-
-            #接下里寻找可能的父亲
-            for item in obj_item_list:
-                potential_father = None
-                for other_item in obj_item_list:
-                    def code_contain(item, other_item) -> bool:
-                        if other_item.code_end_line == item.code_end_line and other_item.code_start_line == item.code_start_line:
-                            return False
-                        if other_item.code_end_line < item.code_end_line or other_item.code_start_line > item.code_start_line:
-                            return False
-                        return True
-                    if code_contain(item, other_item):
-                        if potential_father == None or ((other_item.code_end_line - other_item.code_start_line) < (potential_father.code_end_line - potential_father.code_start_line)):
-                            potential_father = other_item
-                
-                if potential_father == None:
-                    potential_father = file_item
-                item.father = potential_father
-                child_name = item.obj_name
-                if child_name in potential_father.children.keys(): 
-                    # 如果存在同层次的重名问题，就重命名成 xxx_i的形式
-                    now_name_id = 0
-                    while (child_name + f"_{now_name_id}") in potential_father.children.keys():
-                        now_name_id += 1
-                    child_name = child_name + f"_{now_name_id}"
-                    logger.warning(f"Name duplicate in {file_item.get_full_name()}: rename to {item.obj_name}->{child_name}")
-                potential_father.children[child_name] = item
-                # print(f"{potential_father.get_full_name()} -> {item.get_full_name()}")
-            
-            def change_items(now_item: DocItem):
-                if now_item.item_type != DocItemType._file:
-                    if now_item.content["type"] == "ClassDef":
-                        now_item.item_type = DocItemType._class
-                    elif now_item.content["type"] == "FunctionDef":
-                        now_item.item_type = DocItemType._function
-                        if now_item.father.item_type == DocItemType._class:
-                            now_item.item_type = DocItemType._class_function
-                        elif now_item.father.item_type in [ DocItemType._function, DocItemType._sub_function]:
-                            now_item.item_type = DocItemType._sub_function
-                for _, child in now_item.children.items():
-                    change_items(child)
-            change_items(file_item)
-           
-            
+                now_structure.children[
+                    recursive_file_path[pos]
+                ].father = now_structure
+            now_structure = now_structure.children[recursive_file_path[pos]]
+            pos += 1
+        if recursive_file_path[-1] not in now_structure.children.keys():
+            now_structure.children[recursive_file_path[pos]] = DocItem(
+                item_type=DocItemType._file,
+                obj_name=recursive_file_path[-1],
+            )
+            now_structure.children[recursive_file_path[pos]].father = now_structure
+        file_item = now_structure.children[recursive_file_path[-1]]
+        assert file_item.item_type == DocItemType._file
+        return file_item
+
+    @staticmethod
+    def from_shard_store(shard_store: ShardStore | BinaryCheckpoint) -> MetaInfo:
+        """
+        Builds the tree down to the file nodes from the manifest of a sharded (or binary) checkpoint.
+        The objects of every file are loaded from its shard the first time the file node is entered.
+        """
+        target_meta_info = MetaInfo(
+            target_repo_hierarchical_tree=DocItem(  # 根节点
+                item_type=DocItemType._repo,
+                obj_name="full_repo",
+            ),
+            doc_store=shard_store.doc_store,
+        )
+        for file_name, file_info in shard_store.read_manifest().items():
+            file_item = target_meta_info.add_file_node(file_name)
+            if file_item is None or file_item._children:
+                continue
+            file_item.depth = file_info["depth"]
+            file_item._shard_store = shard_store
+
         target_meta_info.target_repo_hierarchical_tree.parse_tree_path(now_path=[])
         target_meta_info.target_repo_hierarchical_tree.check_depth()
         return target_meta_info
 
+    def update_files(self, file_structures: Dict[str, Optional[List]]):
+        """
+        Patches the tree in place with re-parsed files, used by the watch mode of Runner.
+
+        Objects that still exist keep their documents: their status is unchanged if their code is
+        unchanged and becomes code_changed otherwise. New objects wait to be generated. New files and
+        directories are inserted where a fresh walk of the repo would put them. References of the touched
+        files are resolved again, as well as those of the objects elsewhere that the old objects referenced
+        or whose name occurs in a touched file; objects whose referencers changed are marked
+        add_new_referencer or referencer_not_exist.
+
+        Args:
+            file_structures (Dict[str, Optional[List]]): Relative file path -> the file_objects returned by
+                `FileHandler.generate_file_structure`, or None if the file was deleted.
+        """
+        root_item = self.target_repo_hierarchical_tree
+        old_referencers = {}  # 被修改文件中的旧对象引用过的对象 -> 更新前引用它的对象名
+        touched_file_items = []
+        replaced_source_hashes = set()  # 被修改文件旧版本的源码快照
+        for file_name, file_content in file_structures.items():
+            self.line_index.pop(file_name, None)
+            recursive_file_path = file_name.split("/")
+            old_file_item = root_item.find(recursive_file_path)
+            old_items = {}
+            file_position = None
+            if old_file_item is not None:
+                old_travel_list = old_file_item.get_travel_list()  # 文件节点本身也可能引用其他对象
+                for item in old_travel_list:
+                    if item is not old_file_item:
+                        old_items[tuple(item.get_key_path())] = item
+                        if "source_hash" in item.content:
+                            replaced_source_hashes.add(item.content["source_hash"])
+                    for referenced_item in item.reference_who:
+                        if referenced_item not in old_referencers:
+                            old_referencers[referenced_item] = {
+                                referencer.get_full_name() for referencer in referenced_item.who_reference_me
+                            }
+                for item in old_travel_list:
+                    self.reference_graph.remove_node(item)
+                father = old_file_item.father
+                file_position = list(father.children.keys()).index(recursive_file_path[-1])
+                del father.children[recursive_file_path[-1]]
+
+            new_path_depth = len(recursive_file_path)  # 路径上从这一层开始的节点是新建的
+            while new_path_depth > 0 and root_item.find(recursive_file_path[: new_path_depth - 1]) is None:
+                new_path_depth -= 1
+            if file_content is not None:
+                self.add_file_structure(file_name, file_content)
+            new_file_item = root_item.find(recursive_file_path)
+            if new_file_item is None:
+                self._remove_empty_dirs(recursive_file_path[:-1])
+                continue
+            if file_position is not None:  # 保持文件在目录中原来的位置
+                father = new_file_item.father
+                keys = list(father.children.keys())
+                keys.insert(file_position, keys.pop())
+                father.children = {key: father.children[key] for key in keys}
+            else:  # 新的文件和目录放到重新遍历仓库时的位置上
+                for depth in range(new_path_depth, len(recursive_file_path) + 1):
+                    self._move_to_walk_position(root_item.find(recursive_file_path[:depth]))
+            touched_file_items.append(new_file_item)
+
+            for item in new_file_item.get_travel_list()[1:]:
+                old_item = old_items.get(tuple(item.get_key_path()))
+                if old_item is None:
+                    continue
+                item.md_content = old_item.md_content
+                item.item_status = old_item.item_status
+                if _code_hash(old_item.content) != _code_hash(item.content) and old_item.md_content:
+                    item.item_status = DocItemStatus.code_changed
+
+        root_item.parse_tree_path(now_path=[])
+        root_item.check_depth()
+        self._remove_replaced_sources(replaced_source_hashes)
+
+        # 被修改文件中的对象可能被任何地方引用; 它们引用过的对象, 以及名字在被修改文件中出现的其他对象
+        # (可能被新代码引用) 也需要重新查找引用者
+        resolver = self.new_reference_resolver()
+        touched_paths = [file_item.get_full_name() for file_item in touched_file_items]
+        index = resolver.index if resolver.index is not None else IdentifierIndex(self.repo_path, touched_paths)
+        touched_names = set()
+        for rel_file_path in touched_paths:
+            touched_names |= index.names_in_file(rel_file_path)
+        for file_item in self._iter_files_defining(touched_names, index, exclude=set(touched_file_items)):
+            for item in file_item.get_travel_list()[1:]:
+                if item.obj_name in touched_names and item not in old_referencers:
+                    old_referencers[item] = {referencer.get_full_name() for referencer in item.who_reference_me}
+        for file_item, rel_file_path in zip(touched_file_items, touched_paths):
+            for item in file_item.get_travel_list()[1:]:
+                self.parse_reference_of_obj(item, rel_file_path)
+        for referenced_item, referencer_names in old_referencers.items():
+            if root_item.find(referenced_item.get_key_path()) is not referenced_item:
+                continue  # 对象已经随文件一起被替换或删除
+            self.parse_reference_of_obj(referenced_item, referenced_item.get_file_name())
+            if referenced_item.item_status != DocItemStatus.doc_up_to_date:
+                continue
+            new_referencer_names = {
+                referencer.get_full_name() for referencer in referenced_item.who_reference_me
+            }
+            if not new_referencer_names <= referencer_names:
+                referenced_item.item_status = DocItemStatus.add_new_referencer
+            elif not referencer_names <= new_referencer_names:
+                referenced_item.item_status = DocItemStatus.referencer_not_exist
+        resolver.log_slowest_files()
+        resolver.invalidate()
+        self.reference_graph.freeze()
+
+    def _remove_replaced_sources(self, source_hashes):
+        """
+        Removes the source snapshots of replaced file versions that no file of the tree uses any more, so that
+        a long watch session does not keep one snapshot per save. A full parse prunes all the others.
+        Files whose shard is not loaded are unchanged on disk and read from the repo, they need no snapshot.
+        """
+        for file_item in self.iter_files():
+            if file_item._shard_store is None and file_item._children:
+                first_item = next(iter(file_item._children.values()))
+                source_hashes.discard(first_item.content.get("source_hash"))
+        if source_hashes:
+            CodeStore(self.repo_path, setting.project.target_repo / setting.project.hierarchy_name).remove(source_hashes)
+
+    def _iter_files_defining(self, names, index: IdentifierIndex, exclude):
+        """
+        The file nodes not in exclude that may define an object named like one of names: with a repo-wide index
+        only the files where one of the names occurs, otherwise every file.
+        """
+        if index.file_paths >= {file_item.get_full_name() for file_item in self.iter_files()}:
+            candidate_paths = set()
+            for name in names:
+                candidate_paths.update(index.files_containing(name))
+            file_items = (self.target_repo_hierarchical_tree.find(path.split("/")) for path in sorted(candidate_paths))
+        else:
+            file_items = self.iter_files()
+        for file_item in file_items:
+            if file_item is not None and file_item.item_type == DocItemType._file and file_item not in exclude:
+                yield file_item
 
+    def _move_to_walk_position(self, item: DocItem):
+        """
+        Moves a new file or directory node among its siblings to where a fresh walk would put it:
+        files before directories, each in name order (see `IgnoreMatcher.iter_entries`).
+        """
+        father = item.father
+        walk_key = lambda name: (father.children[name].item_type == DocItemType._dir, name)
+        keys = [key for key in father.children.keys() if key != item.obj_name]
+        position = next((pos for pos, key in enumerate(keys) if walk_key(key) > walk_key(item.obj_name)), len(keys))
+        keys.insert(position, item.obj_name)
+        father.children = {key: father.children[key] for key in keys}
+
+    def _remove_empty_dirs(self, recursive_dir_path: List[str]):
+        """Removes the directory nodes on the path that no longer contain anything."""
+        while recursive_dir_path:
+            dir_item = self.target_repo_hierarchical_tree.find(recursive_dir_path)
+            if dir_item is None or len(dir_item.children) > 0:
+                return
+            del dir_item.father.children[recursive_dir_path[-1]]
+            recursive_dir_path = recursive_dir_path[:-1]
     
     # doc_meta_info.py (no changes needed)
     def print_task_list(self, task_dict: Dict[int, Dict[str, Any]]):
@@ -408,87 +905,148 @@ class MetaInfo:
         
     def get_all_files(self) -> List[DocItem]:
         """获取所有的file节点"""
-        files = []
+        return list(self.iter_files())
 
-        def walk_tree(now_node):
-            if now_node.item_type == DocItemType._file:
-                files.append(now_node)
-            for _, child in now_node.children.items():
-                walk_tree(child)
+    def iter_files(self):
+        """先序迭代所有的file节点"""
+        return self.target_repo_hierarchical_tree.iter_files()
 
-        walk_tree(self.target_repo_hierarchical_tree)
-        return files
+    def iter_items(self, *item_types: DocItemType):
+        """先序迭代树中类型属于 item_types 的节点, 不指定类型时迭代所有节点"""
+        return self.target_repo_hierarchical_tree.iter_items(*item_types)
     
 
     def get_task_manager(self, now_node: DocItem, task_available_func) -> List[DocItem]:
-        """先写一个退化的版本，只考虑拓扑引用关系"""
-        doc_items = now_node.get_travel_list()
-        if self.white_list is not None:
+        """
+        计算生成文档的顺序: 一个任务依赖于它的所有子节点和它引用的对象, 被依赖的对象先生成。
 
-            def in_white_list(item: DocItem):
-                for cont in self.white_list:
-                    if (
-                        item.get_file_name() == cont["file_path"]
-                        and item.obj_name == cont["id_text"]
-                    ):
-                        return True
-                return False
+        使用 Kahn 算法, 每次从没有未完成依赖的对象中取出按深度排序后位置最靠前的一个(叶子节点在前面),
+        因此引用不成环时, 顺序与每次从头扫描剩余列表的做法相同。不会被调度的对象(不在白名单中等)不算作依赖。
 
-            doc_items = list(filter(in_white_list, doc_items))
+        Returns:
+            tuple: (deal_items, task_dict), task_dict 是 任务编号 -> {item_status, full_name, dependencies}
+        """
+        doc_items = now_node.get_travel_list()
+        for item in doc_items:
+            item.multithread_task_id = -1  # 清除上一次调度留下的编号
+        if self.white_list is not None:
+            white_list_keys = {(cont["file_path"], cont["id_text"]) for cont in self.white_list}
+            doc_items = [item for item in doc_items if (item.get_file_name(), item.obj_name) in white_list_keys]
         doc_items = list(filter(task_available_func, doc_items))
         doc_items = sorted(doc_items, key=lambda x: x.depth)  # 叶子节点在前面
+        position = {item: pos for pos, item in enumerate(doc_items)}
+
+        # 依赖边 i -> j 表示对象 i 依赖对象 j, 父亲依赖儿子的关系是一定要走的。
+        # 边按起点的顺序生成, 因此 dependencies[dependency_offsets[i]:dependency_offsets[i + 1]] 就是对象 i 依赖的对象
+        edge_sources, dependencies, dependency_offsets = [], [], [0]
+        non_special_sources, non_special_targets = [], []  # 非特殊引用, 打断循环引用时使用
+        for pos, item in enumerate(doc_items):
+            if item._children:
+                for child in item._children.values():
+                    child_pos = position.get(child)
+                    if child_pos is not None:
+                        edge_sources.append(pos)
+                        dependencies.append(child_pos)
+            if item._reference_graph is not None:
+                for referenced, special in zip(item.reference_who, item.special_reference_type):
+                    referenced_pos = position.get(referenced)
+                    if referenced_pos is not None:
+                        edge_sources.append(pos)
+                        dependencies.append(referenced_pos)
+                        if not special:
+                            non_special_sources.append(pos)
+                            non_special_targets.append(referenced_pos)
+            dependency_offsets.append(len(dependencies))
+        item_count = len(doc_items)
+        dependent_offsets, dependents = group_edges(item_count, dependencies, edge_sources)
+        non_special_dependent_offsets, non_special_dependents = group_edges(item_count, non_special_targets, non_special_sources)
+        pending_count = [dependency_offsets[pos + 1] - dependency_offsets[pos] for pos in range(item_count)]
+        second_best_level = [0] * item_count  # 未完成的非特殊引用数
+        for pos in non_special_sources:
+            second_best_level[pos] += 1
+
+        """一个任务依赖于所有引用者和他的子节点,我们不能保证引用不成环(也许有些仓库的废代码会出现成环)。
+        这时就只能选择一个相对来说遵守程度最好的了
+        有特殊情况func-def中的param def可能会出现循环引用
+        另外循环引用真实存在，对于一些bind类的接口真的会发生，比如：
+        ChatDev/WareHouse/Gomoku_HumanAgentInteraction_20230920135038/main.py里面的: on-click、show-winner、restart
+        因此第一次没有可以直接生成的对象时, 对剩下的对象求出强连通分量, 之后每次都在不再依赖其他未完成分量的环里,
+        选择未完成的非特殊引用(second-best level)最少的对象提前生成。
+        """
+        component = None  # 每个对象所属的强连通分量, 第一次遇到环时才计算
+        component_members = []
+        component_external_pending = []  # 分量指向分量外、还没有完成的依赖数
+        breakable = []  # 分量是否已经不依赖其他未完成的分量
+        break_candidates = []  # (second-best level, 位置) 的堆, 只包含可以打断的分量中的对象; 过期的项在弹出时跳过
+
+        def mark_breakable(component_id):
+            breakable[component_id] = True
+            for pos in component_members[component_id]:
+                if not dealt[pos]:
+                    heapq.heappush(break_candidates, (second_best_level[pos], pos))
+
+        ready = [pos for pos, count in enumerate(pending_count) if count == 0]  # 已经按位置排好序, 是一个合法的堆
+        dealt = [False] * item_count
+        task_ids = [-1] * item_count  # 与 multithread_task_id 相同, 按位置存放
         deal_items = []
-        bar = tqdm(total=len(doc_items), desc="parsing topology task-list")
+        bar = tqdm(total=item_count, desc="parsing topology task-list")
         task_dict = {} # Added task dictionary to keep track of dependencies
 
-        while doc_items:
-            min_break_level = 1e7
-            target_item = None
-            for item in doc_items:
-                """一个任务依赖于所有引用者和他的子节点,我们不能保证引用不成环(也许有些仓库的废代码会出现成环)。
-                这时就只能选择一个相对来说遵守程度最好的了
-                有特殊情况func-def中的param def可能会出现循环引用
-                另外循环引用真实存在，对于一些bind类的接口真的会发生，比如：
-                ChatDev/WareHouse/Gomoku_HumanAgentInteraction_20230920135038/main.py里面的: on-click、show-winner、restart
-                """
-                best_break_level = 0
-                second_best_break_level = 0
-                for _, child in item.children.items():  # 父亲依赖儿子的关系是一定要走的
-                    if task_available_func(child) and (child not in deal_items):
-                        best_break_level += 1
-                for referenced, special in zip(item.reference_who, item.special_reference_type):
-                    if task_available_func(referenced) and (referenced not in deal_items):
-                        best_break_level += 1
-                    if task_available_func(referenced) and (not special) and (referenced not in deal_items):
-                        second_best_break_level += 1
-                if best_break_level == 0:
-                    min_break_level = -1
-                    target_item = item
-                    break
-                if second_best_break_level < min_break_level:
-                    target_item = item
-                    min_break_level = second_best_break_level
-
-            if min_break_level > 0:
-                print(f"circle-reference(second-best still failed), level={min_break_level}: {target_item.get_full_name()}")
-
-            item_denp_task_ids = []
-            for _, child in target_item.children.items():
-                if child.multithread_task_id != -1:
-                    item_denp_task_ids.append(child.multithread_task_id)
-            for referenced_item in target_item.reference_who:
-                if referenced_item.multithread_task_id != -1:
-                    item_denp_task_ids.append(referenced_item.multithread_task_id)
-            item_denp_task_ids = list(set(item_denp_task_ids))  # 去重
-            if task_available_func is None or task_available_func(target_item):
-                target_item.multithread_task_id = len(deal_items)
-                task_dict[target_item.multithread_task_id] = {
-                    "item_status": target_item.item_status, 
-                    "full_name": target_item.get_full_name(), 
-                    "dependencies": item_denp_task_ids
-                }  # Store dependencies in task_dict
+        while len(deal_items) < item_count:
+            if ready:
+                target = heapq.heappop(ready)
+            else:
+                if component is None:
+                    component = find_strongly_connected_components(dependency_offsets, dependencies, skip=dealt)
+                    component_count = max(component) + 1
+                    component_members = [[] for _ in range(component_count)]
+                    component_external_pending = [0] * component_count
+                    breakable = [False] * component_count
+                    for pos in range(item_count):
+                        if dealt[pos]:
+                            continue
+                        component_members[component[pos]].append(pos)
+                        for dependency in dependencies[dependency_offsets[pos] : dependency_offsets[pos + 1]]:
+                            if not dealt[dependency] and component[dependency] != component[pos]:
+                                component_external_pending[component[pos]] += 1
+                    for component_id in range(component_count):
+                        if component_external_pending[component_id] == 0:
+                            mark_breakable(component_id)
+                while True:
+                    min_break_level, target = heapq.heappop(break_candidates)
+                    if not dealt[target] and min_break_level == second_best_level[target]:
+                        break
+                if min_break_level > 0:
+                    print(f"circle-reference(second-best still failed), level={min_break_level}: {doc_items[target].get_full_name()}")
+
+            target_item = doc_items[target]
+            dealt[target] = True
+            for dependent in dependents[dependent_offsets[target] : dependent_offsets[target + 1]]:
+                pending_count[dependent] -= 1
+                if pending_count[dependent] == 0 and not dealt[dependent]:
+                    heapq.heappush(ready, dependent)
+                if component is not None and component[dependent] != component[target]:
+                    component_external_pending[component[dependent]] -= 1
+                    if component_external_pending[component[dependent]] == 0:
+                        mark_breakable(component[dependent])
+            for dependent in non_special_dependents[non_special_dependent_offsets[target] : non_special_dependent_offsets[target + 1]]:
+                second_best_level[dependent] -= 1
+                if component is not None and breakable[component[dependent]] and not dealt[dependent]:
+                    heapq.heappush(break_candidates, (second_best_level[dependent], dependent))
+
+            target_dependencies = dependencies[dependency_offsets[target] : dependency_offsets[target + 1]]
+            if pending_count[target] == 0:
+                item_denp_task_ids = list(set(map(task_ids.__getitem__, target_dependencies)))  # 去重
+            else:  # 为了打断循环引用而提前生成, 有的依赖还没有编号
+                item_denp_task_ids = list({task_ids[dependency] for dependency in target_dependencies if task_ids[dependency] != -1})
+            # doc_items 中的对象都已经通过了 task_available_func
+            target_item.multithread_task_id = task_ids[target] = len(deal_items)
+            task_dict[target_item.multithread_task_id] = {
+                "item_status": target_item.item_status, 
+                "full_name": target_item.get_full_name(), 
+                "dependencies": item_denp_task_ids
+            }  # Store dependencies in task_dict
             deal_items.append(target_item)
-            doc_items.remove(target_item)
             bar.update(1)
 
         return deal_items, task_dict # Return both deal_items and the task_dict
@@ -538,35 +1096,253 @@ class MetaInfo:
                 return result_item
             return None
     
-    def checkpoint(self, target_dir_path: str | Path, flash_reference_relation=False):
-            """
-            Save the MetaInfo object to the specified directory.
+    def checkpoint(self, target_dir_path: str | Path, flash_reference_relation=False, binary: Optional[bool] = None, wait=True):
+        """
+        Save the MetaInfo object to the specified directory.
 
-            Args:
-                target_dir_path (str): The path to the target directory where the MetaInfo will be saved.
-                flash_reference_relation (bool, optional): Whether to include flash reference relation in the saved MetaInfo. Defaults to False.
-            """
-            #with self.checkpoint_lock:
-            print(f"{Fore.GREEN}MetaInfo is Refreshed and Saved{Style.RESET_ALL}")
-            if not os.path.exists(target_dir_path):
-                os.makedirs(target_dir_path)
-            now_hierarchy_json = self.to_hierarchy_json(
-                flash_reference_relation=flash_reference_relation
+        The state is copied into a `CheckpointSnapshot` on the calling thread and written by the background
+        `CheckpointWriter`, snapshots submitted while an earlier one is being written are coalesced.
+
+        Args:
+            target_dir_path (str): The path to the target directory where the MetaInfo will be saved.
+            flash_reference_relation (bool, optional): Whether to include flash reference relation in the saved MetaInfo. Defaults to False.
+            binary (bool, optional): Write the hierarchy as a `BinaryCheckpoint` instead of JSON shards.
+                Defaults to `setting.project.use_binary_checkpoint`. The other format is removed from the directory.
+            wait (bool, optional): Block until the checkpoint is on disk. Defaults to True.
+        """
+        with self.checkpoint_lock:
+            snapshot = self.take_snapshot(flash_reference_relation, binary)
+            writer = self._get_checkpoint_writer(target_dir_path)
+            writer.submit_snapshot(snapshot)
+        if wait:
+            writer.flush()
+
+    def flush_checkpoint(self):
+        """Blocks until every checkpoint and journal record submitted so far is on disk."""
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.flush()
+
+    def take_snapshot(self, flash_reference_relation=False, binary: Optional[bool] = None) -> CheckpointSnapshot:
+        """
+        Copies everything a checkpoint needs, without touching disk and without modifying the tree.
+        Files whose shard has not been loaded are not copied: they cannot have been modified, the writer reuses their shard.
+        """
+        if binary is None:
+            binary = setting.project.use_binary_checkpoint
+        files = []
+        pending_file_items = []
+        doc_blobs = {}
+        for file_item in self.iter_files():
+            with _shard_load_lock:  # 不会看到加载到一半的file节点
+                shard_store = file_item._shard_store
+            if shard_store is not None:
+                files.append((file_item.get_full_name(), file_item.depth, None, shard_store))
+                pending_file_items.append(file_item)
+            else:
+                file_content = self.file_to_json(file_item, flash_reference_relation, doc_blobs)
+                files.append((file_item.get_full_name(), file_item.depth, file_content, None))
+        meta = {
+            "doc_version": self.document_version,
+            "in_generation_process": self.in_generation_process,
+            "fake_file_reflection": dict(self.fake_file_reflection),
+            "jump_files": list(self.jump_files),
+            "deleted_items_from_older_meta": list(self.deleted_items_from_older_meta),
+        }
+        return CheckpointSnapshot(files=files, pending_file_items=pending_file_items, meta=meta, binary=binary, doc_blobs=doc_blobs)
+
+    def _get_checkpoint_writer(self, target_dir_path: str | Path) -> CheckpointWriter:
+        target_dir_path = os.fspath(target_dir_path)
+        writer = self.checkpoint_writer
+        if writer is None or writer.target_dir_path != target_dir_path:
+            if writer is not None:
+                self.checkpoint_writer = None  # 被换下的 writer 不再合并日志, 见 _compact_journal
+                writer.flush()  # 换到另一个目录之前先写完原来目录的内容
+            journal = self.journal
+            pending_record_count = journal.pending_count if journal is not None and os.path.dirname(journal.journal_path) == target_dir_path else 0
+            writer = self.checkpoint_writer = CheckpointWriter(
+                target_dir_path,
+                write_snapshot=partial(self.write_snapshot, target_dir_path),
+                write_records=partial(self._write_journal_records, target_dir_path),
+                pending_record_count=pending_record_count,
+                compact=self._compact_journal,
             )
-            with open(
-                os.path.join(target_dir_path, "project_hierarchy.json"), "w", encoding='utf-8'
-            ) as writer:
-                json.dump(now_hierarchy_json, writer, indent=2, ensure_ascii=False)
-
-            with open(os.path.join(target_dir_path, "meta-info.json"), "w") as writer:
-                meta = {
-                    "doc_version": self.document_version,
-                    "in_generation_process": self.in_generation_process,
-                    "fake_file_reflection": self.fake_file_reflection,
-                    "jump_files": self.jump_files,
-                    "deleted_items_from_older_meta": self.deleted_items_from_older_meta,
-                }
-                json.dump(meta, writer, indent=2, ensure_ascii=False)
+        return writer
+
+    def _compact_journal(self, writer: CheckpointWriter):
+        """
+        Compacts the journal into a full checkpoint, called on the writer thread after `record_item_update`
+        requested it. The snapshot is taken under checkpoint_lock, so the records queued so far are all included.
+        """
+        # 换目录时会在持有 checkpoint_lock 的情况下等待被换下的 writer, 这时放弃合并, 不能一直等锁
+        while not self.checkpoint_lock.acquire(timeout=0.1):
+            if self.checkpoint_writer is not writer:
+                return
+        try:
+            if self.checkpoint_writer is writer:
+                writer.submit_snapshot(self.take_snapshot())
+        finally:
+            self.checkpoint_lock.release()
+
+    def write_snapshot(self, target_dir_path: str | Path, snapshot: CheckpointSnapshot):
+        """Writes a snapshot to target_dir_path, called on the writer thread. Every file is written to a temp file and then replaced."""
+        print(f"{Fore.GREEN}MetaInfo is Refreshed and Saved{Style.RESET_ALL}")
+        if not os.path.exists(target_dir_path):
+            os.makedirs(target_dir_path)
+        # 文档的旧版本先于引用它们的层级信息写出
+        doc_store = DocStore(target_dir_path)
+        self._copy_doc_blobs(snapshot.doc_blobs, doc_store)
+        # 分片还没有加载的文件不可能被修改过, 直接使用原来的内容, 不需要建立 DocItem
+        if snapshot.binary:
+            new_store = self._write_binary_hierarchy(target_dir_path, snapshot.files, doc_store)
+        else:
+            new_store = self._write_sharded_hierarchy(target_dir_path, snapshot.files, doc_store)
+        # 来自其他目录或另一种格式的file节点改为从新写出的快照加载, 旧的快照随后可以删除;
+        # 来自同一个快照的不需要修改, 分片原地保留, hierarchy.bin 被替换后会重新打开
+        moved_stores = {
+            shard_store for _, _, _, shard_store in snapshot.files
+            if shard_store is not None and (type(shard_store) is not type(new_store) or shard_store.root != new_store.root)
+        }
+        if moved_stores:
+            with _shard_load_lock:
+                for file_item in snapshot.pending_file_items:
+                    if file_item._shard_store in moved_stores:
+                        file_item._shard_store = new_store
+            for old_store in moved_stores:
+                old_store.close()
+        if snapshot.binary:
+            shutil.rmtree(ShardStore(target_dir_path).root, ignore_errors=True)
+        elif BinaryCheckpoint(target_dir_path).exists():
+            os.remove(BinaryCheckpoint(target_dir_path).root)
+        legacy_hierarchy_json_path = os.path.join(target_dir_path, "project_hierarchy.json")
+        if os.path.exists(legacy_hierarchy_json_path):  # 旧版本的单文件快照已经被分片代替
+            os.remove(legacy_hierarchy_json_path)
+
+        journal = self._get_journal(target_dir_path)
+        meta_info_path = os.path.join(target_dir_path, "meta-info.json")
+        with open(meta_info_path + ".tmp", "w") as writer:
+            meta = dict(snapshot.meta, journal_seq=journal.last_seq)
+            json.dump(meta, writer, indent=2, ensure_ascii=False)
+        os.replace(meta_info_path + ".tmp", meta_info_path)
+
+        # 快照已经包含了日志中的所有记录
+        journal.truncate()
+        # 所有文件都在快照中时, 快照没有引用的旧版本都已经超出了保留数量(之后新产生的版本还在内存中)
+        if not snapshot.pending_file_items:
+            doc_store.prune(snapshot.doc_blobs)
+
+    @staticmethod
+    def _copy_doc_blobs(doc_blobs: Dict[str, DocStore], doc_store: DocStore):
+        """Saves the document versions doc_blobs (hash -> the DocStore holding it) in doc_store."""
+        hashes_by_store = {}
+        for doc_hash, source_doc_store in doc_blobs.items():
+            hashes_by_store.setdefault(source_doc_store, []).append(doc_hash)
+        for source_doc_store, doc_hashes in hashes_by_store.items():
+            source_doc_store.copy_to(doc_store, doc_hashes)
+
+    @staticmethod
+    def _read_other_shard(source_store, file_name: str, doc_store: DocStore) -> List[Dict[str, Any]]:
+        """Reads a shard of another checkpoint, together with the document versions it refers to."""
+        file_content = source_store.read_shard(file_name)
+        doc_hashes = [doc_hash for value in file_content for doc_hash in value.get("md_history", ())]
+        if doc_hashes:
+            source_store.doc_store.copy_to(doc_store, doc_hashes)
+        return file_content
+
+    def _write_sharded_hierarchy(self, target_dir_path: str | Path, files, doc_store: DocStore) -> ShardStore:
+        """
+        每个文件一个分片。分片以内容 hash 命名, 不会覆盖旧 manifest 引用的分片; 替换 manifest 时才切换到新的快照,
+        之后删除不再被引用的分片。写到一半崩溃时旧的快照仍然完整, 日志也还在。
+        """
+        shard_store = ShardStore(target_dir_path)
+        manifest = {}
+        for file_name, depth, file_content, source_store in files:
+            if source_store is None:
+                shard_name = shard_store.write_shard(file_content)
+            elif type(source_store) is ShardStore and source_store.root == shard_store.root:
+                shard_name = source_store.shard_name(file_name)  # 还没有加载的文件沿用原来的分片
+            else:
+                shard_name = shard_store.write_shard(self._read_other_shard(source_store, file_name, doc_store))
+            manifest[file_name] = {"shard": shard_name, "depth": depth}
+        shard_store.write_manifest(manifest)
+        shard_store.prune(manifest)
+        return shard_store
+
+    def _write_binary_hierarchy(self, target_dir_path: str | Path, files, doc_store: DocStore) -> BinaryCheckpoint:
+        """写出 hierarchy.bin, 从同一个文件懒加载的file节点直接复制原来的段"""
+        binary_checkpoint = BinaryCheckpoint(target_dir_path)
+        replaced_stores = set()
+
+        def iter_segments():
+            for file_name, depth, file_content, source_store in files:
+                if source_store is None:
+                    segment = encode_segment(file_content)
+                elif type(source_store) is BinaryCheckpoint and source_store.root == binary_checkpoint.root:
+                    segment = source_store.read_segment(file_name)
+                    replaced_stores.add(source_store)
+                else:
+                    segment = encode_segment(self._read_other_shard(source_store, file_name, doc_store))
+                yield file_name, depth, segment
+
+        binary_checkpoint.write(iter_segments(), replaced_stores)
+        return binary_checkpoint
+
+    @staticmethod
+    def convert_checkpoint(checkpoint_dir_path: str | Path, binary: bool):
+        """Converts the checkpoint in checkpoint_dir_path between the JSON shards and the binary format, in place."""
+        MetaInfo.from_checkpoint_path(checkpoint_dir_path).checkpoint(checkpoint_dir_path, binary=binary)
+
+    def _get_journal(self, target_dir_path: str | Path) -> CheckpointJournal:
+        journal_dir = os.fspath(target_dir_path)
+        if self.journal is None or os.path.dirname(self.journal.journal_path) != journal_dir:
+            self.journal = CheckpointJournal(journal_dir, last_seq=self.journal_seq)
+        return self.journal
+
+    def record_item_update(self, target_dir_path: str | Path, doc_item: DocItem):
+        """
+        Persists the item_status and md_content of one object by queueing a record for the checkpoint journal,
+        instead of rewriting the hierarchy snapshot as `checkpoint` does. The record is appended by the writer thread.
+        Every `setting.project.journal_compact_interval` records the journal is compacted into a full checkpoint;
+        the snapshot is taken by the writer thread (see `_compact_journal`), not by the calling worker.
+        """
+        with self.checkpoint_lock:
+            writer = self._get_checkpoint_writer(target_dir_path)
+            md_content, md_history = doc_item.md_content.to_json()
+            key_path = doc_item.get_key_path()
+            doc_blobs = {doc_hash: doc_item.md_content.store for doc_hash in md_history}
+            pending_record_count = writer.submit_record(
+                key_path, (key_path, doc_item.item_status.name, md_content, md_history, doc_blobs)
+            )
+            if pending_record_count >= setting.project.journal_compact_interval:
+                writer.request_compaction()
+
+    def _write_journal_records(self, target_dir_path: str | Path, records):
+        """Appends records queued by `record_item_update` to the journal, called on the writer thread."""
+        if not os.path.exists(target_dir_path):
+            os.makedirs(target_dir_path)
+        journal = self._get_journal(target_dir_path)
+        doc_store = DocStore(target_dir_path)
+        for key_path, item_status, md_content, md_history, doc_blobs in records:
+            self._copy_doc_blobs(doc_blobs, doc_store)
+            self.journal_seq = journal.append(key_path, item_status, md_content, md_history)
+
+    def replay_journal(self, checkpoint_dir_path: str | Path, snapshot_seq: int):
+        """Applies the journal records written after the snapshot (seq > snapshot_seq) on top of the loaded tree."""
+        journal = self._get_journal(checkpoint_dir_path)
+        records = journal.read_records(snapshot_seq)
+        root_item = self.target_repo_hierarchical_tree
+        doc_store = DocStore(checkpoint_dir_path)
+        missing_count = 0
+        for record in records:
+            item = root_item.find(record["key_path"])
+            if item is None:
+                missing_count += 1
+                continue
+            item.item_status = DocItemStatus[record["item_status"]]
+            item.md_content = DocHistory.from_versions(record["md_content"], record.get("md_history", ()), doc_store)
+        self.journal_seq = journal.last_seq = max([snapshot_seq] + [record["seq"] for record in records])
+        journal.pending_count = len(records)
+        if records:
+            logger.info(f"Replayed {len(records)} checkpoint journal records, {missing_count} of them refer to missing objects")
 
 
     def to_hierarchy_json(self, flash_reference_relation=False):
@@ -582,44 +1358,66 @@ class MetaInfo:
         hierachy_json = {}
         file_item_list = self.get_all_files()
         for file_item in file_item_list:
-            file_hierarchy_content = []
-            
-            def walk_file(now_obj: DocItem):
-                nonlocal file_hierarchy_content, flash_reference_relation
-                temp_json_obj = now_obj.content
-                temp_json_obj["name"] = now_obj.obj_name
-                temp_json_obj["type"] = now_obj.item_type.to_str()
-                temp_json_obj["md_content"] = now_obj.md_content
-                temp_json_obj["item_status"] = now_obj.item_status.name
-                
-                if flash_reference_relation:
-                    temp_json_obj["who_reference_me"] = [cont.get_full_name(strict=True) for cont in now_obj.who_reference_me]
-                    temp_json_obj["reference_who"] = [cont.get_full_name(strict=True) for cont in now_obj.reference_who]
-                    temp_json_obj["special_reference_type"] = now_obj.special_reference_type
-                else:
-                    temp_json_obj["who_reference_me"] = now_obj.who_reference_me_name_list
-                    temp_json_obj["reference_who"] = now_obj.reference_who_name_list
-                    # temp_json_obj["special_reference_type"] = 
-                file_hierarchy_content.append(temp_json_obj)
-
-                for _, child in now_obj.children.items():
-                    walk_file(child)
-
-            for _, child in file_item.children.items():
-                walk_file(child)
-            hierachy_json[file_item.get_full_name()] = file_hierarchy_content
+            hierachy_json[file_item.get_full_name()] = self.file_to_json(file_item, flash_reference_relation)
         return hierachy_json
 
+    def file_to_json(self, file_item: DocItem, flash_reference_relation=False, doc_blobs: Optional[Dict[str, DocStore]] = None) -> List[Dict[str, Any]]:
+        """
+        The objects of one file in the format of a project_hierarchy.json value, see `to_hierarchy_json`.
+        md_content holds only the latest document, md_history the hashes of the older ones;
+        if doc_blobs is given, it is filled with hash -> the DocStore holding that version.
+        """
+        file_hierarchy_content = []
+        for now_obj in file_item.iter_preorder():
+            if now_obj is file_item:
+                continue
+            temp_json_obj = dict(now_obj.content)  # 复制一份, 不修改树上对象的 content, 列表也都复制, 可以在其他线程中写出
+            temp_json_obj["name"] = now_obj.obj_name
+            temp_json_obj["type"] = now_obj.item_type.to_str()
+            temp_json_obj["md_content"], md_history = now_obj.md_content.to_json()
+            if md_history:
+                temp_json_obj["md_history"] = md_history
+                if doc_blobs is not None:
+                    for doc_hash in md_history:
+                        doc_blobs[doc_hash] = now_obj.md_content.store
+            temp_json_obj["item_status"] = now_obj.item_status.name
+            
+            if flash_reference_relation:
+                temp_json_obj["who_reference_me"] = [cont.get_full_name(strict=True) for cont in now_obj.who_reference_me]
+                temp_json_obj["reference_who"] = [cont.get_full_name(strict=True) for cont in now_obj.reference_who]
+                temp_json_obj["special_reference_type"] = list(now_obj.special_reference_type)
+            else:
+                temp_json_obj["who_reference_me"] = list(now_obj.who_reference_me_name_list)
+                temp_json_obj["reference_who"] = list(now_obj.reference_who_name_list)
+                # temp_json_obj["special_reference_type"] = 
+            file_hierarchy_content.append(temp_json_obj)
+        return file_hierarchy_content
+
     @staticmethod
-    def from_checkpoint_path(checkpoint_dir_path: str | Path ) -> MetaInfo:
-        """从已有的metainfo dir里面读取metainfo"""
-        project_hierarchy_json_path = os.path.join(
-            checkpoint_dir_path, "project_hierarchy.json"
+    def checkpoint_exists(checkpoint_dir_path: str | Path) -> bool:
+        """Whether checkpoint_dir_path holds a checkpoint: binary, sharded or a legacy project_hierarchy.json."""
+        return (
+            BinaryCheckpoint(checkpoint_dir_path).exists()
+            or ShardStore(checkpoint_dir_path).exists()
+            or os.path.exists(os.path.join(checkpoint_dir_path, "project_hierarchy.json"))
         )
 
-        with open(project_hierarchy_json_path, "r", encoding="utf-8") as reader:
-            project_hierarchy_json = json.load(reader)
-        metainfo = MetaInfo.from_project_hierarchy_json(project_hierarchy_json)
+    @staticmethod
+    def from_checkpoint_path(checkpoint_dir_path: str | Path ) -> MetaInfo:
+        """从已有的metainfo dir里面读取metainfo, 分片的快照只读取 manifest, 文件中的对象在用到时才加载"""
+        binary_checkpoint = BinaryCheckpoint(checkpoint_dir_path)
+        shard_store = ShardStore(checkpoint_dir_path)
+        if binary_checkpoint.exists():
+            metainfo = MetaInfo.from_shard_store(binary_checkpoint)
+        elif shard_store.exists():
+            metainfo = MetaInfo.from_shard_store(shard_store)
+        else:
+            project_hierarchy_json_path = os.path.join(
+                checkpoint_dir_path, "project_hierarchy.json"
+            )
+            with open(project_hierarchy_json_path, "r", encoding="utf-8") as reader:
+                project_hierarchy_json = json.load(reader)
+            metainfo = MetaInfo.from_project_hierarchy_json(project_hierarchy_json, DocStore(checkpoint_dir_path))
 
         with open(
             os.path.join(checkpoint_dir_path, "meta-info.json"), "r", encoding="utf-8"
@@ -631,119 +1429,328 @@ class MetaInfo:
             metainfo.jump_files = meta_data["jump_files"]
             metainfo.in_generation_process = meta_data["in_generation_process"]
             metainfo.deleted_items_from_older_meta = meta_data["deleted_items_from_older_meta"]
+        metainfo.replay_journal(checkpoint_dir_path, meta_data.get("journal_seq", 0))
 
         print(
             f"{Fore.CYAN}Loading MetaInfo:{Style.RESET_ALL} {checkpoint_dir_path}"
         )
         return metainfo
     
+    def get_line_index(self, file_node: DocItem) -> List[DocItem]:
+        """
+        Returns the line index of a file: position i holds the innermost object whose code range contains line i,
+        or the file node itself. The index is built on first use and kept until the file is re-parsed.
+
+        对于同一层中范围重叠的兄弟对象, 与逐层查找一样取排在前面的那个, 因此建立时子节点按逆序涂色,
+        每个子节点的整个子树涂完后才轮到它前面的兄弟。
+        """
+        rel_file_path = file_node.get_full_name()
+        cached = self.line_index.get(rel_file_path)
+        if cached is not None and cached[0] is file_node:
+            return cached[1]
+
+        line_count = max((item.code_end_line for item in file_node.iter_preorder()), default=0) + 1
+        line_to_obj = [file_node] * max(line_count, 1)
+        stack = list(file_node.children.values())
+        while stack:
+            now_node = stack.pop()
+            start_line = max(now_node.code_start_line, 0)
+            end_line = now_node.code_end_line
+            if start_line <= end_line:
+                line_to_obj[start_line : end_line + 1] = [now_node] * (end_line - start_line + 1)
+            if now_node._children:
+                stack.extend(now_node._children.values())
+        self.line_index[rel_file_path] = (file_node, line_to_obj)
+        return line_to_obj
+
     def find_obj_with_lineno(self, file_node: DocItem, start_line_num) -> DocItem:
         """每个DocItem._file，对于所有的行，建立他们对应的对象是谁
         一个行属于这个obj的范围，并且没法属于他的儿子的范围了"""
-        now_node = file_node
-        # if 
-        assert now_node != None
-        while len(now_node.children) > 0:
-            find_qualify_child = False
-            for _, child in now_node.children.items():
-                assert child.content != None
-                if (
-                    child.content["code_start_line"] <= start_line_num
-                    and child.content["code_end_line"] >= start_line_num
-                ):
-                    now_node = child
-                    find_qualify_child = True
-                    break
-            if not find_qualify_child:
-                return now_node
-        return now_node
+        assert file_node != None
+        line_to_obj = self.get_line_index(file_node)
+        if 0 <= start_line_num < len(line_to_obj):
+            return line_to_obj[start_line_num]
+        return file_node
+
+    def new_reference_resolver(self) -> Union[ReferenceResolver, StaticReferenceResolver]:
+        """
+        Starts a new round of reference lookups. Cached jedi.Script objects hold the file contents they were
+        created from, so each round gets a fresh resolver bound to the shared jedi_project.
+        With `setting.project.use_static_references` the round indexes the repo with a StaticReferenceResolver,
+        which falls back to Jedi for the objects it cannot resolve.
+        With `setting.project.use_identifier_index` objects whose name occurs in no other file are only
+        searched in their own file, see `IdentifierIndex`.
+        """
+        if self.jedi_project is None:
+            self.jedi_project = jedi.Project(self.repo_path)
+        index = IdentifierIndex(self.repo_path) if setting.project.use_identifier_index else None
+        self.reference_resolver = ReferenceResolver(self.repo_path, self.jedi_project, index=index)
+        if setting.project.use_static_references:
+            self.reference_resolver = StaticReferenceResolver(self.repo_path, self.reference_resolver)
+        return self.reference_resolver
 
     def parse_reference(self):
-        """双向提取所有引用关系"""
+        """
+        双向提取所有引用关系
+
+        When `setting.project.reference_process_count` is greater than 1, files are resolved in a process pool,
+        see `_resolve_references_in_processes`. Results are merged file by file in tree order, in the same order as
+        a serial run, so reference_who and who_reference_me are identical to a serial run.
+        When `setting.project.use_reference_cache` is set, files whose objects, referencing files and imported
+        modules are unchanged since the last run reuse the references saved in the hierarchy directory,
+        see `ReferenceCache`.
+        """
         file_nodes = self.get_all_files()
+        resolver = self.new_reference_resolver()
 
         white_list_file_names, white_list_obj_names = (
-            [],
-            [],
+            set(),
+            set(),
         )  # 如果指定白名单，只处理白名单上的双向引用关系
         if self.white_list != None:
-            white_list_file_names = [cont["file_path"] for cont in self.white_list]
-            white_list_obj_names = [cont["id_text"] for cont in self.white_list]
-
-        for file_node in tqdm(file_nodes, desc="parsing bidirectional reference"):
-
-            ref_count = 0
-            rel_file_path = file_node.get_full_name()
-            assert rel_file_path not in self.jump_files
+            white_list_file_names = {cont["file_path"] for cont in self.white_list}
+            white_list_obj_names = {cont["id_text"] for cont in self.white_list}
 
-            if white_list_file_names != [] and (
+        file_lookups = []  # (file节点, 文件中按先序排列的 (对象, in_file_only))
+        for file_node in file_nodes:
+            assert file_node.get_full_name() not in self.jump_files
+            if white_list_file_names and (
                 file_node.get_file_name() not in white_list_file_names
             ):  # 如果有白名单，只parse白名单里的对象
                 continue
+            file_lookups.append((file_node, self._get_reference_lookups(file_node, white_list_obj_names)))
+
+        reference_cache, cached_references, cache_keys = None, {}, {}
+        if setting.project.use_reference_cache:
+            reference_cache = ReferenceCache(
+                setting.project.target_repo / setting.project.hierarchy_name,
+                self.repo_path,
+                resolver.index if resolver.index is not None else IdentifierIndex(self.repo_path),
+                resolver_options={
+                    "use_static_references": setting.project.use_static_references,
+                    "use_identifier_index": setting.project.use_identifier_index,
+                },
+            )
+            for file_node, lookups in file_lookups:
+                file_path = file_node.get_full_name()
+                cache_keys[file_path] = reference_cache.get_key(file_path, [
+                    (now_obj.obj_name, now_obj.content["code_start_line"], now_obj.content["name_column"], in_file_only)
+                    for now_obj, in_file_only in lookups
+                ])
+                reference_lists = reference_cache.get(file_path, cache_keys[file_path])
+                if reference_lists is not None:
+                    cached_references[file_path] = [
+                        (now_obj, reference_list) for (now_obj, _), reference_list in zip(lookups, reference_lists)
+                    ]
+        uncached_lookups = [
+            (file_node, lookups) for file_node, lookups in file_lookups
+            if file_node.get_full_name() not in cached_references
+        ]
 
-            def walk_file(now_obj: DocItem):
-                """在文件内遍历所有变量"""
-                nonlocal ref_count, white_list_file_names
-                in_file_only = False
-                if white_list_obj_names != [] and (
-                    now_obj.obj_name not in white_list_obj_names
-                ):
-                    in_file_only = True  # 作为加速，如果有白名单，白名单obj同文件夹下的也parse，但是只找同文件内的引用
-
-                try:
-                    reference_list = find_all_referencer(
-                        repo_path=self.repo_path,
-                        variable_name=now_obj.obj_name,
-                        file_path=rel_file_path,
-                        line_number=now_obj.content["code_start_line"],
-                        column_number=now_obj.content["name_column"],
-                        in_file_only=in_file_only,
+        process_count = min(setting.project.reference_process_count, len(uncached_lookups))
+        if process_count > 1:
+            resolved_references = self._resolve_references_in_processes(uncached_lookups, process_count)
+        else:
+            resolved_references = (
+                [
+                    (now_obj, resolver.find_references(
+                        now_obj.obj_name,
+                        file_node.get_full_name(),
+                        now_obj.content["code_start_line"],
+                        now_obj.content["name_column"],
+                        in_file_only,
+                    ))
+                    for now_obj, in_file_only in lookups
+                ]
+                for file_node, lookups in uncached_lookups
+            )
+
+        for file_node, _ in tqdm(file_lookups, desc="parsing bidirectional reference"):
+            file_path = file_node.get_full_name()
+            object_references = cached_references.get(file_path)
+            if object_references is None:
+                object_references = next(resolved_references)
+                if reference_cache is not None:
+                    reference_cache.put(
+                        file_path, cache_keys[file_path], [reference_list for _, reference_list in object_references]
                     )
-                except Exception as e:
-                    logger.error(f"Error occurred while finding references: {e}")
-                    return
-
-                for referencer_pos in reference_list:  # 对于每个引用
-                    referencer_file_ral_path = referencer_pos[0]
-                    if referencer_file_ral_path in self.fake_file_reflection.values():
-                        """检测到的引用者来自于unstaged files，跳过该引用"""
-                        print(
-                            f"{Fore.LIGHTBLUE_EX}[Reference From Unstaged Version, skip]{Style.RESET_ALL} {referencer_file_ral_path} -> {now_obj.get_full_name()}"
-                        )
-                        continue
-                    elif referencer_file_ral_path in self.jump_files:
-                        """检测到的引用者来自于untracked files，跳过该引用"""
-                        print(
-                            f"{Fore.LIGHTBLUE_EX}[Reference From Unstracked Version, skip]{Style.RESET_ALL} {referencer_file_ral_path} -> {now_obj.get_full_name()}"
-                        )
-                        continue
-
-                    target_file_hiera = referencer_file_ral_path.split("/")
-                    referencer_file_item = self.target_repo_hierarchical_tree.find(target_file_hiera)
-                    if referencer_file_item == None:
-                        print(
-                            f"{Fore.LIGHTRED_EX}Error: Find \"{referencer_file_ral_path}\"(not in target repo){Style.RESET_ALL} referenced {now_obj.get_full_name()}"
-                        )
-                        continue
-                    referencer_node = self.find_obj_with_lineno(referencer_file_item, referencer_pos[1])
-                    if referencer_node.obj_name == now_obj.obj_name:
-                        logger.info(
-                            f"Jedi find {now_obj.get_full_name()} with name_duplicate_reference, skipped"
-                        )
-                        continue
-                    if DocItem.has_ans_relation(now_obj, referencer_node) == None:
-                        # 不考虑祖先节点之间的引用
-                        if now_obj not in referencer_node.reference_who:
-                            special_reference_type = (referencer_node.item_type in [DocItemType._function, DocItemType._sub_function, DocItemType._class_function]) and referencer_node.code_start_line == referencer_pos[1]
-                            referencer_node.special_reference_type.append(special_reference_type)
-                            referencer_node.reference_who.append(now_obj)
-                            now_obj.who_reference_me.append(referencer_node)
-                            ref_count += 1
-                for _, child in now_obj.children.items():
-                    walk_file(child)
-
-            # Call walk_file for each child of the file_node
-            for _, child in file_node.children.items():
-                logger.debug(f"Processing child: {child.get_full_name()}")
-                walk_file(child)
-            logger.info(f"find {ref_count} refer-relation in {file_node.get_full_name()}")
\ No newline at end of file
+            ref_count = 0
+            for now_obj, reference_list in object_references:
+                ref_count += self._add_references(now_obj, reference_list)
+            logger.info(f"find {ref_count} refer-relation in {file_path}")
+        resolved_references.close()  # 结束进程池
+        if reference_cache is not None:
+            reference_cache.prune(cache_keys)
+            reference_cache.save()
+            reference_cache.log_statistics()
+        resolver.log_slowest_files()
+        resolver.invalidate()  # 只保留耗时统计, 释放 Script 及其推断缓存
+        self.reference_graph.freeze()
+
+    def _get_reference_lookups(self, file_node: DocItem, white_list_obj_names) -> List[Tuple[DocItem, bool]]:
+        """(object, in_file_only) of every object in the file, in preorder."""
+        lookups = []
+        stack = list(reversed(file_node.children.values()))
+        while stack:
+            now_obj = stack.pop()
+            if now_obj.father is file_node:
+                logger.debug(f"Processing child: {now_obj.get_full_name()}")
+            # 作为加速，如果有白名单，白名单obj同文件夹下的也parse，但是只找同文件内的引用
+            in_file_only = bool(white_list_obj_names) and now_obj.obj_name not in white_list_obj_names
+            lookups.append((now_obj, in_file_only))
+            if now_obj._children:
+                stack.extend(reversed(now_obj._children.values()))
+        return lookups
+
+    def _resolve_references_in_processes(self, file_lookups, process_count):
+        """
+        Resolves the files in a process pool, each worker keeps its own resolver and jedi.Project (see
+        `resolve_file_references`). Yields the (object, reference list) pairs of each file in the order of file_lookups.
+        """
+        resolver = self.reference_resolver
+        static_references = {}  # 对象 -> 静态解析出的引用, 这些对象不再交给工作进程
+        if isinstance(resolver, StaticReferenceResolver):
+            for file_node, lookups in file_lookups:
+                for now_obj, in_file_only in lookups:
+                    reference_list = resolver.resolve_statically(
+                        now_obj.obj_name, file_node.get_full_name(), now_obj.content["code_start_line"], in_file_only
+                    )
+                    if reference_list is not None:
+                        static_references[now_obj] = reference_list
+        # Jedi 在当前进程中启动的编译子进程及其管道与锁不能被 fork 出的进程继续使用, 工作进程需要用 spawn 启动
+        with ProcessPoolExecutor(
+            max_workers=process_count,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_reference_worker,
+            initargs=(self.repo_path, resolver.index),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    resolve_file_references,
+                    file_node.get_full_name(),
+                    [
+                        (now_obj.get_full_name(), now_obj.obj_name, now_obj.content["code_start_line"],
+                         now_obj.content["name_column"], in_file_only)
+                        for now_obj, in_file_only in lookups
+                        if now_obj not in static_references
+                    ],
+                )
+                for file_node, lookups in file_lookups
+            ]
+            try:
+                for (file_node, lookups), future in zip(file_lookups, futures):
+                    references, resolver.file_timings[file_node.get_full_name()], lookup_counts = future.result()
+                    resolver.lookup_counts.update(lookup_counts)
+                    referencer_positions = defaultdict(list)  # 对象全名 -> 按 Jedi 返回顺序排列的引用位置
+                    for full_name, referencer_path, line, column in references:
+                        referencer_positions[full_name].append((referencer_path, line, column))
+                    yield [
+                        (now_obj, static_references[now_obj] if now_obj in static_references
+                         else referencer_positions.get(now_obj.get_full_name(), []))
+                        for now_obj, _ in lookups
+                    ]
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def parse_reference_of_obj(self, now_obj: DocItem, rel_file_path: str, in_file_only=False) -> Optional[int]:
+        """
+        Finds every object that references now_obj and records the bidirectional reference relation.
+
+        Args:
+            now_obj (DocItem): The referenced object.
+            rel_file_path (str): The path of the file that defines now_obj.
+            in_file_only (bool): Only look for references inside rel_file_path.
+
+        Returns:
+            Optional[int]: The number of new reference relations, or None if the lookup failed.
+        """
+        if self.reference_resolver is None:
+            self.new_reference_resolver()
+        try:
+            reference_list = self.reference_resolver.find_references(
+                variable_name=now_obj.obj_name,
+                file_path=rel_file_path,
+                line_number=now_obj.content["code_start_line"],
+                column_number=now_obj.content["name_column"],
+                in_file_only=in_file_only,
+            )
+        except Exception as e:
+            logger.error(f"Error occurred while finding references: {e}")
+            return None
+        return self._add_references(now_obj, reference_list)
+
+    def _add_references(self, now_obj: DocItem, reference_list) -> int:
+        """
+        Adds the referencers found for now_obj to the reference graph.
+
+        Args:
+            now_obj (DocItem): The referenced object.
+            reference_list: (path relative to the repo, line, column) of each reference, as returned by
+                `ReferenceResolver.find_references`.
+
+        Returns:
+            int: The number of new reference relations.
+        """
+        ref_count = 0
+        for referencer_pos in reference_list:  # 对于每个引用
+            referencer_file_ral_path = referencer_pos[0]
+            if referencer_file_ral_path in self.fake_file_reflection.values():
+                """检测到的引用者来自于unstaged files，跳过该引用"""
+                print(
+                    f"{Fore.LIGHTBLUE_EX}[Reference From Unstaged Version, skip]{Style.RESET_ALL} {referencer_file_ral_path} -> {now_obj.get_full_name()}"
+                )
+                continue
+            elif referencer_file_ral_path in self.jump_files:
+                """检测到的引用者来自于untracked files，跳过该引用"""
+                print(
+                    f"{Fore.LIGHTBLUE_EX}[Reference From Unstracked Version, skip]{Style.RESET_ALL} {referencer_file_ral_path} -> {now_obj.get_full_name()}"
+                )
+                continue
+
+            target_file_hiera = referencer_file_ral_path.split("/")
+            referencer_file_item = self.target_repo_hierarchical_tree.find(target_file_hiera)
+            if referencer_file_item == None:
+                print(
+                    f"{Fore.LIGHTRED_EX}Error: Find \"{referencer_file_ral_path}\"(not in target repo){Style.RESET_ALL} referenced {now_obj.get_full_name()}"
+                )
+                continue
+            referencer_node = self.find_obj_with_lineno(referencer_file_item, referencer_pos[1])
+            if referencer_node.obj_name == now_obj.obj_name:
+                logger.info(
+                    f"Jedi find {now_obj.get_full_name()} with name_duplicate_reference, skipped"
+                )
+                continue
+            if DocItem.has_ans_relation(now_obj, referencer_node) == None:
+                # 不考虑祖先节点之间的引用
+                special_reference_type = (referencer_node.item_type in [DocItemType._function, DocItemType._sub_function, DocItemType._class_function]) and referencer_node.code_start_line == referencer_pos[1]
+                if self.reference_graph.add_edge(referencer_node, now_obj, special_reference_type):
+                    ref_count += 1
+        return ref_count
+
+    def get_callers(self, item: DocItem) -> Tuple[DocItem, ...]:
+        """Returns the objects that reference item."""
+        return self.reference_graph.get_callers(item)
+
+    def get_callees(self, item: DocItem) -> Tuple[DocItem, ...]:
+        """Returns the objects that item references."""
+        return self.reference_graph.get_callees(item)
+
+    def get_impact_set(self, items: List[DocItem], max_depth: Optional[int] = None) -> List[DocItem]:
+        """
+        Returns the objects whose documents may be affected when items change: everything that references
+        one of items directly or through a chain of references, nearest first.
+        """
+        return self.reference_graph.get_transitive_callers(items, max_depth)
+
+    def rank_by_fan_in(self, top_k: int = 10) -> List[Tuple[DocItem, int]]:
+        """Returns the top_k most referenced objects with their number of referencers."""
+        return self.reference_graph.rank_by_fan_in(top_k)
+
+    def rank_by_fan_out(self, top_k: int = 10) -> List[Tuple[DocItem, int]]:
+        """Returns the top_k objects that reference the most objects, with that number."""
+        return self.reference_graph.rank_by_fan_out(top_k)
+
+    def find_reference_cycles(self) -> List[List[DocItem]]:
+        """Returns the groups of objects that reference each other in a cycle."""
+        return self.reference_graph.find_cycles()
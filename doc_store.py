@@ -0,0 +1,190 @@
+import difflib
+import hashlib
+import os
+import threading
+import zlib
+
+from log import logger
+from settings import setting
+
+
+def hash_doc(text: str) -> str:
+    """The key of a document version in the DocStore: sha1 hex digest of its text."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+class DocStore:
+    """
+    文档的旧版本, 以内容的 hash 为键 zlib 压缩保存在检查点目录下的 doc_blobs/ 中, 内容相同的版本只保存一份。
+
+    put 只在内存中压缩并登记, 不写磁盘(生成文档的线程不等待磁盘); 写检查点的线程通过 `copy_to`
+    写出快照或日志记录引用的版本, 没有被引用过的版本一直留在内存中, 因此不会在写出后又被 `prune` 删除。
+    还没有写到任何目录的 DocStore(例如刚解析出来、还没有保存过的 MetaInfo)在第一次写出时绑定到那个目录。
+    保存后的文件不会被修改, 因此同一个目录可以同时被多个 DocStore 对象读取。
+    """
+
+    blob_dir_name = "doc_blobs"
+
+    def __init__(self, checkpoint_dir=None):
+        self.blob_dir = os.path.join(os.fspath(checkpoint_dir), self.blob_dir_name) if checkpoint_dir is not None else None
+        self._pending = {}  # hash -> 压缩后的内容, 还没有写到 blob_dir 的版本
+        self._lock = threading.Lock()
+
+    def _blob_path(self, doc_hash: str) -> str:
+        return os.path.join(self.blob_dir, doc_hash[:2], doc_hash)
+
+    def put(self, text: str) -> str:
+        """Registers a version and returns its hash, without touching disk."""
+        doc_hash = hash_doc(text)
+        with self._lock:
+            if doc_hash not in self._pending:
+                self._pending[doc_hash] = zlib.compress(text.encode("utf-8"))
+        return doc_hash
+
+    def get_compressed(self, doc_hash: str) -> bytes:
+        with self._lock:
+            compressed = self._pending.get(doc_hash)
+        if compressed is None:
+            if self.blob_dir is None:
+                raise KeyError(f"Document version {doc_hash} is not available")
+            with open(self._blob_path(doc_hash), "rb") as reader:
+                compressed = reader.read()
+        return compressed
+
+    def get(self, doc_hash: str) -> str:
+        return zlib.decompress(self.get_compressed(doc_hash)).decode("utf-8")
+
+    def has_blob(self, doc_hash: str) -> bool:
+        """Whether the version is saved in blob_dir, pending versions do not count."""
+        return self.blob_dir is not None and os.path.exists(self._blob_path(doc_hash))
+
+    def _write_blob(self, doc_hash: str, compressed: bytes):
+        blob_path = self._blob_path(doc_hash)
+        if os.path.exists(blob_path):
+            return
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with open(blob_path + ".tmp", "wb") as writer:
+            writer.write(compressed)
+        os.replace(blob_path + ".tmp", blob_path)
+
+    def copy_to(self, target: "DocStore", doc_hashes):
+        """
+        Saves the given versions in target.blob_dir, called on the writer thread.
+        A store that has not been saved anywhere yet is bound to target's directory.
+        """
+        with self._lock:
+            if self.blob_dir is None:
+                self.blob_dir = target.blob_dir
+        for doc_hash in doc_hashes:
+            if not target.has_blob(doc_hash):
+                target._write_blob(doc_hash, self.get_compressed(doc_hash))
+        if self.blob_dir == target.blob_dir:  # 已经保存在自己的目录中, 不再占用内存
+            with self._lock:
+                for doc_hash in doc_hashes:
+                    self._pending.pop(doc_hash, None)
+
+    def prune(self, doc_hashes):
+        """Removes the saved versions whose hash is not in doc_hashes."""
+        if self.blob_dir is None or not os.path.isdir(self.blob_dir):
+            return
+        doc_hashes = set(doc_hashes)
+        removed_count = 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            for blob_name in os.listdir(prefix_dir):
+                if blob_name not in doc_hashes:
+                    os.remove(os.path.join(prefix_dir, blob_name))
+                    removed_count += 1
+        if removed_count:
+            logger.info(f"Removed {removed_count} document versions that are no longer retained")
+
+
+class DocHistory:
+    """
+    一个对象的各个版本的文档, 代替原来的 md_content 列表, 读写方式与列表相同(append、[-1]、len、迭代、与列表比较)。
+
+    内存中只保留最新的版本; 更早的版本只记录 hash, 内容保存在 DocStore 中, 被访问(例如 `diff`)时才读取。
+    每次 append 后最多保留 setting.project.doc_history_retention 个旧版本。
+    层级信息中 md_content 只保存最新的版本, 旧版本的 hash 保存在 md_history 中(从旧到新)。
+    """
+
+    __slots__ = ("latest", "history", "store")
+
+    def __init__(self, latest=None, history=(), store=None):
+        self.latest = latest  # 最新版本的文档, 还没有文档时为 None
+        self.history = list(history)  # 旧版本的 hash, 从旧到新
+        self.store = store
+
+    @staticmethod
+    def from_versions(versions, history=(), store=None) -> "DocHistory":
+        """
+        Builds the history of an object from a checkpoint: versions is its md_content list, history its md_history.
+        Checkpoints written before the store existed keep every version in md_content, the older ones are moved to the store.
+        """
+        doc_history = DocHistory(store=store)
+        doc_history.history = list(history)
+        if versions:
+            if len(versions) > 1:
+                doc_history._get_store()
+                doc_history.history.extend(doc_history.store.put(text) for text in versions[:-1])
+            doc_history.latest = versions[-1]
+        return doc_history
+
+    def _get_store(self) -> DocStore:
+        if self.store is None:
+            self.store = DocStore()
+        return self.store
+
+    def __len__(self):
+        return len(self.history) + (self.latest is not None)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("document version index out of range")
+        if index == length - 1:
+            return self.latest
+        return self.store.get(self.history[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def __eq__(self, other):
+        if isinstance(other, (list, tuple, DocHistory)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"DocHistory(latest={self.latest!r}, history={self.history!r})"
+
+    def append(self, text: str):
+        if self.latest is not None:
+            self.history.append(self._get_store().put(self.latest))
+            retention = setting.project.doc_history_retention
+            if len(self.history) > retention:
+                del self.history[: len(self.history) - retention]
+        self.latest = text
+
+    def clear(self):
+        self.latest = None
+        self.history = []
+
+    def to_json(self):
+        """(md_content, md_history) as written to the hierarchy."""
+        return ([self.latest] if self.latest is not None else []), list(self.history)
+
+    def diff(self, older: int = -2, newer: int = -1) -> str:
+        """Unified diff between two versions, by default between the previous and the latest one."""
+        return "".join(difflib.unified_diff(
+            self[older].splitlines(keepends=True),
+            self[newer].splitlines(keepends=True),
+            fromfile=f"version {older}",
+            tofile=f"version {newer}",
+        ))
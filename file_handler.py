@@ -1,9 +1,52 @@
 import os
 import ast
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional
 from colorama import Fore, Style
 from tqdm import tqdm
+from ignore_matcher import IgnoreMatcher
+from log import logger
+from code_store import CodeStore, SourceBuffer, hash_code
+from parse_cache import ParseCache
 from settings import setting
 
+# generate_file_structure 的输出格式或内容发生变化时需要加1, 使旧的解析缓存失效
+PARSER_VERSION = 3
+
+_DEFINITION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+# 可能包含函数/类定义的节点, 表达式内部不可能出现定义
+_BLOCK_NODES = (ast.stmt, ast.excepthandler, ast.match_case)
+
+
+class DefinitionInfo(NamedTuple):
+    """A function or class found in a file, see `FileHandler.collect_definitions`."""
+    type: str
+    name: str
+    start_line: int
+    end_line: int
+    params: List[str]
+    parent: Optional[str]  # 直接包含它的函数/类的名字, 顶层对象为None
+    is_async: bool
+    decorators: List[str]
+    end_col: int
+
+    def to_structure(self):
+        return (self.type, self.name, self.start_line, self.end_line, self.params)
+
+
+def _get_params(args: ast.arguments) -> List[str]:
+    """All parameter names of a function, *args and **kwargs keep their stars."""
+    params = [arg.arg for arg in args.posonlyargs + args.args]
+    if args.vararg is not None:
+        params.append("*" + args.vararg.arg)
+    params.extend(arg.arg for arg in args.kwonlyargs)
+    if args.kwarg is not None:
+        params.append("**" + args.kwarg.arg)
+    return params
+
+
 class FileHandler:
     """
     历变更后的文件的循环中，为每个变更后文件（也就是当前文件）创建一个实例
@@ -19,60 +62,15 @@ class FileHandler:
         Check all files and folders in the given directory
         Return a list of files that are not ignored and have the '.py' extension.
         The returned file paths are relative to the self.directory.
+        Ignored directories (see `IgnoreMatcher.from_settings`) are pruned and never scanned.
 
         Returns:
             list: A list of paths to files that are not ignored and have the '.py' extension.
         """
-        not_ignored_files = []
-        for root, dirs, files in os.walk(self.repo_path):
-            dirs[:] = [
-                d
-                for d in dirs
-            ]
-
-            for file in files:
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, self.repo_path)
-                if file_path.endswith(".py"):
-                    not_ignored_files.append(relative_path)
-
-        return not_ignored_files
+        ignore_matcher = IgnoreMatcher.from_settings(self.repo_path)
+        return ignore_matcher.walk_files(self.repo_path, suffix=".py")
     
-    def add_parent_references(self, node, parent=None):
-        """
-        Adds a parent reference to each node in the AST.
-
-        Args:
-            node: The current node in the AST.
-
-        Returns:
-            None
-        """
-        for child in ast.iter_child_nodes(node):
-            child.parent = node
-            self.add_parent_references(child, node)
-
-    def get_end_lineno(self, node):
-        """
-        Get the end line number of a given node.
-
-        Args:
-            node: The node for which to find the end line number.
-
-        Returns:
-            int: The end line number of the node. Returns -1 if the node does not have a line number.
-        """
-        if not hasattr(node, "lineno"):
-            return -1  # 返回-1表示此节点没有行号
-
-        end_lineno = node.lineno
-        for child in ast.iter_child_nodes(node):
-            child_end = getattr(child, "end_lineno", None) or self.get_end_lineno(child)
-            if child_end > -1:  # 只更新当子节点有有效行号时
-                end_lineno = max(end_lineno, child_end)
-        return end_lineno
-    
-    def get_obj_code_info(self, code_type, code_name, start_line, end_line, params, file_path = None):
+    def get_obj_code_info(self, code_type, code_name, start_line, end_line, params, file_path = None, source = None, source_hash = None):
         """
         Get the code information for a given object.
 
@@ -81,11 +79,14 @@ class FileHandler:
             code_name (str): The name of the code.
             start_line (int): The starting line number of the code.
             end_line (int): The ending line number of the code.
-            parent (str): The parent of the code.
+            params (list): The parameters of the code.
             file_path (str, optional): The file path. Defaults to None.
+            source (SourceBuffer, optional): The already loaded source of the file. If None, the file is read.
+            source_hash (str, optional): The sha1 of the raw content of the file, required together with source.
 
         Returns:
-            dict: A dictionary containing the code information.
+            dict: A dictionary containing the code information. The code itself is not included, only its
+                line range and hashes, see `CodeStore.get_code_content`.
         """
 
         code_info = {}
@@ -96,64 +97,82 @@ class FileHandler:
         code_info['code_end_line'] = end_line
         code_info['params'] = params
 
-        with open(
-            os.path.join(
-                self.repo_path, file_path if file_path != None else self.file_path
-            ),
-            "r",
-            encoding="utf-8",
-        ) as code_file:
-            lines = code_file.readlines()
-            code_content = "".join(lines[start_line - 1 : end_line])
-            # 获取对象名称在第一行代码中的位置
-            name_column = lines[start_line - 1].find(code_name)
-            # 判断代码中是否有return字样
-            if "return" in code_content:
-                have_return = True
-            else:
-                have_return = False
-
-            code_info["have_return"] = have_return
-            # # 使用 json.dumps 来转义字符串，并去掉首尾的引号
-            # code_info['code_content'] = json.dumps(code_content)[1:-1]
-            code_info["code_content"] = code_content
-            code_info["name_column"] = name_column
+        if source is None or source_hash is None:
+            with open(os.path.join(self.repo_path, file_path if file_path != None else self.file_path), "rb") as f:
+                raw = f.read()
+            source = SourceBuffer.from_bytes(raw)
+            source_hash = hashlib.sha1(raw).hexdigest()
+        # 判断代码中是否有return字样
+        code_info["have_return"] = source.contains("return", start_line, end_line)
+        # 源码不保存在层级信息里(类的源码已经包含了它的方法), 只记录hash, 需要时按行号从文件或源码快照中切片
+        code_info["code_hash"] = hash_code(source.get_lines(start_line, end_line))
+        code_info["source_hash"] = source_hash
+        # 获取对象名称在第一行代码中的位置
+        code_info["name_column"] = source.find_in_line(code_name, start_line)
 
         return code_info
 
+    def collect_definitions(self, code_content) -> List[DefinitionInfo]:
+        """
+        Collects every function and class of a file in a single traversal of its AST.
+
+        Definitions are returned in the same breadth-first order as `ast.walk`. Only statement
+        nodes are queued, because a def can never appear inside an expression. The end line is the
+        native `end_lineno`, and the enclosing definition is tracked while the tree is traversed.
+
+        Args:
+            code_content: The code content of the whole file to be parsed.
+
+        Returns:
+            List[DefinitionInfo]: The definitions of the file.
+        """
+        tree = ast.parse(code_content)
+        definitions = []
+        queue = deque([(tree, None)])
+        while queue:
+            node, parent_name = queue.popleft()
+            if isinstance(node, _DEFINITION_NODES):
+                definitions.append(
+                    DefinitionInfo(
+                        type=type(node).__name__,
+                        name=node.name,
+                        start_line=node.lineno,
+                        end_line=node.end_lineno,
+                        params=[] if isinstance(node, ast.ClassDef) else _get_params(node.args),
+                        parent=parent_name,
+                        is_async=isinstance(node, ast.AsyncFunctionDef),
+                        decorators=[ast.unparse(decorator) for decorator in node.decorator_list],
+                        end_col=node.end_col_offset,
+                    )
+                )
+                parent_name = node.name
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, _BLOCK_NODES):
+                    queue.append((child, parent_name))
+        return definitions
+
     def get_functions_and_classes(self, code_content):
         """
         Retrieves all functions, classes, their parameters (if any), and their hierarchical relationships.
-        Output Examples: [('FunctionDef', 'AI_give_params', 86, 95, None, ['param1', 'param2']), ('ClassDef', 'PipelineEngine', 97, 104, None, []), ('FunctionDef', 'get_all_pys', 99, 104, 'PipelineEngine', ['param1'])]
-        On the example above, PipelineEngine is the Father structure for get_all_pys.
+        Output Examples: [('FunctionDef', 'AI_give_params', 86, 95, ['param1', 'param2']), ('ClassDef', 'PipelineEngine', 97, 104, []), ('FunctionDef', 'get_all_pys', 99, 104, ['param1'])]
+        The parent of each object, its decorators and whether it is async are available from `collect_definitions`.
 
         Args:
             code_content: The code content of the whole file to be parsed.
 
         Returns:
             A list of tuples containing the type of the node (FunctionDef, ClassDef, AsyncFunctionDef),
-            the name of the node, the starting line number, the ending line number, the name of the parent node, and a list of parameters (if any).
+            the name of the node, the starting line number, the ending line number and a list of parameters (if any).
         """
-        tree = ast.parse(code_content)
-        self.add_parent_references(tree)
-        functions_and_classes = []
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.FunctionDef, ast.ClassDef, ast.AsyncFunctionDef)):
-                start_line = node.lineno
-                end_line = self.get_end_lineno(node)
-                parameters = [arg.arg for arg in node.args.args] if 'args' in dir(node) else []
-                all_names = [item[1] for item in functions_and_classes]
-                functions_and_classes.append(
-                    (type(node).__name__, node.name, start_line, end_line, parameters)
-                )
-        return functions_and_classes
+        return [definition.to_structure() for definition in self.collect_definitions(code_content)]
 
-    def generate_file_structure(self, file_path):
+    def generate_file_structure(self, file_path, raw: Optional[bytes] = None):
         """
         Generates the file structure for the given file path.
 
         Args:
             file_path (str): The relative path of the file.
+            raw (bytes, optional): The content of the file, if the caller has already read it.
 
         Returns:
             dict: A dictionary containing the file path and the generated file structure.
@@ -176,32 +195,150 @@ class FileHandler:
             }
         }
         """
-        with open(os.path.join(self.repo_path, file_path), "r", encoding="utf-8") as f:
-            content = f.read()
-            structures = self.get_functions_and_classes(content)
-            file_objects = [] #以列表的形式存储
-            for struct in structures:
-                structure_type, name, start_line, end_line, params = struct
-                code_info = self.get_obj_code_info(structure_type, name, start_line, end_line, params, file_path)
-                file_objects.append(code_info)
+        if raw is None:
+            with open(os.path.join(self.repo_path, file_path), "rb") as f:
+                raw = f.read()
+        source = SourceBuffer.from_bytes(raw)
+        source_hash = hashlib.sha1(raw).hexdigest()  # 与 hash_file_content 相同
+        structures = self.get_functions_and_classes(source.text)
+        file_objects = [] #以列表的形式存储
+        for struct in structures:
+            structure_type, name, start_line, end_line, params = struct
+            code_info = self.get_obj_code_info(structure_type, name, start_line, end_line, params, file_path, source, source_hash)
+            file_objects.append(code_info)
 
+        if file_objects:  # 保存这个版本的源码, 文件之后被修改时仍然可以取到生成文档时的代码
+            CodeStore(self.repo_path, self.project_hierarchy).put_source(source_hash, source.text)
         return file_objects
 
     def generate_overall_structure(self, file_path_reflections, jump_files) -> dict:
+        """
+        Generates the structure of every not-ignored file in the repository.
+        This collects `iter_file_structures` into a dict, use the generator directly to avoid
+        holding the whole repository in memory.
+
+        Returns:
+            dict: A dictionary mapping each relative file path to its file structure.
+        """
+        return dict(self.iter_file_structures(file_path_reflections, jump_files))
+
+    def iter_file_structures(self, file_path_reflections=None, jump_files=None):
+        """
+        Yields the structure of every not-ignored file as soon as it is ready.
+
+        When `setting.project.use_parse_cache` is set, files whose content hash is found in the
+        parse cache under the hierarchy directory are not parsed again.
+        When `setting.project.parse_process_count` is greater than 1, files are parsed in a process pool
+        and at most `setting.project.parse_in_flight_window` files are parsed or waiting to be consumed
+        at any time. Files are always yielded in the order returned by `check_files_and_folders`, so the
+        result (and the checkpoint built from it) is identical to a serial run.
+        Once every file is yielded, the source snapshots of file versions that are gone are removed.
+
+        Yields:
+            tuple: (file_path, file_objects) for each file that was parsed successfully.
+        """
+        not_ignored_files = self.check_files_and_folders()
+        parse_cache = None
+        if setting.project.use_parse_cache:
+            parse_cache = ParseCache(self.project_hierarchy, PARSER_VERSION)
+        code_store = CodeStore(self.repo_path, self.project_hierarchy)
+        source_hashes = set()  # 本次用到的源码快照, 其他的都是旧版本
+
+        process_count = min(setting.project.parse_process_count, len(not_ignored_files))
+        executor = ProcessPoolExecutor(max_workers=process_count) if process_count > 1 else None
+        in_flight_window = setting.project.parse_in_flight_window if executor is not None else 1
+
+        bar = tqdm(total=len(not_ignored_files))
+        pending = deque()  # 按文件顺序排列的 _start_parse 的结果
 
-        repo_structure = {}
-        bar = tqdm(self.check_files_and_folders())
-        not_ignored_files = []
-        for not_ignored_files in bar:
-            normal_file_names = not_ignored_files
+        def finish_parse(parse_task):
+            for file_path, file_objects in self._finish_parse(parse_task, parse_cache, bar):
+                if file_objects:
+                    source_hashes.add(file_objects[0]["source_hash"])
+                yield file_path, file_objects
+
+        try:
+            for file_path in not_ignored_files:
+                pending.append(self._start_parse(file_path, parse_cache, code_store, executor))
+                while len(pending) >= in_flight_window:
+                    yield from finish_parse(pending.popleft())
+            while pending:
+                yield from finish_parse(pending.popleft())
+        finally:
+            bar.close()
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        code_store.prune(source_hashes)
+        if parse_cache is not None:
+            parse_cache.prune(not_ignored_files)
+            parse_cache.save()
+            parse_cache.log_statistics()
+
+    def _start_parse(self, file_path, parse_cache, code_store, executor):
+        """
+        Looks the file up in the parse cache, and submits it to the process pool on a miss.
+        A hit whose source snapshot is missing from code_store is parsed again, which saves the snapshot.
+
+        Returns:
+            tuple: (file_path, content_hash, cached_objects, future, raw), raw is the content read for the cache
+            lookup, kept for a serial parse so that the file is read only once.
+        """
+        content_hash, cached_objects, future, raw = None, None, None, None
+        if parse_cache is not None:
             try:
-                repo_structure[normal_file_names] = self.generate_file_structure(
-                    not_ignored_files
-                )
-            except Exception as e:
-                print(
-                    f"Alert: An error occurred while generating file structure for {not_ignored_files}: {e}"
-                )
-                continue
-            bar.set_description(f"generating repo structure: {not_ignored_files}")
-        return repo_structure
\ No newline at end of file
+                with open(os.path.join(self.repo_path, file_path), "rb") as f:
+                    raw = f.read()
+                content_hash = hashlib.sha1(raw).hexdigest()  # 与 hash_file_content 相同
+                cached_objects = parse_cache.get(file_path, content_hash)
+            except OSError:
+                pass  # 读取失败的文件交给解析流程报错
+            if cached_objects and not code_store.has_source(content_hash):
+                cached_objects = None
+        if cached_objects is not None:
+            raw = None
+        elif executor is not None:
+            future = executor.submit(parse_file_structure, self.repo_path, file_path)
+            raw = None  # 工作进程自己读取文件, 不把内容发送过去
+        return file_path, content_hash, cached_objects, future, raw
+
+    def _finish_parse(self, parse_task, parse_cache, bar):
+        """Waits for one file started by `_start_parse` and yields its structure, if parsing succeeded."""
+        file_path, content_hash, cached_objects, future, raw = parse_task
+        bar.update(1)
+        bar.set_description(f"generating repo structure: {file_path}")
+        if cached_objects is not None:
+            yield file_path, cached_objects
+            return
+        if future is not None:
+            _, file_objects, error = future.result()
+        else:
+            _, file_objects, error = parse_file_structure(self.repo_path, file_path, raw)
+        if error is not None:
+            print(
+                f"Alert: An error occurred while generating file structure for {file_path}: {error}"
+            )
+            return
+        if parse_cache is not None and content_hash is not None:
+            # 工作进程是重新读取文件后解析的, 文件可能在两次读取之间被修改, 以实际解析的内容的 hash 为键
+            parse_cache.put(file_path, file_objects[0]["source_hash"] if file_objects else content_hash, file_objects)
+        yield file_path, file_objects
+
+
+def parse_file_structure(repo_path, file_path, raw: Optional[bytes] = None):
+    """
+    Parses a single file, catching any error so that one broken file does not stop the whole run.
+    Defined at module level so that it can be sent to worker processes.
+
+    Args:
+        repo_path (str): The path of the repository.
+        file_path (str): The relative path of the file.
+        raw (bytes, optional): The content of the file, if it has already been read.
+
+    Returns:
+        tuple: (file_path, file_objects, error), error is None on success and the error message otherwise.
+    """
+    try:
+        return file_path, FileHandler(repo_path, file_path).generate_file_structure(file_path, raw), None
+    except Exception as e:
+        return file_path, None, str(e)
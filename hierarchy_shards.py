@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+
+from doc_store import DocStore
+from log import logger
+
+
+class ShardStore:
+    """
+    分片保存的层级信息, 代替单个的 project_hierarchy.json。
+
+    层级目录下的 hierarchy/manifest.json 按顺序记录仓库中的所有文件, 每个文件的对象列表
+    (即原来 project_hierarchy.json 中的一个值)单独保存在 hierarchy/shards/ 下的一个分片里。
+    分片以内容的 hash 命名, 写新的快照时不会覆盖旧 manifest 引用的分片: 替换 manifest 的那一刻才切换到新的快照,
+    之后再删除不再被引用的分片, 因此写到一半崩溃时旧的快照仍然完整。
+    读取时只需要解析 manifest 就能建立到file节点为止的树, 文件中的对象在第一次被访问时才从分片加载,
+    因此只涉及少数文件的操作不需要解析整个仓库的层级信息。
+    """
+
+    dir_name = "hierarchy"
+    manifest_file_name = "manifest.json"
+    format_version = 1
+
+    def __init__(self, checkpoint_dir):
+        self.root = os.path.join(os.fspath(checkpoint_dir), self.dir_name)
+        self.shard_dir = os.path.join(self.root, "shards")
+        self.manifest_path = os.path.join(self.root, self.manifest_file_name)
+        self.loaded_count = 0  # 从这个目录加载过的分片数
+        self._shard_names = None  # 文件路径 -> 分片名, 来自最近一次读取或写出的 manifest
+        self.doc_store = DocStore(checkpoint_dir)  # 分片中 md_history 引用的文档旧版本
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def close(self):
+        """Shards are opened per read, nothing to release. Same interface as `BinaryCheckpoint.close`."""
+
+    def shard_name(self, file_name: str) -> str:
+        """The shard of file_name in the manifest this store was loaded from (or last wrote)."""
+        if self._shard_names is None:
+            self.read_manifest()
+        return self._shard_names[file_name]
+
+    def read_manifest(self):
+        """
+        Returns:
+            dict: file path -> {"shard": shard name, "depth": depth of the file node}, in tree order.
+        """
+        with open(self.manifest_path, "r", encoding="utf-8") as reader:
+            manifest = json.load(reader)
+        if manifest.get("format_version") != self.format_version:
+            raise ValueError(f"Unsupported hierarchy manifest version: {manifest.get('format_version')}")
+        self._shard_names = {file_name: file_info["shard"] for file_name, file_info in manifest["files"].items()}
+        return manifest["files"]
+
+    def write_manifest(self, files):
+        """Replaces the manifest, which switches the directory to the snapshot whose shards it lists."""
+        self._write_json(self.manifest_path, {"format_version": self.format_version, "files": files})
+        self._shard_names = {file_name: file_info["shard"] for file_name, file_info in files.items()}
+
+    def read_shard(self, file_name: str):
+        with open(os.path.join(self.shard_dir, self.shard_name(file_name)), "r", encoding="utf-8") as reader:
+            file_content = json.load(reader)
+        self.loaded_count += 1
+        return file_content
+
+    def write_shard(self, file_content) -> str:
+        """
+        Writes a shard named after the hash of its content and returns the name. A shard with the same name
+        already holds the same content, so it is left untouched.
+        """
+        data = json.dumps(file_content, ensure_ascii=False).encode("utf-8")
+        shard_name = hashlib.sha1(data).hexdigest()[:20] + ".json"
+        shard_path = os.path.join(self.shard_dir, shard_name)
+        if not os.path.exists(shard_path):
+            os.makedirs(self.shard_dir, exist_ok=True)
+            with open(shard_path + ".tmp", "wb") as writer:
+                writer.write(data)
+            os.replace(shard_path + ".tmp", shard_path)
+        return shard_name
+
+    def prune(self, files):
+        """Removes the shards (and temp files of interrupted writes) that the manifest files does not reference."""
+        if not os.path.isdir(self.shard_dir):
+            return
+        existing_shards = {file_info["shard"] for file_info in files.values()}
+        removed_count = 0
+        for shard_file in os.listdir(self.shard_dir):
+            if shard_file not in existing_shards:
+                os.remove(os.path.join(self.shard_dir, shard_file))
+                removed_count += 1
+        if removed_count:
+            logger.info(f"Removed {removed_count} hierarchy shards that are no longer referenced")
+
+    @staticmethod
+    def _write_json(path, value):
+        """先写临时文件再替换, 中途崩溃不会留下写了一半的文件"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as writer:
+            writer.write(json.dumps(value, ensure_ascii=False))
+        os.replace(path + ".tmp", path)
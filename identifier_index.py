@@ -0,0 +1,82 @@
+import io
+import os
+import re
+import tokenize
+from typing import Dict, Optional, Set
+
+from log import logger
+
+_IDENTIFIER_PATTERN = re.compile(r"[^\W\d]\w*")
+
+
+def iter_python_files(repo_path):
+    """Paths relative to repo_path of the python files Jedi searches for references, hidden directories skipped."""
+    for root, dir_names, file_names in os.walk(repo_path):
+        dir_names[:] = sorted(name for name in dir_names if not name.startswith(".") and name != "__pycache__")
+        for file_name in sorted(file_names):
+            if file_name.endswith(".py"):
+                yield os.path.relpath(os.path.join(root, file_name), repo_path).replace(os.sep, "/")
+
+
+class IdentifierIndex:
+    """
+    标识符倒排索引: 名字 -> {包含这个名字的文件: 出现次数}, 对仓库中每个文件 tokenize 一遍得到。
+
+    Jedi 找到的引用者一定是同名的名字, 因此一个名字在其他文件中没有出现时, 它的引用只可能在定义它的文件中,
+    ReferenceResolver 据此跳过在整个项目中的查找(见 `ReferenceResolver.find_references`)。
+    注释与普通字符串中的单词不算, f-string 中的单词都算(Python 3.12 以前 f-string 是一个 STRING token);
+    无法 tokenize 的文件按正则取出所有单词, 宁可多算也不漏算。
+    """
+
+    def __init__(self, repo_path, file_paths=None):
+        self.repo_path = os.fspath(repo_path)
+        self._files: Dict[str, Dict[str, int]] = {}  # 名字 -> {文件相对路径: 出现次数}
+        self.file_paths = set()  # 已经索引的文件
+        for file_path in file_paths if file_paths is not None else iter_python_files(self.repo_path):
+            self.add_file(file_path)
+
+    def add_file(self, file_path: str):
+        try:
+            with open(os.path.join(self.repo_path, file_path), "rb") as reader:
+                data = reader.read()
+        except OSError as e:
+            logger.info(f"Identifier index skips {file_path}: {e}")
+            return
+        counts: Dict[str, int] = {}
+        try:
+            for token in tokenize.tokenize(io.BytesIO(data).readline):
+                if token.type == tokenize.NAME:
+                    counts[token.string] = counts.get(token.string, 0) + 1
+                elif token.type == tokenize.STRING and "f" in token.string[: token.string.find(token.string[-1])].lower():
+                    for name in _IDENTIFIER_PATTERN.findall(token.string):
+                        counts[name] = counts.get(name, 0) + 1
+        except (tokenize.TokenError, SyntaxError, UnicodeDecodeError):
+            counts = {}
+            for name in _IDENTIFIER_PATTERN.findall(data.decode("utf-8", errors="replace")):
+                counts[name] = counts.get(name, 0) + 1
+        for name, count in counts.items():
+            self._files.setdefault(name, {})[file_path] = count
+        self.file_paths.add(file_path)
+
+    def files_containing(self, name: str) -> Dict[str, int]:
+        """{file path: number of occurrences} of the files that contain name as an identifier."""
+        return self._files.get(name, {})
+
+    def names_in_file(self, file_path: str) -> Set[str]:
+        """The names that occur in file_path. Scans the whole index, meant for a few files at a time."""
+        return {name for name, files in self._files.items() if file_path in files}
+
+    def get_lookup_scope(self, name: str, file_path: str, in_file_only=False) -> Optional[str]:
+        """
+        How the references of name defined in file_path have to be searched.
+
+        Returns:
+            Optional[str]: None if name occurs nowhere but its own definition (nothing to search),
+            "file" if it occurs only in file_path, "project" otherwise (or if file_path is not indexed).
+        """
+        if file_path not in self.file_paths:
+            return "file" if in_file_only else "project"
+        files = self.files_containing(name)
+        if not in_file_only and any(other_path != file_path for other_path in files):
+            return "project"
+        return "file" if files.get(file_path, 0) > 1 else None
@@ -0,0 +1,226 @@
+import os
+import re
+
+from settings import setting
+
+# 无论 .gitignore 如何配置都不需要扫描的目录: 版本控制、虚拟环境、依赖和构建产物
+DEFAULT_IGNORE_PATTERNS = [
+    ".git/",
+    ".hg/",
+    ".svn/",
+    "__pycache__/",
+    "node_modules/",
+    ".venv/",
+    "venv/",
+    ".tox/",
+    ".nox/",
+    ".mypy_cache/",
+    ".pytest_cache/",
+    ".ruff_cache/",
+    "*.egg-info/",
+    # 只忽略仓库根目录下的构建产物, 包里名为 build/dist 的子包仍然是源码
+    "/build/",
+    "/dist/",
+]
+
+
+def _glob_to_regex(pattern: str):
+    """Translates a .gitignore-style glob into a compiled regex matched against a whole name or path."""
+    i, n = 0, len(pattern)
+    regex = []
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**/", i):  # "**/" 匹配零层或任意多层目录
+                regex.append("(?:.*/)?")
+                i += 3
+                continue
+            if pattern.startswith("**", i):  # 末尾的 "**" 匹配其下的所有内容
+                regex.append(".*")
+                i += 2
+                continue
+            regex.append("[^/]*")
+        elif c == "?":
+            regex.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                regex.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex.append("[" + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+                continue
+        else:
+            regex.append(re.escape(c))
+        i += 1
+    return re.compile("".join(regex))
+
+
+class IgnoreMatcher:
+    """
+    编译后的忽略规则, 支持 .gitignore 风格的 glob 以及 ProjectSettings.ignore_list。
+
+    规则按添加顺序编号, 同一路径命中多条规则时以最后一条为准(因此支持 "!" 取反)。
+    一个目录被忽略后, 其下的所有内容都被忽略。
+    不含通配符的规则放在字典里, 因此判断一个路径是否被忽略的代价与路径深度成正比。
+    """
+
+    def __init__(self, patterns=()):
+        self._rule_count = 0
+        self._name_literals = {}  # 文件/目录名 -> [(rule_id, negate, dir_only)]
+        self._path_literals = {}  # 相对仓库根目录的路径 -> [(rule_id, negate, dir_only)]
+        self._name_globs = []  # [(regex, rule_id, negate, dir_only)]
+        self._path_globs = []
+        for pattern in patterns:
+            self.add_pattern(pattern)
+
+    @staticmethod
+    def from_settings(repo_path=None, ignore_list=None) -> "IgnoreMatcher":
+        """
+        Builds the matcher used for the target repository: the built-in defaults, the documentation
+        output directories, the repository's .gitignore and `ProjectSettings.ignore_list`.
+        """
+        repo_path = setting.project.target_repo if repo_path is None else repo_path
+        ignore_list = setting.project.ignore_list if ignore_list is None else ignore_list
+
+        matcher = IgnoreMatcher(DEFAULT_IGNORE_PATTERNS)
+        for output_dir in [setting.project.hierarchy_name, setting.project.markdown_docs_name]:
+            if output_dir and not os.path.isabs(output_dir):
+                matcher.add_pattern("/" + output_dir.strip("/\\") + "/")
+        gitignore_path = os.path.join(repo_path, ".gitignore")
+        if os.path.isfile(gitignore_path):
+            with open(gitignore_path, "r", encoding="utf-8", errors="ignore") as reader:
+                for line in reader:
+                    matcher.add_pattern(line)
+        matcher.add_ignore_list(ignore_list)
+        return matcher
+
+    def add_ignore_list(self, ignore_list):
+        """Each entry of ignore_list is a file or directory path relative to the repository root, globs allowed."""
+        for ignore_item in ignore_list:
+            ignore_item = ignore_item.replace(os.sep, "/").strip("/")
+            if ignore_item:
+                self.add_pattern("/" + ignore_item)
+
+    def add_pattern(self, pattern: str):
+        """Compiles one line of .gitignore syntax. Blank lines and comments are skipped."""
+        pattern = pattern.rstrip("\r\n").rstrip(" ")
+        if pattern == "" or pattern.startswith("#"):
+            return
+        negate = pattern.startswith("!")
+        if negate:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\"):  # "\#" 和 "\!" 表示字面量
+            pattern = pattern[1:]
+        dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        if pattern.startswith("**/") and "/" not in pattern[3:]:
+            pattern = pattern[3:]  # "**/foo" 与 "foo" 等价
+        anchored = "/" in pattern
+        pattern = pattern.lstrip("/")
+        if pattern == "":
+            return
+
+        rule = (self._rule_count, negate, dir_only)
+        self._rule_count += 1
+        is_glob = any(c in pattern for c in "*?[")
+        if anchored:
+            if is_glob:
+                self._path_globs.append((_glob_to_regex(pattern),) + rule)
+            else:
+                self._path_literals.setdefault(pattern, []).append(rule)
+        else:
+            if is_glob:
+                self._name_globs.append((_glob_to_regex(pattern),) + rule)
+            else:
+                self._name_literals.setdefault(pattern, []).append(rule)
+
+    def is_entry_ignored(self, rel_path: str, name: str, is_dir: bool) -> bool:
+        """
+        Checks a single path against the rules, without looking at its parent directories.
+        Used by walkers that never descend into ignored directories.
+
+        Args:
+            rel_path (str): The path relative to the repository root, separated by "/".
+            name (str): The last component of rel_path.
+            is_dir (bool): Whether the path is a directory.
+        """
+        best_rule_id = -1
+        ignored = False
+        candidates = self._name_literals.get(name, ()), self._path_literals.get(rel_path, ())
+        for rules in candidates:
+            for rule_id, negate, dir_only in rules:
+                if rule_id > best_rule_id and (is_dir or not dir_only):
+                    best_rule_id, ignored = rule_id, not negate
+        for globs, target in ((self._name_globs, name), (self._path_globs, rel_path)):
+            for regex, rule_id, negate, dir_only in globs:
+                if rule_id > best_rule_id and (is_dir or not dir_only) and regex.fullmatch(target):
+                    best_rule_id, ignored = rule_id, not negate
+        return ignored
+
+    def is_ignored(self, rel_path: str, is_dir: bool = False) -> bool:
+        """
+        Checks whether a path relative to the repository root is ignored, either by itself or because
+        one of its parent directories is ignored.
+        """
+        parts = [part for part in rel_path.replace(os.sep, "/").split("/") if part not in ("", ".")]
+        prefix = ""
+        for pos, part in enumerate(parts):
+            prefix = part if prefix == "" else prefix + "/" + part
+            if self.is_entry_ignored(prefix, part, is_dir or pos < len(parts) - 1):
+                return True
+        return False
+
+    def iter_entries(self, repo_path, rel_dir="", recursive=True):
+        """
+        Walks repo_path with os.scandir, never entering ignored directories.
+        Entries are visited in name order: the files of a directory first, then its sub directories.
+
+        Args:
+            rel_dir (str): Only walk this directory of the repo (which is assumed not to be ignored).
+            recursive (bool): Also walk the sub directories, otherwise only list the entries of rel_dir.
+
+        Yields:
+            tuple: (rel_path, is_dir) for every not-ignored entry, rel_path is joined with os.sep.
+        """
+        stack = [rel_dir]
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                with os.scandir(os.path.join(repo_path, rel_dir)) as scanner:
+                    entries = sorted(scanner, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            sub_dirs = []
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                try:
+                    is_dir = entry.is_dir(follow_symlinks=False)
+                except OSError:
+                    continue
+                if self.is_entry_ignored(rel_path.replace(os.sep, "/"), entry.name, is_dir):
+                    continue
+                if is_dir:
+                    sub_dirs.append(rel_path)
+                else:
+                    yield rel_path, False
+            for rel_path in sub_dirs:
+                yield rel_path, True
+            if recursive:
+                stack.extend(reversed(sub_dirs))
+
+    def walk_files(self, repo_path, suffix=".py"):
+        """
+        Lists the not-ignored files under repo_path, see `iter_entries`.
+
+        Returns:
+            list: Paths relative to repo_path, joined with os.sep.
+        """
+        return [
+            rel_path
+            for rel_path, is_dir in self.iter_entries(repo_path)
+            if not is_dir and rel_path.endswith(suffix)
+        ]
@@ -2,10 +2,15 @@ from dotenv import load_dotenv
 
 load_dotenv(dotenv_path=".env.template")
 
+import sys
+
 from runner import Runner
 
-runner = Runner()
-runner.run()
+if __name__ == "__main__":  # 子进程(spawn)会重新导入本模块, 不能在导入时启动 Runner
+    runner = Runner()
+    runner.run()
+    if "--watch" in sys.argv:  # 首次生成后常驻, 只更新变化的文件
+        runner.watch()
 
 
 
@@ -0,0 +1,90 @@
+import copy
+import hashlib
+import json
+import os
+
+from log import logger
+
+
+def hash_file_content(abs_file_path) -> str:
+    """Returns the sha1 hex digest of the raw bytes of a file."""
+    with open(abs_file_path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+class ParseCache:
+    """
+    持久化的解析缓存, 保存在层级目录(.project_doc_record)下。
+    以文件内容hash和解析器版本为键, 缓存 FileHandler.generate_file_structure 返回的 file_objects,
+    内容没有变化的文件可以直接从缓存读取, 不再需要 ast.parse。
+    """
+
+    cache_file_name = "parse_cache.json"
+
+    def __init__(self, cache_dir, parser_version: int):
+        self.cache_path = os.path.join(cache_dir, self.cache_file_name)
+        self.parser_version = parser_version
+        self.entries = {}  # 相对路径 -> {"hash": 内容hash, "file_objects": [...]}
+        self.hit_count = 0
+        self.miss_count = 0
+        self.stale_count = 0
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as reader:
+                cache_json = json.load(reader)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable parse cache {self.cache_path}: {e}")
+            return
+        if cache_json.get("parser_version") != self.parser_version:
+            logger.info("Parser version changed, parse cache is discarded")
+            self._dirty = True
+            return
+        self.entries = cache_json.get("files", {})
+
+    def get(self, file_path, content_hash):
+        """
+        Returns a copy of the cached file_objects of a file, or None if the file is not cached or its content changed.
+        Callers may modify the returned list, the cached entry is not affected.
+        """
+        entry = self.entries.get(file_path)
+        if entry is not None and entry["hash"] == content_hash:
+            self.hit_count += 1
+            return copy.deepcopy(entry["file_objects"])
+        self.miss_count += 1
+        return None
+
+    def put(self, file_path, content_hash, file_objects):
+        self.entries[file_path] = {"hash": content_hash, "file_objects": copy.deepcopy(file_objects)}
+        self._dirty = True
+
+    def prune(self, existing_file_paths):
+        """Removes the entries of files that no longer exist in the repository."""
+        existing_file_paths = set(existing_file_paths)
+        for file_path in [path for path in self.entries if path not in existing_file_paths]:
+            del self.entries[file_path]
+            self.stale_count += 1
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        # 先写临时文件再替换, 中断时不会留下写了一半的缓存
+        with open(self.cache_path + ".tmp", "w", encoding="utf-8") as writer:
+            json.dump(
+                {"parser_version": self.parser_version, "files": self.entries},
+                writer,
+                ensure_ascii=False,
+            )
+        os.replace(self.cache_path + ".tmp", self.cache_path)
+        self._dirty = False
+
+    def log_statistics(self):
+        logger.info(
+            f"Parse cache: {self.hit_count} hit, {self.miss_count} miss, {self.stale_count} stale entries removed"
+        )
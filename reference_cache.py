@@ -0,0 +1,215 @@
+import ast
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Set
+
+import jedi
+
+from identifier_index import IdentifierIndex
+from log import logger
+from parse_cache import hash_file_content
+
+REFERENCE_CACHE_VERSION = 2
+
+
+class ReferenceCache:
+    """
+    持久化的引用缓存, 与 ParseCache 一样保存在层级目录(.project_doc_record)下。
+
+    以定义对象的文件为单位, 缓存 parse_reference 对文件中每个对象查到的引用位置 (文件, 行, 列)。
+    一个文件的查找结果只取决于可能引用它的文件, 以及推断这些引用时会经过的模块, 因此缓存的键是以下内容的 hash:
+    - 文件中要查找的对象 (名字, 行, 列, in_file_only);
+    - 定义文件与所有包含这些名字的文件(见 IdentifierIndex), 以及它们在仓库中递归导入的模块的内容 hash;
+    - resolver 的配置 resolver_options (use_static_references、use_identifier_index), 不同配置查到的引用可能不同。
+    这些文件都没有变化时直接使用缓存的位置, 由 MetaInfo 重新映射到 DocItem; 新增或删除了包含这些名字的文件、
+    导入的模块改变时键也会改变, 文件会被重新查找。Jedi 版本不同时整个缓存作废。
+
+    每个文件导入了哪些仓库中的模块也以内容 hash 为键缓存在同一个文件中, 内容没有变化的文件不需要重新 ast.parse。
+    """
+
+    cache_file_name = "reference_cache.json"
+
+    def __init__(self, cache_dir, repo_path, index: IdentifierIndex, resolver_options: Optional[Dict[str, Any]] = None):
+        self.cache_path = os.path.join(cache_dir, self.cache_file_name)
+        self.repo_path = os.fspath(repo_path)
+        self.index = index
+        self.resolver_options = resolver_options or {}  # 查找引用时 resolver 的配置, 是键的一部分
+        self.entries = {}  # 定义文件相对路径 -> {"key": 键, "references": 与查找的对象一一对应的引用位置列表}
+        self.imports = {}  # 相对路径 -> {"hash": 内容hash, "modules": 可能导入的模块路径(不含后缀)}
+        self.hit_count = 0
+        self.miss_count = 0
+        self.stale_count = 0
+        self._content_hashes: Dict[str, Optional[str]] = {}
+        self._closures: Dict[str, Optional[Set[str]]] = {}  # 文件 -> 递归导入的仓库文件(含自身), None 表示无法确定
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as reader:
+                cache_json = json.load(reader)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable reference cache {self.cache_path}: {e}")
+            return
+        if cache_json.get("version") != REFERENCE_CACHE_VERSION or cache_json.get("jedi_version") != jedi.__version__:
+            logger.info("Reference cache version or Jedi version changed, reference cache is discarded")
+            self._dirty = True
+            return
+        self.entries = cache_json.get("files", {})
+        self.imports = cache_json.get("imports", {})
+
+    def get_key(self, file_path: str, lookups) -> str:
+        """
+        Args:
+            file_path (str): The file that defines the objects.
+            lookups: (name, line, column, in_file_only) of every object of the file, in lookup order.
+        """
+        dependencies = set(self._get_closure(file_path) or self.index.file_paths)
+        for name, _, _, in_file_only in lookups:
+            if in_file_only:
+                continue
+            for candidate_path in self.index.files_containing(name):
+                if candidate_path not in dependencies:
+                    closure = self._get_closure(candidate_path)
+                    dependencies.update(closure if closure is not None else self.index.file_paths)
+        key_json = json.dumps(
+            [
+                sorted(self.resolver_options.items()),
+                list(lookups),
+                sorted((path, self._get_content_hash(path)) for path in dependencies),
+            ],
+            ensure_ascii=False,
+        )
+        return hashlib.sha1(key_json.encode("utf-8")).hexdigest()
+
+    def get(self, file_path: str, key: str) -> Optional[List[list]]:
+        """The cached reference lists of the file's objects, or None if the file is not cached or its key changed."""
+        entry = self.entries.get(file_path)
+        if entry is not None and entry["key"] == key:
+            self.hit_count += 1
+            return [[tuple(position) for position in reference_list] for reference_list in entry["references"]]
+        self.miss_count += 1
+        return None
+
+    def put(self, file_path: str, key: str, reference_lists):
+        self.entries[file_path] = {
+            "key": key,
+            "references": [[list(position) for position in reference_list] for reference_list in reference_lists],
+        }
+        self._dirty = True
+
+    def prune(self, existing_file_paths):
+        """Removes the entries of definer files that are no longer resolved, and the import lists of files that are gone."""
+        existing_file_paths = set(existing_file_paths)
+        for file_path in [path for path in self.entries if path not in existing_file_paths]:
+            del self.entries[file_path]
+            self.stale_count += 1
+            self._dirty = True
+        for file_path in [path for path in self.imports if path not in self.index.file_paths]:
+            del self.imports[file_path]
+            self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+        # 与 ParseCache 一样先写临时文件再替换, 中断时不会留下写了一半的缓存
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as writer:
+            json.dump(
+                {
+                    "version": REFERENCE_CACHE_VERSION,
+                    "jedi_version": jedi.__version__,
+                    "files": self.entries,
+                    "imports": self.imports,
+                },
+                writer,
+                ensure_ascii=False,
+            )
+        os.replace(temp_path, self.cache_path)
+        self._dirty = False
+
+    def log_statistics(self):
+        logger.info(
+            f"Reference cache: {self.hit_count} files reused, {self.miss_count} files resolved, "
+            f"{self.stale_count} stale entries removed"
+        )
+
+    def _get_content_hash(self, file_path: str) -> Optional[str]:
+        if file_path not in self._content_hashes:
+            try:
+                self._content_hashes[file_path] = hash_file_content(os.path.join(self.repo_path, file_path))
+            except OSError:
+                self._content_hashes[file_path] = None
+        return self._content_hashes[file_path]
+
+    def _get_imported_files(self, file_path: str) -> Optional[Set[str]]:
+        """The repo files that file_path may import directly, None if it cannot be parsed."""
+        content_hash = self._get_content_hash(file_path)
+        entry = self.imports.get(file_path)
+        if entry is None or entry["hash"] != content_hash:
+            entry = self.imports[file_path] = {"hash": content_hash, "modules": self._parse_imports(file_path)}
+            self._dirty = True
+        if entry["modules"] is None:
+            return None
+        return {
+            module_path + suffix
+            for module_path in entry["modules"]
+            for suffix in (".py", "/__init__.py")
+            if module_path + suffix in self.index.file_paths
+        }
+
+    def _parse_imports(self, file_path: str) -> Optional[List[str]]:
+        """
+        Paths (without suffix) of every module an import of the file may load, including the packages on the way
+        and, for absolute imports, the same path below each parent directory (Jedi also resolves imports there).
+        """
+        try:
+            with open(os.path.join(self.repo_path, file_path), "rb") as reader:
+                tree = ast.parse(reader.read())
+        except (OSError, SyntaxError, ValueError):
+            return None
+        package = file_path.split("/")[:-1]
+        module_names = set()
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    module_names.add((0, tuple(alias.name.split("."))))
+            elif isinstance(node, ast.ImportFrom):
+                module = tuple(node.module.split(".")) if node.module else ()
+                module_names.add((node.level, module))
+                for alias in node.names:
+                    if alias.name != "*":
+                        module_names.add((node.level, module + (alias.name,)))
+        module_paths = set()
+        for level, module in module_names:
+            if level:
+                if level - 1 > len(package):
+                    continue
+                bases = [tuple(package[: len(package) - (level - 1)])]
+            else:
+                bases = [tuple(package[:depth]) for depth in range(len(package) + 1)]
+            for base in bases:
+                for depth in range(len(module) + 1):
+                    if base or depth:
+                        module_paths.add("/".join(base + module[:depth]))
+        return sorted(module_paths)
+
+    def _get_closure(self, file_path: str) -> Optional[Set[str]]:
+        """file_path and every repo file it imports recursively, None if one of them cannot be parsed."""
+        if file_path in self._closures:
+            return self._closures[file_path]
+        closure, stack = {file_path}, [file_path]
+        while stack:
+            imported_files = self._get_imported_files(stack.pop())
+            if imported_files is None:
+                closure = None
+                break
+            for imported_path in imported_files - closure:
+                closure.add(imported_path)
+                stack.append(imported_path)
+        self._closures[file_path] = closure
+        return closure
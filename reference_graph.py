@@ -0,0 +1,328 @@
+from __future__ import annotations
+
+import heapq
+import operator
+from array import array
+from bisect import bisect_left
+from itertools import accumulate, chain
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from doc_meta_info import DocItem
+
+
+def group_edges(node_count: int, edge_sources: List[int], edge_targets: List[int]):
+    """把边按起点分组(稳定的计数排序), 返回 (offsets, targets): 点 i 的出边终点是 targets[offsets[i]:offsets[i + 1]]。
+    用两个扁平的列表代替每个点一个列表, 大型仓库上可以少分配几十万个小对象。"""
+    offsets = [0] * (node_count + 1)
+    for source in edge_sources:
+        offsets[source + 1] += 1
+    for pos in range(node_count):
+        offsets[pos + 1] += offsets[pos]
+    fill = offsets[:-1]
+    targets = [0] * len(edge_targets)
+    for source, target in zip(edge_sources, edge_targets):
+        targets[fill[source]] = target
+        fill[source] += 1
+    return offsets, targets
+
+
+def find_strongly_connected_components(offsets, targets, skip: Optional[List[bool]] = None) -> List[int]:
+    """
+    迭代版的 Tarjan 算法, 边的格式见 `group_edges`。skip[i] 为 True 的点以及指向它们的边不参与计算。
+
+    Returns:
+        List[int]: 每个点所属强连通分量的编号, 被跳过的点为 -1。
+    """
+    node_count = len(offsets) - 1
+    index = [-1] * node_count
+    low = [0] * node_count
+    on_stack = [False] * node_count
+    component = [-1] * node_count
+    scc_stack = []
+    next_index = 0
+    component_count = 0
+    for root in range(node_count):
+        if index[root] != -1 or (skip is not None and skip[root]):
+            continue
+        index[root] = low[root] = next_index
+        next_index += 1
+        scc_stack.append(root)
+        on_stack[root] = True
+        work = [(root, offsets[root])]  # (点, 下一条要访问的边)
+        while work:
+            now, edge_pos = work[-1]
+            if edge_pos < offsets[now + 1]:
+                work[-1] = (now, edge_pos + 1)
+                target = targets[edge_pos]
+                if skip is not None and skip[target]:
+                    continue
+                if index[target] == -1:
+                    index[target] = low[target] = next_index
+                    next_index += 1
+                    scc_stack.append(target)
+                    on_stack[target] = True
+                    work.append((target, offsets[target]))
+                elif on_stack[target]:
+                    low[now] = min(low[now], index[target])
+                continue
+            work.pop()
+            if work:
+                father = work[-1][0]
+                low[father] = min(low[father], low[now])
+            if low[now] == index[now]:
+                while True:
+                    member = scc_stack.pop()
+                    on_stack[member] = False
+                    component[member] = component_count
+                    if member == now:
+                        break
+                component_count += 1
+    return component
+
+
+class ReferenceGraph:
+    """
+    对象之间的引用关系图, 边 referencer -> referenced 表示 referencer 引用了 referenced。
+
+    每个参与引用的 DocItem 第一次出现时分配一个整数编号(保存在 DocItem 上), 之后所有的边都用编号表示。
+    构建阶段(parse_reference)每个点的出边/入边是一个按插入顺序排列的字典, 去重和删除都是 O(1);
+    构建完成后调用 `freeze` 压缩成 CSR 格式的 array, 之后的查询(影响范围、扇入扇出排序、环)都在数组上进行。
+    冻结后再修改会自动恢复成字典。被删除的点(监视模式下修改过的文件中的对象)在下一次 `freeze` 时回收,
+    剩下的点按原来的顺序重新编号, 图的大小不会随着修改次数增长。
+    DocItem.reference_who / who_reference_me / special_reference_type 都是这里的只读视图, 顺序与边加入的顺序相同。
+    """
+
+    def __init__(self):
+        self.nodes: List[Optional[DocItem]] = []  # 编号 -> DocItem, 被删除的点为 None
+        self.edge_count = 0
+        self._removed_count = 0  # nodes 中为 None 的位置数, freeze 时回收
+        self._callees: Optional[List[Dict[int, bool]]] = []  # 编号 -> {被引用对象的编号: 是否是特殊引用}
+        self._callers: Optional[List[Dict[int, None]]] = []  # 编号 -> {引用者的编号: None}
+        # 冻结后的 CSR: 点 i 的出边终点是 _callee_targets[_callee_offsets[i]:_callee_offsets[i + 1]]
+        self._callee_offsets: Optional[array] = None
+        self._callee_targets: Optional[array] = None
+        self._callee_special: Optional[array] = None
+        self._callee_sorted: Optional[array] = None  # 每一行内排好序的 _callee_targets, has_edge 在上面二分查找
+        self._caller_offsets: Optional[array] = None
+        self._caller_targets: Optional[array] = None
+        self._cycles: Optional[List[List[int]]] = None  # find_cycles 的结果, 修改图时清空
+
+    @property
+    def frozen(self) -> bool:
+        return self._callees is None
+
+    def node_id(self, item: DocItem) -> int:
+        """Returns the id of item, registering it in the graph if needed."""
+        if item._reference_graph is self:
+            return item._reference_node_id
+        if item._reference_graph is not None:
+            raise ValueError(f"{item} already belongs to another reference graph")
+        self._thaw()
+        item._reference_graph = self
+        item._reference_node_id = len(self.nodes)
+        self.nodes.append(item)
+        self._callees.append({})
+        self._callers.append({})
+        return item._reference_node_id
+
+    def add_edge(self, referencer: DocItem, referenced: DocItem, special: bool = False) -> bool:
+        """
+        Records that referencer references referenced.
+
+        Returns:
+            bool: False if the edge already existed, in which case nothing changes.
+        """
+        if self.has_edge(referencer, referenced):
+            return False
+        referencer_id = self.node_id(referencer)
+        referenced_id = self.node_id(referenced)
+        self._thaw()
+        self._callees[referencer_id][referenced_id] = special
+        self._callers[referenced_id][referencer_id] = None
+        self.edge_count += 1
+        return True
+
+    def has_edge(self, referencer: DocItem, referenced: DocItem) -> bool:
+        if referencer._reference_graph is not self or referenced._reference_graph is not self:
+            return False
+        referencer_id, referenced_id = referencer._reference_node_id, referenced._reference_node_id
+        if not self.frozen:
+            return referenced_id in self._callees[referencer_id]
+        start, end = self._callee_offsets[referencer_id], self._callee_offsets[referencer_id + 1]
+        pos = bisect_left(self._callee_sorted, referenced_id, start, end)
+        return pos < end and self._callee_sorted[pos] == referenced_id
+
+    def remove_node(self, item: DocItem):
+        """Removes every reference relation between item and the other objects, and forgets item."""
+        if item._reference_graph is not self:
+            return
+        self._thaw()
+        node_id = item._reference_node_id
+        for referenced_id in self._callees[node_id]:
+            del self._callers[referenced_id][node_id]
+        for referencer_id in self._callers[node_id]:
+            del self._callees[referencer_id][node_id]
+        self.edge_count -= len(self._callees[node_id]) + len(self._callers[node_id])
+        self._callees[node_id] = {}
+        self._callers[node_id] = {}
+        self.nodes[node_id] = None
+        self._removed_count += 1
+        item._reference_graph = None
+        item._reference_node_id = -1
+
+    def _callee_ids(self, node_id: int):
+        if not self.frozen:
+            return self._callees[node_id].keys()
+        return self._callee_targets[self._callee_offsets[node_id] : self._callee_offsets[node_id + 1]]
+
+    def _caller_ids(self, node_id: int):
+        if not self.frozen:
+            return self._callers[node_id].keys()
+        return self._caller_targets[self._caller_offsets[node_id] : self._caller_offsets[node_id + 1]]
+
+    def get_callees(self, item: DocItem) -> Tuple[DocItem, ...]:
+        """The objects referenced by item, in the order the references were found."""
+        if item._reference_graph is not self:
+            return ()
+        nodes = self.nodes
+        return tuple(nodes[node_id] for node_id in self._callee_ids(item._reference_node_id))
+
+    def get_callers(self, item: DocItem) -> Tuple[DocItem, ...]:
+        """The objects that reference item, in the order the references were found."""
+        if item._reference_graph is not self:
+            return ()
+        nodes = self.nodes
+        return tuple(nodes[node_id] for node_id in self._caller_ids(item._reference_node_id))
+
+    def get_special_flags(self, item: DocItem) -> Tuple[bool, ...]:
+        """Whether each reference of `get_callees(item)` is a special reference."""
+        if item._reference_graph is not self:
+            return ()
+        node_id = item._reference_node_id
+        if not self.frozen:
+            return tuple(self._callees[node_id].values())
+        start, end = self._callee_offsets[node_id], self._callee_offsets[node_id + 1]
+        return tuple(bool(special) for special in self._callee_special[start:end])
+
+    def freeze(self):
+        """
+        Compacts the edges into CSR arrays. Called once the references of the whole repository are parsed.
+        The slots of removed nodes are reclaimed first, see `_compact`.
+        """
+        if self.frozen:
+            return
+        if self._removed_count:
+            self._compact()
+        self._callee_offsets = array("q", accumulate(map(len, self._callees), initial=0))
+        self._callee_targets = array("q", chain.from_iterable(self._callees))
+        self._callee_special = array("b", chain.from_iterable(callees.values() for callees in self._callees))
+        self._callee_sorted = array("q", chain.from_iterable(map(sorted, self._callees)))
+        self._caller_offsets = array("q", accumulate(map(len, self._callers), initial=0))
+        self._caller_targets = array("q", chain.from_iterable(self._callers))
+        self._callees = self._callers = None
+
+    def _thaw(self):
+        """Turns the CSR arrays back into dicts before the graph is modified."""
+        if not self.frozen:
+            return
+        callees, callers = [], []
+        for node_id in range(len(self.nodes)):
+            start, end = self._callee_offsets[node_id], self._callee_offsets[node_id + 1]
+            callees.append(dict(zip(self._callee_targets[start:end], map(bool, self._callee_special[start:end]))))
+            start, end = self._caller_offsets[node_id], self._caller_offsets[node_id + 1]
+            callers.append(dict.fromkeys(self._caller_targets[start:end]))
+        self._callees, self._callers = callees, callers
+        self._callee_offsets = self._callee_targets = self._callee_special = self._callee_sorted = None
+        self._caller_offsets = self._caller_targets = None
+        self._cycles = None
+
+    def _compact(self):
+        """Drops the slots of removed nodes and renumbers the remaining ones 0..n-1, keeping their order."""
+        new_ids = [-1] * len(self.nodes)
+        kept_ids = []
+        for node_id, item in enumerate(self.nodes):
+            if item is not None:
+                new_ids[node_id] = item._reference_node_id = len(kept_ids)
+                kept_ids.append(node_id)
+        self.nodes = [self.nodes[node_id] for node_id in kept_ids]
+        self._callees = [
+            {new_ids[target]: special for target, special in self._callees[node_id].items()} for node_id in kept_ids
+        ]
+        self._callers = [dict.fromkeys(new_ids[target] for target in self._callers[node_id]) for node_id in kept_ids]
+        self._removed_count = 0
+
+    def iter_edges(self) -> Iterable[Tuple[DocItem, DocItem, bool]]:
+        """Yields (referencer, referenced, special) for every edge."""
+        for node_id, item in enumerate(self.nodes):
+            if item is None:
+                continue
+            for referenced, special in zip(self.get_callees(item), self.get_special_flags(item)):
+                yield item, referenced, special
+
+    def get_transitive_callers(self, items: Iterable[DocItem], max_depth: Optional[int] = None) -> List[DocItem]:
+        """
+        Returns the objects that reference any of items directly or through a chain of references, i.e. the
+        objects whose documents may be affected when items change. Breadth-first, items themselves excluded.
+
+        Args:
+            items: The changed objects.
+            max_depth (int, optional): Only follow this many levels of references.
+        """
+        return self._breadth_first(items, max_depth, callers=True)
+
+    def get_transitive_callees(self, items: Iterable[DocItem], max_depth: Optional[int] = None) -> List[DocItem]:
+        """Returns the objects that items reference directly or through a chain of references, breadth-first."""
+        return self._breadth_first(items, max_depth, callers=False)
+
+    def _breadth_first(self, items, max_depth, callers: bool) -> List[DocItem]:
+        self.freeze()
+        if callers:
+            offsets, targets = self._caller_offsets, self._caller_targets
+        else:
+            offsets, targets = self._callee_offsets, self._callee_targets
+        visited = bytearray(len(self.nodes))
+        frontier = []
+        for item in items:
+            if item._reference_graph is self and not visited[item._reference_node_id]:
+                visited[item._reference_node_id] = 1
+                frontier.append(item._reference_node_id)
+        result = []
+        depth = 0
+        while frontier and (max_depth is None or depth < max_depth):
+            next_frontier = []
+            for node_id in frontier:
+                for target in targets[offsets[node_id] : offsets[node_id + 1]]:
+                    if not visited[target]:
+                        visited[target] = 1
+                        next_frontier.append(target)
+            result.extend(next_frontier)
+            frontier = next_frontier
+            depth += 1
+        return [self.nodes[node_id] for node_id in result]
+
+    def rank_by_fan_in(self, top_k: int = 10) -> List[Tuple[DocItem, int]]:
+        """The top_k objects referenced by the most other objects, as (item, number of referencers)."""
+        self.freeze()
+        return self._rank(self._caller_offsets, top_k)
+
+    def rank_by_fan_out(self, top_k: int = 10) -> List[Tuple[DocItem, int]]:
+        """The top_k objects that reference the most other objects, as (item, number of referenced objects)."""
+        self.freeze()
+        return self._rank(self._callee_offsets, top_k)
+
+    def _rank(self, offsets, top_k) -> List[Tuple[DocItem, int]]:
+        degrees = list(map(operator.sub, offsets[1:], offsets[:-1]))
+        top_ids = heapq.nlargest(top_k, range(len(degrees)), key=degrees.__getitem__)
+        return [(self.nodes[node_id], degrees[node_id]) for node_id in top_ids if degrees[node_id] > 0]
+
+    def find_cycles(self) -> List[List[DocItem]]:
+        """Returns the strongly connected components with more than one object, i.e. the groups of objects that reference each other in a cycle."""
+        self.freeze()
+        if self._cycles is None:
+            component = find_strongly_connected_components(self._callee_offsets, self._callee_targets)
+            members: Dict[int, List[int]] = {}
+            for node_id, component_id in enumerate(component):
+                members.setdefault(component_id, []).append(node_id)
+            self._cycles = [node_ids for node_ids in members.values() if len(node_ids) > 1]
+        return [[self.nodes[node_id] for node_id in node_ids] for node_ids in self._cycles]
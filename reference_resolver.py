@@ -0,0 +1,155 @@
+import os
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import jedi
+
+from identifier_index import IdentifierIndex
+from log import logger
+
+
+class ReferenceResolver:
+    """
+    查找对象的引用者, 代替每次查找都新建一个 jedi.Script 的 find_all_referencer。
+
+    每个文件的 Script 只创建一次, 同一个文件中所有对象的 get_references 都复用它, 因此 Jedi 对这个文件
+    的解析与推断结果只计算一次; 所有 Script 都绑定到同一个 jedi.Project(通常是 ProjectManager 创建的那个)。
+    parse_reference 逐个文件处理, 只需要缓存最近用到的少数几个文件的 Script。
+
+    file_timings 记录每个文件花在创建 Script 与查找引用上的时间, 见 `log_slowest_files`。
+
+    给定 IdentifierIndex 时, 名字只出现在定义它的文件中的对象只在这个文件中查找引用, 除了定义以外没有
+    出现过的名字不调用 Jedi; lookup_counts 记录按 "skipped"/"file"/"project" 分类的查找次数。
+    """
+
+    def __init__(
+        self, repo_path, project: Optional[jedi.Project] = None, max_cached_scripts: int = 4,
+        index: Optional[IdentifierIndex] = None,
+    ):
+        self.repo_path = os.fspath(repo_path)
+        self.project = project if project is not None else jedi.Project(self.repo_path)
+        self.max_cached_scripts = max_cached_scripts
+        self.index = index
+        self.lookup_counts = Counter()
+        self._scripts: OrderedDict = OrderedDict()  # 文件相对路径 -> jedi.Script, 按最近使用排序
+        self.file_timings: Dict[str, List[float]] = {}  # 文件相对路径 -> [耗时(秒), 查找次数]
+        self.script_count = 0  # 创建过的 Script 数
+
+    def get_script(self, file_path: str) -> jedi.Script:
+        script = self._scripts.pop(file_path, None)
+        if script is None:
+            script = jedi.Script(path=os.path.join(self.repo_path, file_path), project=self.project)
+            self.script_count += 1
+            if len(self._scripts) >= self.max_cached_scripts:
+                self._scripts.popitem(last=False)
+        self._scripts[file_path] = script
+        return script
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """Drops the cached Script of file_path (or of every file), call it after the file changes on disk."""
+        if file_path is None:
+            self._scripts.clear()
+        else:
+            self._scripts.pop(file_path, None)
+
+    def find_references(
+        self, variable_name, file_path, line_number, column_number, in_file_only=False
+    ) -> List[Tuple[str, int, int]]:
+        """
+        Finds the references of the name defined at (line_number, column_number) in file_path.
+
+        Returns:
+            List[Tuple[str, int, int]]: (path relative to the repo, line, column) of every reference named
+            variable_name, the definition itself excluded. Empty if Jedi fails.
+        """
+        if self.index is not None:
+            scope = self.index.get_lookup_scope(variable_name, file_path, in_file_only)
+            self.lookup_counts[scope or "skipped"] += 1
+            if scope is None:
+                return []
+            in_file_only = scope == "file"
+        start_time = time.perf_counter()
+        try:
+            script = self.get_script(file_path)
+            # Jedi 限制每个语法节点在一个 InferenceState 中最多推断 300 次, 这个计数在 reset_recursion_limitations
+            # 中不会清零; 复用 Script 时不清零的话, 后面的查找会因为前面的查找用完了次数而漏掉引用
+            script._inference_state.inferred_element_counts.clear()
+            if in_file_only:
+                references = script.get_references(
+                    line=line_number, column=column_number, scope="file"
+                )
+            else:
+                references = script.get_references(line=line_number, column=column_number)
+            # 过滤出变量名为 variable_name 的引用，并返回它们的位置
+            return [
+                (os.path.relpath(ref.module_path, self.repo_path), ref.line, ref.column)
+                for ref in references
+                if ref.name == variable_name
+                and not (ref.line == line_number and ref.column == column_number)
+            ]
+        except Exception as e:
+            # 打印错误信息和相关参数
+            logger.info(f"Error occurred: {e}")
+            logger.info(
+                f"Parameters: variable_name={variable_name}, file_path={file_path}, line_number={line_number}, column_number={column_number}"
+            )
+            return []
+        finally:
+            timing = self.file_timings.setdefault(file_path, [0.0, 0])
+            timing[0] += time.perf_counter() - start_time
+            timing[1] += 1
+
+    def log_slowest_files(self, count: int = 10):
+        """Logs the files that took the longest to resolve, with their share of the total time."""
+        if self.lookup_counts:
+            logger.info(
+                f"Identifier index: {self.lookup_counts['skipped']} lookups skipped, {self.lookup_counts['file']} "
+                f"searched in their own file, {self.lookup_counts['project']} searched in the project"
+            )
+        total_time = sum(timing[0] for timing in self.file_timings.values())
+        if not total_time:
+            return
+        logger.info(
+            f"Resolved references of {sum(timing[1] for timing in self.file_timings.values())} objects "
+            f"in {len(self.file_timings)} files in {total_time:.2f}s, slowest files:"
+        )
+        slowest = sorted(self.file_timings.items(), key=lambda pair: pair[1][0], reverse=True)[:count]
+        for file_path, (elapsed, lookup_count) in slowest:
+            logger.info(
+                f"  {file_path}: {elapsed:.2f}s ({elapsed / total_time:.0%}), {lookup_count} lookups"
+            )
+
+
+_worker_resolver: Optional[ReferenceResolver] = None  # 查找引用的工作进程中的 resolver, 见 init_reference_worker
+
+
+def init_reference_worker(repo_path, index: Optional[IdentifierIndex] = None):
+    """Initializer of the reference worker processes: each process keeps one resolver and jedi.Project for its lifetime."""
+    global _worker_resolver
+    _worker_resolver = ReferenceResolver(repo_path, index=index)
+
+
+def resolve_file_references(file_path: str, lookups: List[Tuple[str, str, int, int, bool]]):
+    """
+    Finds the references of the objects of one file in a worker process started with `init_reference_worker`.
+    Defined at module level so that it can be sent to worker processes.
+
+    Args:
+        file_path (str): The path of the file relative to the repo.
+        lookups: (full name, name, line, column, in_file_only) of each object, in the order of a serial run.
+
+    Returns:
+        tuple: (references, timing, lookup_counts). references are (definer full name, referencer path, line, column)
+        tuples, grouped by definer in the order of lookups; timing is the [seconds, lookup count] of the file and
+        lookup_counts the `ReferenceResolver.lookup_counts` of its lookups.
+    """
+    references = []
+    for full_name, variable_name, line_number, column_number, in_file_only in lookups:
+        for referencer_path, line, column in _worker_resolver.find_references(
+            variable_name, file_path, line_number, column_number, in_file_only
+        ):
+            references.append((full_name, referencer_path, line, column))
+    _worker_resolver.invalidate(file_path)  # 每个文件只会被分到一个工作进程一次
+    lookup_counts, _worker_resolver.lookup_counts = _worker_resolver.lookup_counts, Counter()
+    return references, _worker_resolver.file_timings.pop(file_path, [0.0, 0]), lookup_counts
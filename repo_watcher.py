@@ -0,0 +1,221 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict, Iterable, Optional, Set
+
+from ignore_matcher import IgnoreMatcher
+from log import logger
+
+_IN_MODIFY = 0x2
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+# inotify 事件: 修改、写入后关闭、创建、删除、移入移出以及被监听目录本身被删除/移动
+_IN_WATCH_MASK = (
+    _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE | _IN_DELETE_SELF | _IN_MOVE_SELF
+)
+_EVENT_HEADER = struct.Struct("iIII")  # struct inotify_event 的 wd, mask, cookie, len, 之后是 len 字节的文件名
+
+
+class _Inotify:
+    """
+    基于 ctypes 的最小 inotify 封装, 事件只解析到"哪个被监听的目录有变化";
+    目录中具体哪些文件变化了由 RepoWatcher 重新扫描这个目录得出。
+    """
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._watched_dirs: Dict[str, int] = {}  # 目录绝对路径 -> watch descriptor
+        self._dir_of_wd: Dict[int, str] = {}
+
+    def is_watched(self, abs_dir_path) -> bool:
+        return abs_dir_path in self._watched_dirs
+
+    def watch_dirs(self, abs_dir_paths: Iterable[str]):
+        for abs_dir_path in abs_dir_paths:
+            if abs_dir_path in self._watched_dirs:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(abs_dir_path), _IN_WATCH_MASK)
+            if wd < 0:
+                continue
+            old_path = self._dir_of_wd.get(wd)  # 同一个目录(inode)被移动到了新的路径
+            if old_path is not None:
+                self._watched_dirs.pop(old_path, None)
+            self._watched_dirs[abs_dir_path] = wd
+            self._dir_of_wd[wd] = abs_dir_path
+
+    def _forget(self, wd):
+        abs_dir_path = self._dir_of_wd.pop(wd, None)
+        if abs_dir_path is not None and self._watched_dirs.get(abs_dir_path) == wd:
+            del self._watched_dirs[abs_dir_path]
+
+    def wait(self, timeout=None) -> Optional[Set[str]]:
+        """
+        Blocks until events arrive (or timeout seconds pass, None waits forever) and reads all queued events.
+
+        Returns:
+            Optional[Set[str]]: The watched directories whose entries changed, or None if the kernel event queue
+            overflowed and the whole repository has to be scanned again.
+        """
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        changed_dirs = set()
+        if not readable:
+            return changed_dirs
+        overflow = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size + name_length
+                if mask & _IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & _IN_IGNORED:  # 目录被删除或移走后 watch 被内核移除, 同一路径重建后要重新监听
+                    self._forget(wd)
+                elif mask & _IN_MOVE_SELF:  # 目录被移走: 不再监听旧路径, 移到仓库中其他位置时由父目录的事件重新监听
+                    self._libc.inotify_rm_watch(self._fd, wd)
+                    self._forget(wd)
+                elif not mask & _IN_DELETE_SELF and wd in self._dir_of_wd:
+                    changed_dirs.add(self._dir_of_wd[wd])
+        return None if overflow else changed_dirs
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RepoWatcher:
+    """
+    监听目标仓库中未被忽略的 .py 文件。
+    Linux 上阻塞等待 inotify 事件, 只重新扫描事件中出现的目录;
+    其他平台(或 inotify 不可用时)每 poll_interval 秒扫描一遍整个仓库, 对比 mtime。
+    """
+
+    def __init__(self, repo_path, ignore_matcher: IgnoreMatcher, poll_interval=2.0, settle_time=0.5):
+        self.repo_path = repo_path
+        self.ignore_matcher = ignore_matcher
+        self.poll_interval = poll_interval  # 轮询的间隔, 只在 inotify 不可用时使用
+        self.settle_time = settle_time  # 收到事件后再等一会儿, 把编辑器连续的多次写入合并为一次更新
+        self._inotify = None
+        if sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                logger.info(f"inotify is not available, falling back to mtime polling: {e}")
+        self._snapshot = self._take_snapshot()
+
+    def _abs_path(self, rel_path):
+        return os.path.join(self.repo_path, rel_path) if rel_path else os.fspath(self.repo_path)
+
+    def _take_snapshot(self):
+        """Returns {relative file path: (mtime_ns, size)} of the whole repository and registers inotify watches on every directory."""
+        files, _ = self._scan("", recursive=True)
+        return files
+
+    def _scan(self, rel_dir, recursive):
+        """
+        Lists the .py files in rel_dir, or in its whole subtree if recursive. Every directory walked is watched
+        before it is listed, so files created meanwhile are reported by an event.
+
+        Returns:
+            tuple: ({relative file path: (mtime_ns, size)}, relative paths of the sub directories directly in rel_dir)
+        """
+        if recursive and self._inotify is not None:
+            self._inotify.watch_dirs([self._abs_path(rel_dir)])
+        files, sub_dirs = {}, []
+        for rel_path, is_dir in self.ignore_matcher.iter_entries(self.repo_path, rel_dir, recursive):
+            abs_path = os.path.join(self.repo_path, rel_path)
+            if is_dir:
+                if os.path.dirname(rel_path) == rel_dir:
+                    sub_dirs.append(rel_path)
+                if recursive and self._inotify is not None:
+                    self._inotify.watch_dirs([abs_path])
+                continue
+            if not rel_path.endswith(".py"):
+                continue
+            try:
+                stat = os.stat(abs_path)
+            except OSError:
+                continue
+            files[rel_path] = (stat.st_mtime_ns, stat.st_size)
+        return files, sub_dirs
+
+    def _rescan_dirs(self, abs_dir_paths):
+        """
+        Returns the snapshot updated from the directories named in inotify events: their files are listed again,
+        sub directories that are new (or were recreated and lost their watch) are scanned entirely, and the files
+        of sub directories that are gone are dropped. Nothing else is scanned.
+        """
+        snapshot = dict(self._snapshot)
+        for abs_dir_path in sorted(abs_dir_paths):
+            rel_dir = os.path.relpath(abs_dir_path, self.repo_path)
+            rel_dir = "" if rel_dir == os.curdir else rel_dir
+            files, sub_dirs = self._scan(rel_dir, recursive=False)
+            kept_sub_dirs = set()  # 仍然被监听的子目录, 其中的文件由它们自己的事件更新
+            for sub_dir in sub_dirs:
+                if self._inotify.is_watched(self._abs_path(sub_dir)):
+                    kept_sub_dirs.add(sub_dir)
+                else:
+                    files.update(self._scan(sub_dir, recursive=True)[0])
+            prefix = rel_dir + os.sep if rel_dir else ""
+            for rel_path in [rel_path for rel_path in snapshot if rel_path.startswith(prefix)]:
+                parts = rel_path[len(prefix):].split(os.sep, 1)
+                if len(parts) == 1 or os.path.join(rel_dir, parts[0]) not in kept_sub_dirs:
+                    del snapshot[rel_path]
+            snapshot.update(files)
+        return snapshot
+
+    def wait_for_changes(self):
+        """
+        Blocks until at least one .py file is created, modified or deleted.
+
+        Returns:
+            tuple: (changed_files, deleted_files), sorted lists of paths relative to the repository.
+        """
+        while True:
+            if self._inotify is not None:
+                changed_dirs = self._inotify.wait()
+                time.sleep(self.settle_time)
+                more_changed_dirs = self._inotify.wait(timeout=0)
+                if changed_dirs is None or more_changed_dirs is None:  # 事件队列溢出, 重新扫描整个仓库
+                    new_snapshot = self._take_snapshot()
+                else:
+                    new_snapshot = self._rescan_dirs(changed_dirs | more_changed_dirs)
+            else:
+                time.sleep(self.poll_interval)
+                new_snapshot = self._take_snapshot()
+
+            changed_files = sorted(
+                rel_path
+                for rel_path, stamp in new_snapshot.items()
+                if self._snapshot.get(rel_path) != stamp
+            )
+            deleted_files = sorted(
+                rel_path for rel_path in self._snapshot if rel_path not in new_snapshot
+            )
+            self._snapshot = new_snapshot
+            if changed_files or deleted_files:
+                return changed_files, deleted_files
+
+    def close(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
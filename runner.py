@@ -12,9 +12,11 @@ from tqdm import tqdm
 
 from chat_engine import ChatEngine
 from doc_meta_info import DocItem, DocItemStatus, MetaInfo, need_to_generate
-from file_handler import FileHandler
+from file_handler import FileHandler, parse_file_structure
+from ignore_matcher import IgnoreMatcher
 from log import logger
 from project_manager import ProjectManager
+from repo_watcher import RepoWatcher
 from settings import setting
 
 
@@ -27,8 +29,10 @@ class Runner:
             project_hierarchy=setting.project.hierarchy_name
         )
         self.chat_engine = ChatEngine(project_manager=self.project_manager)
+        self.ignore_matcher = IgnoreMatcher.from_settings()
 
-        if not self.absolute_project_hierarchy_path.exists():
+        # 层级目录里可能只有解析缓存, 需要以快照是否存在来判断
+        if not MetaInfo.checkpoint_exists(self.absolute_project_hierarchy_path):
             file_path_reflections = {}
             jump_files = []
             self.meta_info = MetaInfo.init_meta_info(file_path_reflections, jump_files)
@@ -39,6 +43,7 @@ class Runner:
             self.meta_info = MetaInfo.from_checkpoint_path(
                 self.absolute_project_hierarchy_path
             )
+        self.meta_info.jedi_project = self.project_manager.project  # 查找引用时复用同一个 jedi.Project
 
         self.meta_info.checkpoint(  # .project_doc_record
             target_dir_path=self.absolute_project_hierarchy_path
@@ -71,7 +76,7 @@ class Runner:
 
             rel_file_path = doc_item.get_full_name()
 
-            if not need_to_generate(doc_item, setting.project.ignore_list):
+            if not need_to_generate(doc_item, self.ignore_matcher):
                 print(f"Content ignored/Document generated, skipping: {doc_item.get_full_name()}")
             else:
                 print(f" -- Generating document  {Fore.LIGHTYELLOW_EX}{doc_item.item_type.name}: {doc_item.get_full_name()}{Style.RESET_ALL}")
@@ -80,11 +85,13 @@ class Runner:
                     doc_item=doc_item,
                     file_handler=file_handler,
                 )
-                doc_item.md_content.append(response_message.content)
-                doc_item.item_status = DocItemStatus.doc_up_to_date
-                self.meta_info.checkpoint(
-                    target_dir_path=self.absolute_project_hierarchy_path
-                )
+                with self.meta_info.checkpoint_lock:  # 快照中不会出现只更新了一半的对象
+                    doc_item.md_content.append(response_message.content)
+                    doc_item.item_status = DocItemStatus.doc_up_to_date
+                    self.meta_info.record_item_update(
+                        target_dir_path=self.absolute_project_hierarchy_path,
+                        doc_item=doc_item,
+                    )
         except Exception as e:
             logger.info(f"Document generation failed after multiple attempts, skipping: {doc_item.get_full_name()}")
             logger.error("Error:", e)
@@ -93,7 +100,7 @@ class Runner:
 
     def first_generate(self):
         logger.info("Starting to generate documentation")
-        check_task_available_func = partial(need_to_generate, ignore_list=setting.project.ignore_list)
+        check_task_available_func = partial(need_to_generate, ignore_list=self.ignore_matcher)
         task_manager, task_dict = self.meta_info.get_topology(
             check_task_available_func
         )  # Get task_manager and task_dict
@@ -154,42 +161,34 @@ class Runner:
         file_item_list = self.meta_info.get_all_files()
         for file_item in tqdm(file_item_list):
 
-            def recursive_check(
-                doc_item: DocItem,
-            ) -> bool:  # 检查一个file内是否存在doc
-                if doc_item.md_content != []:
-                    return True
-                for _, child in doc_item.children.items():
-                    if recursive_check(child):
-                        return True
-                return False
-
-            if recursive_check(file_item) == False:
+            # 检查一个file内是否存在doc
+            if not any(doc_item.md_content != [] for doc_item in file_item.iter_preorder()):
                 # logger.info(f"不存在文档内容，跳过：{file_item.get_full_name()}")
                 continue
             rel_file_path = file_item.get_full_name()
 
-            def to_markdown(item: DocItem, now_level: int) -> str:
-                markdown_content = ""
-                markdown_content += (
+            # 先序展开, 每个非顶层对象的子树写完后追加一个分隔线, None 表示分隔线
+            markdown_parts = []
+            stack = [(child, 2) for child in reversed(file_item.children.values())]
+            while stack:
+                item, now_level = stack.pop()
+                if item is None:
+                    markdown_parts.append("***\n")
+                    continue
+                markdown_parts.append(
                     "#" * now_level + f" {item.item_type.to_str()} {item.obj_name}"
                 )
                 if (
                     "params" in item.content.keys()
                     and len(item.content["params"]) > 0
                 ):
-                    markdown_content += f"({', '.join(item.content['params'])})"
-                markdown_content += "\n"
-                markdown_content += f"{item.md_content[-1] if len(item.md_content) >0 else 'Doc is waiting to be generated...'}\n"
-                for _, child in item.children.items():
-                    markdown_content += to_markdown(child, now_level + 1)
-                    markdown_content += "***\n"
-
-                return markdown_content
-
-            markdown = ""
-            for _, child in file_item.children.items():
-                markdown += to_markdown(child, 2)
+                    markdown_parts.append(f"({', '.join(item.content['params'])})")
+                markdown_parts.append("\n")
+                markdown_parts.append(f"{item.md_content[-1] if len(item.md_content) >0 else 'Doc is waiting to be generated...'}\n")
+                for child in reversed(item.children.values()):
+                    stack.append((None, now_level + 1))
+                    stack.append((child, now_level + 1))
+            markdown = "".join(markdown_parts)
             assert markdown != None, f"Markdown content is empty, the file path is: {rel_file_path}"
             # 写入markdown内容到.md文件
             file_path = os.path.join(
@@ -223,6 +222,48 @@ class Runner:
             flash_reference_relation=True,
         ) 
         self.markdown_refresh()
-       
 
-       
\ No newline at end of file
+    def watch(self, poll_interval=2.0):
+        """
+        Keeps the MetaInfo in memory and updates it whenever a .py file of the target repo changes.
+
+        Only the changed files are parsed again; the tree is patched in place (see `MetaInfo.update_files`),
+        then the checkpoint and the markdown documents are refreshed, without restarting the process.
+        Changes are detected with inotify where available, rescanning only the directories named in the events,
+        and by polling mtimes every poll_interval seconds otherwise.
+
+        Args:
+            poll_interval (float): Seconds between two polls when inotify is not available.
+        """
+        watcher = RepoWatcher(setting.project.target_repo, self.ignore_matcher, poll_interval=poll_interval)
+        logger.info(f"Watching {setting.project.target_repo} for changes, press Ctrl+C to stop")
+        try:
+            while True:
+                changed_files, deleted_files = watcher.wait_for_changes()
+                self.update_changed_files(changed_files, deleted_files)
+        except KeyboardInterrupt:
+            logger.info("Stop watching")
+        finally:
+            watcher.close()
+
+    def update_changed_files(self, changed_files, deleted_files):
+        """Re-parses the changed files and patches them into the in-memory MetaInfo."""
+        file_structures = {}
+        for file_path in changed_files:
+            _, file_objects, error = parse_file_structure(setting.project.target_repo, file_path)
+            if error is not None:
+                logger.warning(f"Failed to parse {file_path}, keep the previous version: {error}")
+                continue
+            file_structures[file_path] = file_objects
+        for file_path in deleted_files:
+            file_structures[file_path] = None
+        if not file_structures:
+            return
+
+        logger.info(f"Updating {len(file_structures)} changed files: {', '.join(file_structures)}")
+        self.meta_info.update_files(file_structures)
+        self.meta_info.checkpoint(
+            target_dir_path=self.absolute_project_hierarchy_path,
+            flash_reference_relation=True,
+        )
+        self.markdown_refresh()
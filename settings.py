@@ -6,6 +6,7 @@ from pydantic import (
     DirectoryPath,
     Field,
     HttpUrl,
+    NonNegativeInt,
     PositiveFloat,
     PositiveInt,
     SecretStr,
@@ -32,6 +33,16 @@ class ProjectSettings(BaseSettings):
     ignore_list: list[str] = []
     language: str = "English"
     max_thread_count: PositiveInt = 4
+    parse_process_count: PositiveInt = 1  # 解析仓库结构时使用的进程数, 1 表示串行解析
+    parse_in_flight_window: PositiveInt = 64  # 并行解析时最多同时在处理或等待被消费的文件数
+    reference_process_count: PositiveInt = 1  # 查找引用时使用的进程数, 1 表示在当前进程中串行查找
+    use_static_references: bool = False  # 先用 AST 静态解析引用, 只有无法确定的对象才交给 Jedi
+    use_identifier_index: bool = True  # 用标识符倒排索引跳过名字没有在其他文件中出现的对象的项目级查找
+    use_reference_cache: bool = True  # 在层级目录下缓存引用查找结果, 相关文件都未变化的文件不再重复查找
+    use_parse_cache: bool = True  # 在层级目录下缓存文件解析结果, 内容未变化的文件不再重复解析
+    use_binary_checkpoint: bool = False  # 层级信息保存为内存映射的二进制文件 hierarchy.bin, 否则保存为按文件分片的JSON
+    journal_compact_interval: PositiveInt = 200  # 检查点日志每累积这么多条记录就合并回快照
+    doc_history_retention: NonNegativeInt = 5  # 每个对象最多保留的文档旧版本数, 最新的版本不计在内
     max_document_tokens: PositiveInt = 1024
     log_level: LogLevel = LogLevel.INFO
 
@@ -0,0 +1,772 @@
+import ast
+import builtins
+import importlib.util
+import os
+import sys
+from collections import Counter
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from code_store import SourceBuffer
+from identifier_index import iter_python_files
+from log import logger
+
+_BUILTIN_NAMES = frozenset(dir(builtins))
+_DEFINITION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+_LITERAL_NODES = (
+    ast.Constant, ast.JoinedStr, ast.List, ast.Tuple, ast.Dict, ast.Set,
+    ast.ListComp, ast.SetComp, ast.DictComp,
+)
+_MAX_DEPTH = 24  # 追踪导入/赋值链的最大深度, 超过时当作无法确定
+
+# 名字或表达式的解析结果。除了下面几个常量, 还有 ("def", _Definition)、("instance", 类的_Definition)、
+# ("module", 模块名tuple) 与 ("super", 类的_Definition)
+_UNKNOWN = ("unknown",)  # 静态无法确定, 可能是任何对象, 包括仓库中的函数/类
+_VALUE = ("value",)  # 确定不是函数/类的定义(变量、参数等), 但类型未知
+_EXTERNAL = ("external",)  # 仓库以外的对象: 标准库、第三方库、内置名字与字面量
+
+
+class _Module:
+    __slots__ = ("file_path", "name", "is_package", "scope", "star_imports", "source")
+
+    def __init__(self, file_path: str, source: SourceBuffer):
+        parts = file_path[: -len(".py")].split("/")
+        self.file_path = file_path
+        self.is_package = parts[-1] == "__init__"
+        self.name = tuple(parts[:-1]) if self.is_package else tuple(parts)
+        self.source = source
+        self.scope: Optional[_Scope] = None
+        self.star_imports: List[Tuple[Tuple[str, ...], int]] = []  # from x import * 的 (模块名, level)
+
+
+class _Scope:
+    __slots__ = ("kind", "parent", "module", "bindings", "global_names", "nonlocal_names", "definition", "method_class", "self_attributes")
+
+    def __init__(self, kind: str, parent: Optional["_Scope"], module: _Module, definition=None):
+        self.kind = kind  # "module" / "class" / "function"(推导式与lambda也算)
+        self.parent = parent
+        self.module = module
+        self.bindings: Dict[str, list] = {}  # 名字 -> 在这个作用域中绑定它的语句, 见 _ScopeBuilder.bind
+        self.global_names = set()
+        self.nonlocal_names = set()
+        self.definition = definition  # 类或函数作用域对应的定义
+        self.method_class: Optional[_Scope] = None  # 直接定义在类中的函数: 类的作用域
+        self.self_attributes: Dict[str, list] = {}  # 类作用域: 方法中 self.x = ... 的 x -> [(值, 标注, 所在作用域)]
+
+
+class _Definition:
+    """A function or class of the repo, identified by (file path, line of the def, name) like its DocItem."""
+
+    __slots__ = ("module", "node", "scope", "body_scope")
+
+    def __init__(self, module: _Module, node, scope: _Scope):
+        self.module = module
+        self.node = node
+        self.scope = scope  # 绑定这个名字的作用域
+        self.body_scope: Optional[_Scope] = None
+
+    @property
+    def name(self) -> str:
+        return self.node.name
+
+    @property
+    def is_class(self) -> bool:
+        return isinstance(self.node, ast.ClassDef)
+
+
+class _ScopeBuilder(ast.NodeVisitor):
+    """
+    遍历一个文件的AST, 建立作用域与名字绑定, 并收集所有被读取的名字:
+    Name、Attribute 的属性名, 以及 from x import y 中的 y。
+    """
+
+    def __init__(self, module: _Module, definitions: dict, occurrences: dict):
+        self.module = module
+        self.definitions = definitions
+        self.occurrences = occurrences
+        self.scope = module.scope = _Scope("module", None, module)
+
+    def bind(self, name: str, binding: tuple, scope: Optional[_Scope] = None):
+        """
+        binding 是 ("def", _Definition)、("import_module", 模块名, level)、("import_from", 模块名, level, 名字)、
+        ("param", 标注, 角色)、("assign", 值, 标注) 或 ("other",)。
+        """
+        scope = scope or self.scope
+        if name in scope.nonlocal_names:
+            return
+        if name in scope.global_names:
+            scope = self.module.scope
+        scope.bindings.setdefault(name, []).append((binding, scope))
+
+    def add_occurrence(self, name: str, kind: str, node, extra=None):
+        self.occurrences.setdefault(name, []).append((kind, node, self.scope, extra))
+
+    def visit_scope(self, scope: _Scope, nodes):
+        outer, self.scope = self.scope, scope
+        for node in nodes:
+            self.visit(node)
+        self.scope = outer
+
+    def bind_target(self, target, value=None, annotation=None, kind="assign"):
+        """Binds the names assigned by an assignment target, value is only kept for a plain name target."""
+        if isinstance(target, ast.Name):
+            self.bind(target.id, ("assign", value, annotation) if kind == "assign" else ("other",))
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self.bind_target(element, kind=kind)
+        elif isinstance(target, ast.Starred):
+            self.bind_target(target.value, kind=kind)
+        else:
+            if isinstance(target, ast.Attribute) and kind == "assign":
+                self.record_self_attribute(target, value, annotation)
+            self.visit(target)
+
+    def record_self_attribute(self, target: ast.Attribute, value, annotation):
+        if not isinstance(target.value, ast.Name):
+            return
+        scope = self.scope
+        while scope is not None and scope.kind == "function":
+            bindings = scope.bindings.get(target.value.id)
+            if bindings:
+                binding = bindings[0][0]
+                if len(bindings) == 1 and binding[0] == "param" and binding[2] == "self":
+                    class_scope = scope.method_class
+                    class_scope.self_attributes.setdefault(target.attr, []).append((value, annotation, self.scope))
+                return
+            scope = scope.parent
+
+    def visit_definition(self, node):
+        definition = _Definition(self.module, node, self.scope)
+        self.definitions[(self.module.file_path, node.lineno, node.name)] = definition
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        if isinstance(node, ast.ClassDef):
+            for base in node.bases:
+                self.visit(base)
+            for keyword in node.keywords:
+                self.visit(keyword)
+            self.bind(node.name, ("def", definition))
+            definition.body_scope = _Scope("class", self.scope, self.module, definition)
+            self.visit_scope(definition.body_scope, node.body)
+            return
+        self.visit_arguments(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        self.bind(node.name, ("def", definition))
+        scope = definition.body_scope = _Scope("function", self.scope, self.module, definition)
+        first_role = None
+        if self.scope.kind == "class":
+            scope.method_class = self.scope
+            decorator_names = {
+                decorator.id if isinstance(decorator, ast.Name) else getattr(decorator, "attr", None)
+                for decorator in node.decorator_list
+            }
+            if "staticmethod" not in decorator_names:
+                first_role = "cls" if "classmethod" in decorator_names or node.name in ("__new__", "__init_subclass__", "__class_getitem__") else "self"
+        self.bind_parameters(scope, node.args, first_role)
+        self.visit_scope(scope, node.body)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_ClassDef = visit_definition
+
+    def visit_arguments(self, args: ast.arguments):
+        """Defaults and annotations are evaluated in the enclosing scope."""
+        for default in args.defaults + [default for default in args.kw_defaults if default is not None]:
+            self.visit(default)
+        for arg in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if arg is not None and arg.annotation is not None:
+                self.visit(arg.annotation)
+
+    def bind_parameters(self, scope: _Scope, args: ast.arguments, first_role=None):
+        positional = args.posonlyargs + args.args
+        for index, arg in enumerate(positional + args.kwonlyargs):
+            role = first_role if index == 0 and positional else None
+            self.bind(arg.arg, ("param", arg.annotation, role), scope)
+        for arg in (args.vararg, args.kwarg):
+            if arg is not None:
+                self.bind(arg.arg, ("param", None, None), scope)
+
+    def visit_Lambda(self, node):
+        self.visit_arguments(node.args)
+        scope = _Scope("function", self.scope, self.module)
+        self.bind_parameters(scope, node.args)
+        self.visit_scope(scope, [node.body])
+
+    def visit_comprehension_scope(self, node, elements):
+        generators = node.generators
+        self.visit(generators[0].iter)  # 第一个迭代对象在外层作用域中求值
+        outer, self.scope = self.scope, _Scope("function", self.scope, self.module)
+        for index, generator in enumerate(generators):
+            if index:
+                self.visit(generator.iter)
+            self.bind_target(generator.target, kind="other")
+            for condition in generator.ifs:
+                self.visit(condition)
+        for element in elements:
+            self.visit(element)
+        self.scope = outer
+
+    def visit_ListComp(self, node):
+        self.visit_comprehension_scope(node, [node.elt])
+
+    visit_SetComp = visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self.visit_comprehension_scope(node, [node.key, node.value])
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.bind(alias.asname, ("import_module", tuple(alias.name.split(".")), 0))
+            else:
+                first_name = alias.name.split(".")[0]
+                self.bind(first_name, ("import_module", (first_name,), 0))
+
+    def visit_ImportFrom(self, node):
+        module_name = tuple(node.module.split(".")) if node.module else ()
+        for alias in node.names:
+            if alias.name == "*":
+                self.module.star_imports.append((module_name, node.level))
+                continue
+            self.bind(alias.asname or alias.name, ("import_from", module_name, node.level, alias.name))
+            self.add_occurrence(alias.name, "import", alias, (module_name, node.level))
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self.bind_target(target, node.value if len(node.targets) == 1 else None)
+
+    def visit_AnnAssign(self, node):
+        self.visit(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+        self.bind_target(node.target, node.value, node.annotation)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self.add_occurrence(node.target.id, "name", node.target)
+        self.bind_target(node.target, kind="other")
+
+    def visit_NamedExpr(self, node):
+        self.visit(node.value)
+        scope = self.scope
+        while scope.parent is not None and scope.definition is None and scope.kind == "function":
+            scope = scope.parent  # 推导式中的 := 绑定在外层作用域
+        self.bind(node.target.id, ("other",), scope)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self.bind_target(node.target, kind="other")
+        for statement in node.body + node.orelse:
+            self.visit(statement)
+
+    visit_AsyncFor = visit_For
+
+    def visit_withitem(self, node):
+        self.visit(node.context_expr)
+        if node.optional_vars is not None:
+            self.bind_target(node.optional_vars, kind="other")
+
+    def visit_ExceptHandler(self, node):
+        if node.type is not None:
+            self.visit(node.type)
+        if node.name:
+            self.bind(node.name, ("other",))
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_Global(self, node):
+        self.scope.global_names.update(node.names)
+
+    def visit_Nonlocal(self, node):
+        self.scope.nonlocal_names.update(node.names)
+
+    def visit_MatchAs(self, node):
+        if node.name:
+            self.bind(node.name, ("other",))
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node):
+        if node.name:
+            self.bind(node.name, ("other",))
+
+    def visit_MatchMapping(self, node):
+        if node.rest:
+            self.bind(node.rest, ("other",))
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.add_occurrence(node.id, "name", node)
+        elif isinstance(node.ctx, ast.Store):
+            self.bind(node.id, ("other",))
+
+    def visit_Attribute(self, node):
+        if isinstance(node.ctx, ast.Load):
+            self.add_occurrence(node.attr, "attribute", node)
+        self.visit(node.value)
+
+
+class StaticReferenceResolver:
+    """
+    基于AST的引用查找, 与 ReferenceResolver 接口相同, 不需要 Jedi 的类型推断。
+
+    建立时解析仓库中的每个文件, 得到每个模块的作用域、名字绑定与导入关系, 以及所有被读取的名字。
+    查找某个函数/类的引用时, 逐个检查同名的名字能否静态地确定指向它:
+    - from x import y 中的 y (跟随相对/绝对导入与重新导出);
+    - 直接的名字, 按 LEGB 规则在作用域中查找;
+    - module.attr, 以及 Class.attr、super().attr;
+    - self.method / cls.method, 以及类型能确定的对象的属性: 调用类得到的实例、带类型标注的参数、
+      在方法中 self.x = SomeClass(...) 赋值的属性。
+    只要有一个同名的名字无法确定(例如类型未知的对象的属性), 这个名字的所有定义都交给 fallback
+    (通常是 ReferenceResolver, 即 Jedi)查找, 以免漏掉引用。
+
+    resolve_statically 的结果与 Jedi 一样按 (文件路径, 行, 列) 排序; statistics 记录每种方式找到的引用数
+    与交给 Jedi 的定义数, 见 `log_statistics`。
+    """
+
+    def __init__(self, repo_path, fallback, file_paths=None):
+        self.repo_path = os.fspath(repo_path)
+        self.fallback = fallback
+        self.statistics = Counter()
+        self._modules: Dict[Tuple[str, ...], _Module] = {}
+        self._definitions: Dict[Tuple[str, int, str], _Definition] = {}
+        self._occurrences: Dict[str, list] = {}  # 名字 -> [(种类, 节点, 作用域, 附加信息)]
+        self._resolved: Dict[str, Tuple[Dict[_Definition, list], bool]] = {}  # 名字 -> (每个定义的引用位置, 是否有无法确定的)
+        self._mro_cache: Dict[_Definition, Tuple[list, bool]] = {}
+        for file_path in file_paths if file_paths is not None else iter_python_files(self.repo_path):
+            self._add_file(file_path)
+
+    @property
+    def file_timings(self):
+        return self.fallback.file_timings
+
+    @property
+    def lookup_counts(self):
+        return self.fallback.lookup_counts
+
+    @property
+    def index(self):
+        return self.fallback.index
+
+    def _add_file(self, file_path: str):
+        try:
+            with open(os.path.join(self.repo_path, file_path), "rb") as reader:
+                source = SourceBuffer.from_bytes(reader.read())
+            tree = ast.parse(source.text)
+        except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+            logger.info(f"Static reference resolution skips {file_path}: {e}")
+            return
+        module = _Module(file_path, source)
+        builder = _ScopeBuilder(module, self._definitions, self._occurrences)
+        for statement in tree.body:
+            builder.visit(statement)
+        self._modules[module.name] = module
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """Drops the index (the resolver has to be rebuilt after files change) and the Scripts of the fallback."""
+        if file_path is None:
+            self._modules.clear()
+            self._definitions.clear()
+            self._occurrences.clear()
+            self._resolved.clear()
+            self._mro_cache.clear()
+        self.fallback.invalidate(file_path)
+
+    def find_references(
+        self, variable_name, file_path, line_number, column_number, in_file_only=False
+    ) -> List[Tuple[str, int, int]]:
+        """Same as `ReferenceResolver.find_references`, falls back to it when the result cannot be determined statically."""
+        references = self.resolve_statically(variable_name, file_path, line_number, in_file_only)
+        if references is not None:
+            return references
+        return self.fallback.find_references(variable_name, file_path, line_number, column_number, in_file_only)
+
+    def resolve_statically(self, variable_name, file_path, line_number, in_file_only=False) -> Optional[List[Tuple[str, int, int]]]:
+        """
+        Returns:
+            Optional[List[Tuple[str, int, int]]]: (path relative to the repo, line, column) of every reference, or None
+            if some name could refer to the definition but cannot be resolved statically.
+        """
+        definition = self._definitions.get((file_path, line_number, variable_name))
+        if definition is None or len(definition.scope.bindings.get(variable_name, ())) != 1:
+            self.statistics["fallback_definitions"] += 1
+            return None
+        references, ambiguous = self._resolve_name(variable_name)
+        if ambiguous:
+            self.statistics["fallback_definitions"] += 1
+            return None
+        self.statistics["static_definitions"] += 1
+        positions = sorted(references.get(definition, ()))
+        if in_file_only:
+            positions = [position for position in positions if position[0] == file_path]
+        return positions
+
+    def log_slowest_files(self, count: int = 10):
+        self.log_statistics()
+        self.fallback.log_slowest_files(count)
+
+    def log_statistics(self):
+        statistics = self.statistics
+        logger.info(
+            f"Static references: {statistics['static_definitions']} definitions resolved statically, "
+            f"{statistics['fallback_definitions']} resolved by Jedi; references found by "
+            f"import {statistics['import']}, name {statistics['name']}, module attribute {statistics['module_attr']}, "
+            f"self/cls/super attribute {statistics['self_attr']}, class/instance attribute {statistics['class_attr']}; "
+            f"{statistics['ambiguous']} names could not be resolved"
+        )
+
+    def _resolve_name(self, name: str):
+        """Resolves every occurrence of name once, shared by all the definitions with that name."""
+        resolved = self._resolved.get(name)
+        if resolved is not None:
+            return resolved
+        references: Dict[_Definition, list] = {}
+        ambiguous = False
+        for kind, node, scope, extra in self._occurrences.get(name, ()):
+            if kind == "import":
+                target, path = self._goto_import_from(extra[0], extra[1], name, scope.module, 0), "import"
+                line, column = node.lineno, node.col_offset
+            elif kind == "name":
+                target, path = self._goto_name(name, scope, 0), "name"
+                line, column = node.lineno, node.col_offset
+            else:
+                receiver = self._infer(node.value, scope, 0)
+                target = self._goto_attribute(receiver, name, 0)
+                if receiver[0] == "module":
+                    path = "module_attr"
+                elif receiver[0] == "super" or self._is_self_or_cls(node.value, scope):
+                    path = "self_attr"
+                else:
+                    path = "class_attr"
+                line, column = node.end_lineno, node.end_col_offset - len(name.encode("utf-8"))
+            if target is _UNKNOWN:
+                ambiguous = True
+                self.statistics["ambiguous"] += 1
+            elif target[0] == "def" and target[1].name == name:
+                self.statistics[path] += 1
+                references.setdefault(target[1], []).append(
+                    (scope.module.file_path, line, self._to_character_column(scope.module, line, column))
+                )
+        resolved = self._resolved[name] = (references, ambiguous)
+        return resolved
+
+    @staticmethod
+    def _to_character_column(module: _Module, line: int, column: int) -> int:
+        """ast columns are utf-8 byte offsets, Jedi columns count characters."""
+        text = module.source.get_lines(line, line)
+        if text.isascii():
+            return column
+        return len(text.encode("utf-8")[:column].decode("utf-8", errors="ignore"))
+
+    def _is_self_or_cls(self, node, scope: _Scope) -> bool:
+        if not isinstance(node, ast.Name):
+            return False
+        found = self._lookup(node.id, scope)
+        return found is not None and len(found) == 1 and found[0][0][0] == "param" and found[0][0][2] in ("self", "cls")
+
+    # ---- 作用域与模块 ----
+
+    @staticmethod
+    def _lookup(name: str, scope: _Scope):
+        """LEGB lookup, returns the bindings of the innermost scope that binds name, or None."""
+        current, innermost = scope, True
+        while current is not None:
+            if name in current.global_names:
+                current = current.module.scope
+                continue
+            if (innermost or current.kind != "class") and name in current.bindings:
+                return current.bindings[name]
+            innermost = False
+            current = current.parent
+        return None
+
+    def _resolve_module(self, module_name: Tuple[str, ...], level: int, importer: _Module):
+        """The module imported by importer: ("module", name), _EXTERNAL, or _UNKNOWN."""
+        if level:
+            package = importer.name if importer.is_package else importer.name[:-1]
+            if level - 1 > len(package):
+                return _UNKNOWN
+            candidates = [package[: len(package) - (level - 1)] + module_name]
+        else:
+            if not module_name:
+                return _UNKNOWN
+            if module_name in self._modules:
+                return ("module", module_name)
+            if _is_external_module(module_name[0]):
+                return _EXTERNAL
+            # Jedi 也会在不是包的上级目录中查找(脚本式的导入)
+            directory = importer.file_path.split("/")[:-1]
+            candidates = []
+            while directory:
+                if not os.path.exists(os.path.join(self.repo_path, *directory, "__init__.py")):
+                    candidates.append(tuple(directory) + module_name)
+                directory = directory[:-1]
+        for candidate in candidates:
+            if candidate in self._modules:
+                return ("module", candidate)
+        for candidate in candidates + [module_name]:
+            base = os.path.join(self.repo_path, *candidate)
+            if os.path.exists(base + ".py") or os.path.isdir(base):
+                return _UNKNOWN  # 仓库中存在, 但没有被索引(例如被忽略的文件)
+        return _EXTERNAL if not level else _UNKNOWN
+
+    def _star_targets(self, module: _Module):
+        for module_name, level in module.star_imports:
+            yield self._resolve_module(module_name, level, module)
+
+    # ---- goto: 名字指向哪个定义, 跟随导入, 不跟随赋值(与 Jedi 的 goto 相同) ----
+
+    def _goto_bindings(self, bindings, depth: int):
+        results = {self._goto_binding(binding, scope, depth) for binding, scope in bindings}
+        if len(results) == 1:
+            return results.pop()
+        return _VALUE if all(result is _VALUE for result in results) else _UNKNOWN
+
+    def _goto_binding(self, binding: tuple, scope: _Scope, depth: int):
+        kind = binding[0]
+        if kind == "def":
+            return ("def", binding[1])
+        if kind == "import_from":
+            return self._goto_import_from(binding[1], binding[2], binding[3], scope.module, depth + 1)
+        return _VALUE  # 模块、参数与变量都不是函数/类的定义
+
+    def _goto_name(self, name: str, scope: _Scope, depth: int):
+        bindings = self._lookup(name, scope)
+        if bindings is not None:
+            return self._goto_bindings(bindings, depth)
+        return self._goto_missing_global(scope.module, name, depth)
+
+    def _goto_missing_global(self, module: _Module, name: str, depth: int):
+        """A name that no scope binds: star imports, builtins, or a name that does not exist."""
+        for target in self._star_targets(module):
+            if target is _UNKNOWN:
+                return _UNKNOWN
+            if target[0] == "module" and not name.startswith("_"):
+                result = self._goto_module_attribute(self._modules[target[1]], name, depth + 1, from_star=True)
+                if result is not None:
+                    return result
+        return _VALUE
+
+    def _goto_import_from(self, module_name, level: int, name: str, importer: _Module, depth: int):
+        if depth > _MAX_DEPTH:
+            return _UNKNOWN
+        target = self._resolve_module(module_name, level, importer)
+        if target[0] != "module":
+            return _VALUE if target is _EXTERNAL else _UNKNOWN
+        result = self._goto_module_attribute(self._modules[target[1]], name, depth)
+        return _UNKNOWN if result is None else result
+
+    def _goto_module_attribute(self, module: _Module, name: str, depth: int, from_star=False):
+        """None if the module has no such name (only when from_star, otherwise _UNKNOWN)."""
+        if depth > _MAX_DEPTH:
+            return _UNKNOWN
+        bindings = module.scope.bindings.get(name)
+        if bindings is not None:
+            return self._goto_bindings(bindings, depth)
+        if module.name + (name,) in self._modules:
+            return _VALUE  # 子模块
+        for target in self._star_targets(module):
+            if target is _UNKNOWN:
+                return _UNKNOWN
+            if target[0] == "module" and not name.startswith("_"):
+                result = self._goto_module_attribute(self._modules[target[1]], name, depth + 1, from_star=True)
+                if result is not None:
+                    return result
+        if from_star:
+            return None
+        return _UNKNOWN  # 可能是运行时动态添加的属性
+
+    def _goto_attribute(self, receiver: tuple, name: str, depth: int):
+        kind = receiver[0]
+        if kind == "module":
+            return self._goto_module_attribute(self._modules[receiver[1]], name, depth)
+        if kind in ("def", "instance", "super") and receiver[1].is_class:
+            found = self._find_class_attribute(receiver, name, depth)
+            if found is None:
+                return _VALUE
+            if found is _UNKNOWN:
+                return _UNKNOWN
+            bindings, is_instance_attribute = found
+            return _VALUE if is_instance_attribute else self._goto_bindings(bindings, depth + 1)
+        if receiver is _EXTERNAL:
+            return _VALUE
+        return _UNKNOWN
+
+    # ---- 推断: 表达式的值 ----
+
+    def _infer(self, node, scope: _Scope, depth: int):
+        if depth > _MAX_DEPTH:
+            return _UNKNOWN
+        if isinstance(node, ast.Name):
+            bindings = self._lookup(node.id, scope)
+            if bindings is None:
+                return self._infer_missing_global(scope.module, node.id, depth)
+            return self._infer_bindings(bindings, depth + 1)
+        if isinstance(node, ast.Attribute):
+            return self._infer_attribute(self._infer(node.value, scope, depth + 1), node.attr, depth + 1)
+        if isinstance(node, ast.Call):
+            if isinstance(node.func, ast.Name) and node.func.id == "super" and self._lookup("super", scope) is None:
+                class_scope = self._method_class(scope)
+                return ("super", class_scope.definition) if class_scope is not None else _UNKNOWN
+            function = self._infer(node.func, scope, depth + 1)
+            if function[0] == "def":
+                if function[1].is_class:
+                    return ("instance", function[1])
+                returns = function[1].node.returns
+                return self._infer_annotation(returns, function[1].scope, depth + 1) if returns is not None else _VALUE
+            return _UNKNOWN
+        if isinstance(node, _LITERAL_NODES):
+            return _EXTERNAL
+        return _UNKNOWN
+
+    @staticmethod
+    def _method_class(scope: _Scope) -> Optional[_Scope]:
+        while scope is not None:
+            if scope.method_class is not None:
+                return scope.method_class
+            scope = scope.parent
+        return None
+
+    def _infer_missing_global(self, module: _Module, name: str, depth: int):
+        for target in self._star_targets(module):
+            if target is _UNKNOWN:
+                return _UNKNOWN
+            if target[0] == "module":
+                star_module = self._modules[target[1]]
+                if name in star_module.scope.bindings:
+                    return self._infer_bindings(star_module.scope.bindings[name], depth + 1)
+        return _EXTERNAL if name in _BUILTIN_NAMES else _UNKNOWN
+
+    def _infer_bindings(self, bindings, depth: int):
+        results = {self._infer_binding(binding, scope, depth) for binding, scope in bindings}
+        return results.pop() if len(results) == 1 else _UNKNOWN
+
+    def _infer_binding(self, binding: tuple, scope: _Scope, depth: int):
+        if depth > _MAX_DEPTH:
+            return _UNKNOWN
+        kind = binding[0]
+        if kind == "def":
+            return ("def", binding[1])
+        if kind == "import_module":
+            return self._resolve_module(binding[1], binding[2], scope.module)
+        if kind == "import_from":
+            target = self._resolve_module(binding[1], binding[2], scope.module)
+            if target[0] != "module":
+                return target
+            return self._infer_attribute(target, binding[3], depth + 1)
+        if kind == "param":
+            annotation, role = binding[1], binding[2]
+            if role is not None and scope.method_class is not None:
+                class_definition = scope.method_class.definition
+                return ("instance", class_definition) if role == "self" else ("def", class_definition)
+            return self._infer_annotation(annotation, scope.parent, depth + 1) if annotation is not None else _VALUE
+        if kind == "assign":
+            value, annotation = binding[1], binding[2]
+            if annotation is not None:
+                inferred = self._infer_annotation(annotation, scope, depth + 1)
+                if inferred[0] == "instance":
+                    return inferred
+            return self._infer(value, scope, depth + 1) if value is not None else _VALUE
+        return _VALUE
+
+    def _infer_annotation(self, annotation, scope: _Scope, depth: int):
+        """The instance described by a type annotation, _VALUE if it is not a class of the repo."""
+        if isinstance(annotation, ast.Subscript):
+            container = annotation.value
+            container_name = container.id if isinstance(container, ast.Name) else getattr(container, "attr", None)
+            if container_name == "Optional":
+                return self._infer_annotation(annotation.slice, scope, depth + 1)
+            return _VALUE
+        if isinstance(annotation, (ast.Name, ast.Attribute)):
+            inferred = self._infer(annotation, scope, depth + 1)
+            if inferred[0] == "def" and inferred[1].is_class:
+                return ("instance", inferred[1])
+        return _VALUE
+
+    def _infer_attribute(self, receiver: tuple, name: str, depth: int):
+        if depth > _MAX_DEPTH:
+            return _UNKNOWN
+        kind = receiver[0]
+        if kind == "module":
+            module = self._modules[receiver[1]]
+            bindings = module.scope.bindings.get(name)
+            if bindings is not None:
+                return self._infer_bindings(bindings, depth + 1)
+            if module.name + (name,) in self._modules:
+                return ("module", module.name + (name,))
+            return self._infer_missing_global(module, name, depth + 1) if module.star_imports else _UNKNOWN
+        if kind in ("def", "instance", "super") and receiver[1].is_class:
+            found = self._find_class_attribute(receiver, name, depth)
+            if found is None:
+                return _EXTERNAL
+            if found is _UNKNOWN:
+                return _UNKNOWN
+            bindings, is_instance_attribute = found
+            if not is_instance_attribute:
+                return self._infer_bindings(bindings, depth + 1)
+            results = set()
+            for value, annotation, scope in bindings:
+                inferred = self._infer_annotation(annotation, scope, depth + 1) if annotation is not None else _VALUE
+                if inferred[0] != "instance":
+                    inferred = self._infer(value, scope, depth + 1) if value is not None else _UNKNOWN
+                results.add(inferred)
+            return results.pop() if len(results) == 1 else _UNKNOWN
+        if receiver is _EXTERNAL:
+            return _EXTERNAL
+        return _UNKNOWN
+
+    # ---- 类 ----
+
+    def _find_class_attribute(self, receiver: tuple, name: str, depth: int):
+        """
+        Looks name up along the MRO of the class.
+
+        Returns:
+            (bindings, is_instance_attribute) for the first class that has it; None if no class of the repo has it
+            and every base is known (it comes from an external base or does not exist); _UNKNOWN otherwise.
+        """
+        kind, class_definition = receiver
+        mro, complete = self._get_mro(class_definition, depth)
+        if kind == "super":
+            mro = mro[1:]
+        for definition in mro:
+            class_scope = definition.body_scope
+            bindings = class_scope.bindings.get(name)
+            instance_bindings = class_scope.self_attributes.get(name) if kind == "instance" else None
+            if bindings is not None and instance_bindings is not None:
+                return _UNKNOWN
+            if bindings is not None:
+                return bindings, False
+            if instance_bindings is not None:
+                return instance_bindings, True
+        return None if complete else _UNKNOWN
+
+    def _get_mro(self, class_definition: _Definition, depth: int):
+        """(classes of the repo in method resolution order, whether every base class is known)."""
+        cached = self._mro_cache.get(class_definition)
+        if cached is not None:
+            return cached
+        self._mro_cache[class_definition] = ([class_definition], False)  # 循环继承时当作不完整
+        mro, complete = [class_definition], True
+        for base in class_definition.node.bases:
+            inferred = self._infer(base.value if isinstance(base, ast.Subscript) else base, class_definition.scope, depth + 1)
+            if inferred[0] == "def" and inferred[1].is_class:
+                base_mro, base_complete = self._get_mro(inferred[1], depth + 1)
+                mro.extend(definition for definition in base_mro if definition not in mro)
+                complete = complete and base_complete
+            elif inferred is not _EXTERNAL:
+                complete = False
+        self._mro_cache[class_definition] = (mro, complete)
+        return mro, complete
+
+
+@lru_cache(maxsize=None)
+def _is_external_module(top_level_name: str) -> bool:
+    """Whether an absolute import of this top level name leaves the repo (standard library or installed package)."""
+    if top_level_name in sys.builtin_module_names:
+        return True
+    try:
+        return importlib.util.find_spec(top_level_name) is not None
+    except (ImportError, ValueError):
+        return False
@@ -0,0 +1,29 @@
+import os
+import shutil
+import sys
+from pathlib import Path
+
+import pytest
+
+PACKAGE_DIR = Path(__file__).resolve().parent.parent
+TESTING_REPO = PACKAGE_DIR / "TestingRepo"
+
+# settings 在导入时读取这些环境变量
+os.environ.setdefault("target_repo_path", str(TESTING_REPO))
+os.environ.setdefault("hierarchy_path", ".project_doc_record")
+os.environ.setdefault("markdown_docs_path", "markdown_docs")
+os.environ.setdefault("BASE-URL", "https://example.org")
+os.environ.setdefault("MODEL", "gpt-3.5-turbo")
+os.environ.setdefault("API-KEY", "test-key")
+sys.path.insert(0, str(PACKAGE_DIR))
+
+
+@pytest.fixture
+def testing_repo(tmp_path, monkeypatch):
+    """A copy of TestingRepo set as the target repo, so that tests can modify it and write the hierarchy into it."""
+    from settings import setting
+
+    repo_path = tmp_path / "TestingRepo"
+    shutil.copytree(TESTING_REPO, repo_path, ignore=shutil.ignore_patterns("__pycache__", ".project_doc_record"))
+    monkeypatch.setattr(setting.project, "target_repo", repo_path)
+    return repo_path
@@ -0,0 +1,56 @@
+import threading
+
+from checkpoint_writer import CheckpointWriter
+from doc_meta_info import DocItemStatus, MetaInfo
+from settings import setting
+
+
+def test_compaction_runs_on_the_writer_thread():
+    written_snapshots, written_records, compact_threads = [], [], []
+
+    def compact(writer):
+        compact_threads.append(threading.current_thread().name)
+        writer.submit_snapshot("snapshot")
+
+    writer = CheckpointWriter("dir", written_snapshots.append, written_records.extend, compact=compact)
+    assert writer.submit_record(["a"], "record a") == 1
+    assert writer.submit_record(["b"], "record b") == 2
+    writer.request_compaction()
+    writer.request_compaction()
+    writer.flush()
+
+    assert compact_threads == ["checkpoint-writer"]
+    assert written_snapshots == ["snapshot"]
+    assert written_records in ([], ["record a", "record b"])  # 记录可能在合并之前已经写出
+    assert writer.pending_record_count == 0
+
+
+def test_record_item_update_compacts_without_snapshotting_on_the_caller(testing_repo, monkeypatch):
+    monkeypatch.setattr(setting.project, "journal_compact_interval", 5)
+    meta_info = MetaInfo.init_meta_info({}, [])
+    checkpoint_dir = testing_repo / setting.project.hierarchy_name
+    meta_info.checkpoint(checkpoint_dir)
+
+    snapshot_threads = []
+    take_snapshot = meta_info.take_snapshot
+
+    def recording_take_snapshot(*args, **kwargs):
+        snapshot_threads.append(threading.current_thread().name)
+        return take_snapshot(*args, **kwargs)
+
+    monkeypatch.setattr(meta_info, "take_snapshot", recording_take_snapshot)
+    items = [item for item in meta_info.target_repo_hierarchical_tree.iter_preorder() if item.content][:12]
+    for item in items:
+        with meta_info.checkpoint_lock:
+            item.md_content.append(f"doc of {item.obj_name}")
+            item.item_status = DocItemStatus.doc_up_to_date
+        meta_info.record_item_update(checkpoint_dir, item)
+    meta_info.flush_checkpoint()
+
+    assert snapshot_threads and set(snapshot_threads) == {"checkpoint-writer"}
+    assert meta_info.checkpoint_writer.written_snapshot_count >= 2
+    loaded = MetaInfo.from_checkpoint_path(checkpoint_dir)
+    for item in items:
+        loaded_item = loaded.target_repo_hierarchical_tree.find(item.get_key_path())
+        assert list(loaded_item.md_content) == [f"doc of {item.obj_name}"]
+        assert loaded_item.item_status == DocItemStatus.doc_up_to_date
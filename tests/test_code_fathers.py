@@ -0,0 +1,112 @@
+import copy
+
+import pytest
+
+from conftest import TESTING_REPO
+from doc_meta_info import DocItem, DocItemType, MetaInfo
+from file_handler import FileHandler
+from identifier_index import iter_python_files
+
+# 同一层次中的重名对象会被重命名成 xxx_i
+DUPLICATES_SOURCE = '''\
+import sys
+
+if sys.version_info >= (3, 8):
+    def helper():
+        return 1
+else:
+    def helper():
+        return 2
+
+
+class Shape:
+    def area(self):
+        return 0
+
+    def area(self):
+        def inner():
+            pass
+
+        def inner():
+            pass
+
+        return 1
+
+    @property
+    def size(self):
+        return 1
+
+    @size.setter
+    def size(self, value):
+        pass
+
+
+def helper():
+    class Shape:
+        pass
+
+    return Shape
+'''
+
+
+def find_fathers_pairwise(items):
+    """Reference implementation: the pairwise parent search that _find_code_fathers replaced."""
+    fathers = []
+    for item in items:
+        potential_father = None
+        for other_item in items:
+            if other_item.code_end_line == item.code_end_line and other_item.code_start_line == item.code_start_line:
+                continue
+            if other_item.code_end_line < item.code_end_line or other_item.code_start_line > item.code_start_line:
+                continue
+            if potential_father is None or (
+                (other_item.code_end_line - other_item.code_start_line)
+                < (potential_father.code_end_line - potential_father.code_start_line)
+            ):
+                potential_father = other_item
+        fathers.append(potential_father)
+    return fathers
+
+
+def build_reference_file_item(file_objects):
+    """The objects of a file attached with the pairwise search and the original xxx_i renaming."""
+    file_item = DocItem(item_type=DocItemType._file, obj_name="file")
+    items = [
+        DocItem(obj_name=value["name"], content=value, code_start_line=value["code_start_line"], code_end_line=value["code_end_line"])
+        for value in file_objects
+    ]
+    for item, potential_father in zip(items, find_fathers_pairwise(items)):
+        if potential_father is None:
+            potential_father = file_item
+        child_name = item.obj_name
+        if child_name in potential_father.children:
+            now_name_id = 0
+            while (child_name + f"_{now_name_id}") in potential_father.children:
+                now_name_id += 1
+            child_name = child_name + f"_{now_name_id}"
+        potential_father.children[child_name] = item
+    return file_item
+
+
+def tree_shape(item):
+    return [
+        (child_name, child.code_start_line, child.code_end_line, tree_shape(child))
+        for child_name, child in item.children.items()
+    ]
+
+
+@pytest.mark.parametrize("file_path", [*iter_python_files(TESTING_REPO), "duplicates.py"])
+def test_same_tree_as_pairwise_search(testing_repo, file_path):
+    if file_path == "duplicates.py":
+        (testing_repo / file_path).write_text(DUPLICATES_SOURCE)
+    file_objects = FileHandler(testing_repo, None).generate_file_structure(file_path)
+    if not file_objects:
+        pytest.skip("no objects")
+    meta_info = MetaInfo.from_project_hierarchy_json({file_path: copy.deepcopy(file_objects)})
+    file_item = meta_info.target_repo_hierarchical_tree.find(file_path.split("/"))
+
+    assert tree_shape(file_item) == tree_shape(build_reference_file_item(file_objects))
+    if file_path == "duplicates.py":
+        assert set(file_item.children) == {"helper", "helper_0", "helper_1", "Shape"}
+        assert set(file_item.children["Shape"].children) == {"area", "area_0", "size", "size_0"}
+        assert set(file_item.children["Shape"].children["area_0"].children) == {"inner", "inner_0"}
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from doc_meta_info import MetaInfo
+from hierarchy_shards import ShardStore
+from settings import setting
+
+
+def documents(meta_info):
+    return {
+        item.get_full_name(): list(item.md_content)
+        for item in meta_info.target_repo_hierarchical_tree.iter_preorder()
+        if item.content
+    }
+
+
+def test_interrupted_snapshot_keeps_the_old_one(testing_repo, monkeypatch):
+    checkpoint_dir = testing_repo / setting.project.hierarchy_name
+    meta_info = MetaInfo.init_meta_info({}, [])
+    for item in meta_info.target_repo_hierarchical_tree.iter_preorder():
+        if item.content:
+            item.md_content.append(f"old doc of {item.obj_name}")
+    meta_info.checkpoint(checkpoint_dir, binary=False)
+    old_documents = documents(meta_info)
+
+    for item in meta_info.target_repo_hierarchical_tree.iter_preorder():
+        if item.content:
+            item.md_content.append(f"new doc of {item.obj_name}")
+
+    def crash(self, files):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ShardStore, "write_manifest", crash)
+        with pytest.raises(OSError):
+            meta_info.checkpoint(checkpoint_dir, binary=False)
+
+    # 所有新的分片都已经写出, 但 manifest 还是旧的, 旧快照的分片都没有被覆盖
+    assert documents(MetaInfo.from_checkpoint_path(checkpoint_dir)) == old_documents
+
+    meta_info.checkpoint(checkpoint_dir, binary=False)
+    new_documents = documents(MetaInfo.from_checkpoint_path(checkpoint_dir))
+    assert new_documents == documents(meta_info) != old_documents
+    store = ShardStore(checkpoint_dir)
+    assert sorted(os.listdir(store.shard_dir)) == sorted({info["shard"] for info in store.read_manifest().values()})
@@ -0,0 +1,27 @@
+from ignore_matcher import DEFAULT_IGNORE_PATTERNS, IgnoreMatcher
+
+
+def test_build_and_dist_are_only_ignored_at_the_root(tmp_path):
+    for rel_path in ["build/gen.py", "dist/pkg.py", "mypkg/build/steps.py", "mypkg/dist/wheel.py", "mypkg/core.py"]:
+        path = tmp_path / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("x = 1\n")
+
+    matcher = IgnoreMatcher(DEFAULT_IGNORE_PATTERNS)
+
+    assert sorted(path.replace("\\", "/") for path in matcher.walk_files(tmp_path)) == [
+        "mypkg/build/steps.py",
+        "mypkg/core.py",
+        "mypkg/dist/wheel.py",
+    ]
+    assert matcher.is_ignored("build/gen.py")
+    assert not matcher.is_ignored("mypkg/build/steps.py")
+
+
+def test_negation_and_directory_rules():
+    matcher = IgnoreMatcher(["*.log", "!keep.log", "cache/"])
+
+    assert matcher.is_ignored("a/b.log")
+    assert not matcher.is_ignored("a/keep.log")
+    assert matcher.is_ignored("a/cache/x.py")
+    assert not matcher.is_ignored("a/cache")  # 文件 cache 不受 "cache/" 影响
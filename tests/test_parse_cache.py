@@ -0,0 +1,62 @@
+import os
+
+from parse_cache import ParseCache, hash_file_content
+
+
+def test_get_returns_a_copy(tmp_path):
+    cache = ParseCache(tmp_path, parser_version=1)
+    file_objects = [{"name": "f", "code_start_line": 1}]
+    cache.put("a.py", "hash", file_objects)
+    file_objects[0]["name"] = "changed_after_put"
+
+    cached = cache.get("a.py", "hash")
+    cached[0]["name"] = "changed_after_get"
+    cached.append({"name": "g"})
+
+    assert cache.get("a.py", "hash") == [{"name": "f", "code_start_line": 1}]
+    assert cache.get("a.py", "other hash") is None
+
+
+def test_save_replaces_the_file(tmp_path):
+    cache = ParseCache(tmp_path, parser_version=1)
+    cache.put("a.py", "hash", [{"name": "f"}])
+    cache.save()
+
+    assert os.listdir(tmp_path) == [ParseCache.cache_file_name]
+    assert ParseCache(tmp_path, parser_version=1).get("a.py", "hash") == [{"name": "f"}]
+    assert ParseCache(tmp_path, parser_version=2).get("a.py", "hash") is None
+
+
+class _LateExecutor:
+    """Runs the submitted parse only when its result is requested, like a busy process pool."""
+
+    def submit(self, fn, *args):
+        class Future:
+            def result(self):
+                return fn(*args)
+
+        return Future()
+
+
+def test_entry_is_keyed_by_the_parsed_content(testing_repo):
+    from code_store import CodeStore
+    from file_handler import FileHandler
+    from tqdm import tqdm
+
+    file_handler = FileHandler(testing_repo, None)
+    parse_cache = ParseCache(testing_repo / "cache", parser_version=1)
+    code_store = CodeStore(testing_repo, file_handler.project_hierarchy)
+    (testing_repo / "a.py").write_text("def old():\n    pass\n")
+    old_hash = hash_file_content(testing_repo / "a.py")
+
+    for executor, parsed_name in [(_LateExecutor(), "new"), (None, "old")]:
+        (testing_repo / "a.py").write_text("def old():\n    pass\n")
+        parse_task = file_handler._start_parse("a.py", parse_cache, code_store, executor)
+        (testing_repo / "a.py").write_text("def new():\n    pass\n")  # 在解析之前被修改
+        ((_, file_objects),) = file_handler._finish_parse(parse_task, parse_cache, tqdm(disable=True))
+
+        assert [value["name"] for value in file_objects] == [parsed_name]
+        source_hash = file_objects[0]["source_hash"]
+        assert source_hash == (old_hash if parsed_name == "old" else hash_file_content(testing_repo / "a.py"))
+        assert parse_cache.get("a.py", source_hash) == file_objects
+        parse_cache.entries.clear()
@@ -0,0 +1,105 @@
+import os
+
+from doc_meta_info import MetaInfo
+from identifier_index import IdentifierIndex
+from reference_cache import ReferenceCache
+from reference_resolver import ReferenceResolver
+from settings import setting
+
+
+def make_cache(tmp_path, **resolver_options):
+    repo_path = tmp_path / "repo"
+    repo_path.mkdir(exist_ok=True)
+    (repo_path / "a.py").write_text("def f():\n    pass\n")
+    (repo_path / "b.py").write_text("from a import f\nf()\n")
+    return ReferenceCache(tmp_path / "cache", repo_path, IdentifierIndex(repo_path), resolver_options=resolver_options)
+
+
+def test_key_depends_on_resolver_options(tmp_path):
+    lookups = [("f", 1, 4, False)]
+    jedi_key = make_cache(tmp_path, use_static_references=False, use_identifier_index=True).get_key("a.py", lookups)
+    static_key = make_cache(tmp_path, use_static_references=True, use_identifier_index=True).get_key("a.py", lookups)
+    no_index_key = make_cache(tmp_path, use_static_references=False, use_identifier_index=False).get_key("a.py", lookups)
+
+    assert len({jedi_key, static_key, no_index_key}) == 3
+    assert make_cache(tmp_path, use_static_references=False, use_identifier_index=True).get_key("a.py", lookups) == jedi_key
+
+
+def test_save_replaces_the_file(tmp_path):
+    cache = make_cache(tmp_path, use_static_references=True)
+    key = cache.get_key("a.py", [("f", 1, 4, False)])
+    cache.put("a.py", key, [[("b.py", 1, 14), ("b.py", 2, 0)]])
+    cache.save()
+
+    assert os.listdir(tmp_path / "cache") == [ReferenceCache.cache_file_name]
+    assert make_cache(tmp_path, use_static_references=True).get("a.py", key) == [[("b.py", 1, 14), ("b.py", 2, 0)]]
+
+
+F_LOOKUPS = [("f", 1, 4, False)]
+
+
+def write_repo(repo_path):
+    repo_path.mkdir(exist_ok=True)
+    (repo_path / "a.py").write_text("def f():\n    pass\n")
+    (repo_path / "b.py").write_text("from a import f\nfrom helpers import g\nf(g())\n")
+    (repo_path / "helpers.py").write_text("def g():\n    return 1\n")
+    (repo_path / "other.py").write_text("def h():\n    return 2\n")
+
+
+def get_key(tmp_path, file_path="a.py", lookups=F_LOOKUPS):
+    """The key computed by a new cache, as in a later run: content hashes and import closures are cached per instance."""
+    repo_path = tmp_path / "repo"
+    return ReferenceCache(tmp_path / "cache", repo_path, IdentifierIndex(repo_path)).get_key(file_path, lookups)
+
+
+def test_key_changes_when_a_referencing_file_changes(tmp_path):
+    write_repo(tmp_path / "repo")
+    key = get_key(tmp_path)
+    (tmp_path / "repo/other.py").write_text("def h():\n    return 3\n")
+    assert get_key(tmp_path) == key  # 不包含 f 也不被导入的文件与键无关
+
+    (tmp_path / "repo/b.py").write_text("from a import f\nfrom helpers import g\n\nf(g())\n")
+    assert get_key(tmp_path) != key
+
+
+def test_key_changes_when_an_imported_module_changes(tmp_path):
+    write_repo(tmp_path / "repo")
+    key = get_key(tmp_path)
+    (tmp_path / "repo/helpers.py").write_text("def g():\n    return 4\n")  # b.py 导入了它, 但它不包含 f
+    assert get_key(tmp_path) != key
+
+
+def test_key_changes_when_a_new_file_contains_the_name(tmp_path):
+    write_repo(tmp_path / "repo")
+    key = get_key(tmp_path)
+    (tmp_path / "repo/c.py").write_text("from a import f\nf()\n")
+    assert get_key(tmp_path) != key
+
+
+def reference_summary(meta_info):
+    return [
+        (item.get_full_name(), sorted(referenced.get_full_name() for referenced in item.reference_who))
+        for item in meta_info.target_repo_hierarchical_tree.iter_preorder()
+    ]
+
+
+def parse_repo():
+    meta_info = MetaInfo.init_meta_info({}, [])
+    meta_info.parse_reference()
+    return meta_info
+
+
+def test_warm_run_builds_the_same_graph(testing_repo, monkeypatch):
+    monkeypatch.setattr(setting.project, "reference_process_count", 1)
+    monkeypatch.setattr(setting.project, "use_reference_cache", False)
+    uncached_summary = reference_summary(parse_repo())
+
+    monkeypatch.setattr(setting.project, "use_reference_cache", True)
+    parse_repo()
+    assert os.path.exists(testing_repo / setting.project.hierarchy_name / ReferenceCache.cache_file_name)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("a warm run should not look up any reference")
+
+    monkeypatch.setattr(ReferenceResolver, "find_references", fail)
+    assert reference_summary(parse_repo()) == uncached_summary
@@ -0,0 +1,46 @@
+from doc_meta_info import DocItem
+from reference_graph import ReferenceGraph
+
+
+def test_removed_nodes_are_reclaimed_on_freeze():
+    graph = ReferenceGraph()
+    caller, callee = DocItem(obj_name="caller"), DocItem(obj_name="callee")
+    graph.add_edge(caller, callee)
+    for round_id in range(100):  # 监视模式下每次修改都会删除旧对象、加入新对象
+        helper = DocItem(obj_name=f"helper_{round_id}")
+        graph.add_edge(helper, callee, special=True)
+        graph.add_edge(caller, helper)
+        graph.freeze()
+        graph.remove_node(helper)
+    graph.freeze()
+
+    assert graph.nodes == [caller, callee]
+    assert graph.edge_count == 1
+    assert graph.get_callers(callee) == (caller,)
+    assert graph.get_callees(caller) == (callee,)
+
+
+def test_compaction_keeps_edge_order_and_flags():
+    graph = ReferenceGraph()
+    items = [DocItem(obj_name=f"f{i}") for i in range(6)]
+    for target in (items[5], items[1], items[3], items[2]):
+        graph.add_edge(items[0], target, special=target is items[3])
+    graph.remove_node(items[1])
+    graph.freeze()
+
+    assert graph.get_callees(items[0]) == (items[5], items[3], items[2])
+    assert graph.get_special_flags(items[0]) == (False, True, False)
+    assert [item._reference_node_id for item in graph.nodes] == list(range(len(graph.nodes)))
+
+
+def test_has_edge_frozen_matches_unfrozen():
+    graph = ReferenceGraph()
+    items = [DocItem(obj_name=f"f{i}") for i in range(8)]
+    edges = {(i, j) for i in range(8) for j in range(8) if (i * 7 + j * 3) % 5 == 0 and i != j}
+    for i, j in sorted(edges, key=lambda edge: (edge[0], -edge[1])):
+        graph.add_edge(items[i], items[j])
+    expected = {(i, j): graph.has_edge(items[i], items[j]) for i in range(8) for j in range(8)}
+    graph.freeze()
+
+    assert {(i, j): graph.has_edge(items[i], items[j]) for i in range(8) for j in range(8)} == expected
+    assert {edge for edge, present in expected.items() if present} == edges
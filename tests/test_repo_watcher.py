@@ -0,0 +1,53 @@
+import shutil
+import sys
+
+import pytest
+
+from ignore_matcher import IgnoreMatcher
+from repo_watcher import RepoWatcher
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is only available on Linux")
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    (tmp_path / "pkg/sub").mkdir(parents=True)
+    (tmp_path / "pkg/a.py").write_text("a = 1\n")
+    (tmp_path / "pkg/sub/b.py").write_text("b = 1\n")
+    watcher = RepoWatcher(tmp_path, IgnoreMatcher(["ignored/"]), settle_time=0.05)
+    if watcher._inotify is None:
+        pytest.skip("inotify is not available")
+
+    def no_full_scan():
+        raise AssertionError("the whole repository was scanned again")
+
+    watcher._take_snapshot = no_full_scan
+    yield watcher
+    watcher.close()
+
+
+def test_only_changed_directories_are_scanned(tmp_path, watcher):
+    (tmp_path / "pkg/a.py").write_text("a = 2\n")
+    (tmp_path / "pkg/new").mkdir()
+    (tmp_path / "pkg/new/c.py").write_text("c = 1\n")
+    (tmp_path / "ignored").mkdir()
+    (tmp_path / "ignored/d.py").write_text("d = 1\n")
+
+    assert watcher.wait_for_changes() == (["pkg/a.py", "pkg/new/c.py"], [])
+
+    (tmp_path / "pkg/new/c.py").write_text("c = 2\n")  # 新目录也被监听了
+    assert watcher.wait_for_changes() == (["pkg/new/c.py"], [])
+
+
+def test_recreated_directory_is_watched_again(tmp_path, watcher):
+    shutil.rmtree(tmp_path / "pkg/sub")
+    assert watcher.wait_for_changes() == ([], ["pkg/sub/b.py"])
+    assert not watcher._inotify.is_watched(str(tmp_path / "pkg/sub"))
+
+    (tmp_path / "pkg/sub").mkdir()
+    (tmp_path / "pkg/sub/b.py").write_text("b = 2\n")
+    assert watcher.wait_for_changes() == (["pkg/sub/b.py"], [])
+    assert watcher._inotify.is_watched(str(tmp_path / "pkg/sub"))
+
+    (tmp_path / "pkg/sub/e.py").write_text("e = 1\n")
+    assert watcher.wait_for_changes() == (["pkg/sub/e.py"], [])
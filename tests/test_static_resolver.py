@@ -0,0 +1,124 @@
+from doc_meta_info import MetaInfo
+from reference_resolver import ReferenceResolver
+from static_resolver import StaticReferenceResolver
+
+
+def make_resolvers(repo_path):
+    jedi_resolver = ReferenceResolver(repo_path)
+    return StaticReferenceResolver(repo_path, jedi_resolver), jedi_resolver
+
+
+def write_repo(repo_path, files):
+    for file_path, text in files.items():
+        path = repo_path / file_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text)
+
+
+def find_with_both(repo_path, name, file_path, line, column):
+    static_resolver, jedi_resolver = make_resolvers(repo_path)
+    return (
+        static_resolver.resolve_statically(name, file_path, line),
+        sorted(jedi_resolver.find_references(name, file_path, line, column)),
+    )
+
+
+def test_agrees_with_jedi_on_the_testing_repo(testing_repo):
+    meta_info = MetaInfo.init_meta_info({}, [])
+    static_resolver, jedi_resolver = make_resolvers(testing_repo)
+    static_count = 0
+    for file_item in meta_info.iter_files():
+        file_path = file_item.get_full_name()
+        for item in file_item.get_travel_list():
+            if "name_column" not in item.content:
+                continue
+            line, column = item.content["code_start_line"], item.content["name_column"]
+            static_references = static_resolver.resolve_statically(item.obj_name, file_path, line)
+            if static_references is None:
+                continue
+            static_count += 1
+            assert static_references == sorted(jedi_resolver.find_references(item.obj_name, file_path, line, column)), (
+                item.get_full_name()
+            )
+    assert static_count > 0
+
+
+def test_relative_reexport(tmp_path):
+    write_repo(tmp_path, {
+        "pkg/__init__.py": "from .core import helper\n",
+        "pkg/core.py": "def helper():\n    return 1\n",
+        "user.py": "from pkg import helper\n\nhelper()\n",
+    })
+    static_references, jedi_references = find_with_both(tmp_path, "helper", "pkg/core.py", 1, 4)
+
+    assert static_references == jedi_references
+    assert ("user.py", 3, 0) in static_references
+
+
+def test_star_import(tmp_path):
+    write_repo(tmp_path, {
+        "core.py": "def helper():\n    return 1\n",
+        "user.py": "from core import *\n\nhelper()\n",
+    })
+    static_references, jedi_references = find_with_both(tmp_path, "helper", "core.py", 1, 4)
+
+    assert static_references == jedi_references == [("user.py", 3, 0)]
+
+
+def test_super_attribute(tmp_path):
+    write_repo(tmp_path, {
+        "shapes.py": (
+            "class Base:\n"
+            "    def area(self):\n"
+            "        return 0\n"
+            "\n"
+            "\n"
+            "class Square(Base):\n"
+            "    def area(self):\n"
+            "        return super().area() + 1\n"
+        ),
+    })
+    static_references, jedi_references = find_with_both(tmp_path, "area", "shapes.py", 2, 8)
+
+    assert static_references == jedi_references == [("shapes.py", 8, 23)]
+    assert make_resolvers(tmp_path)[0].resolve_statically("area", "shapes.py", 7) == []
+
+
+def test_class_scope_name_is_not_visible_in_methods(tmp_path):
+    write_repo(tmp_path, {
+        "app.py": (
+            "def helper():\n"
+            "    return 1\n"
+            "\n"
+            "\n"
+            "class App:\n"
+            "    def helper(self):\n"
+            "        return 2\n"
+            "\n"
+            "    def run(self):\n"
+            "        return helper()\n"
+        ),
+    })
+    static_references, jedi_references = find_with_both(tmp_path, "helper", "app.py", 1, 4)
+
+    assert static_references == jedi_references == [("app.py", 10, 15)]
+    assert make_resolvers(tmp_path)[0].resolve_statically("helper", "app.py", 6) == []
+
+
+def test_unknown_receiver_falls_back_to_jedi(tmp_path):
+    write_repo(tmp_path, {
+        "tasks.py": (
+            "class Task:\n"
+            "    def run(self):\n"
+            "        return 1\n"
+            "\n"
+            "\n"
+            "def start(task):\n"
+            "    return task.run()\n"
+        ),
+    })
+    static_resolver, jedi_resolver = make_resolvers(tmp_path)
+
+    assert static_resolver.resolve_statically("run", "tasks.py", 2) is None
+    assert static_resolver.find_references("run", "tasks.py", 2, 8) == jedi_resolver.find_references("run", "tasks.py", 2, 8)
+    assert static_resolver.statistics["fallback_definitions"] == 2
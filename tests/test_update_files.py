@@ -0,0 +1,72 @@
+from doc_meta_info import MetaInfo
+from file_handler import parse_file_structure
+from settings import setting
+
+
+def parse_repo():
+    meta_info = MetaInfo.init_meta_info({}, [])
+    meta_info.parse_reference()
+    return meta_info
+
+
+def reference_summary(meta_info):
+    """Full name -> (sorted reference_who, sorted who_reference_me) of every node, in tree order."""
+    return [
+        (
+            item.get_full_name(),
+            sorted(referenced.get_full_name() for referenced in item.reference_who),
+            sorted(referencer.get_full_name() for referencer in item.who_reference_me),
+        )
+        for item in meta_info.target_repo_hierarchical_tree.iter_preorder()
+    ]
+
+
+def update(meta_info, repo_path, file_paths):
+    meta_info.update_files({file_path: parse_file_structure(repo_path, file_path)[1] for file_path in file_paths})
+
+
+def test_new_reference_to_an_untouched_file(testing_repo):
+    meta_info = parse_repo()
+    with open(testing_repo / "complex_app/models/product.py", "a") as writer:
+        writer.write(
+            "\n\ndef new_helper():\n"
+            "    from complex_app.core.utils import multiply_numbers\n"
+            "    return multiply_numbers(2, 3)\n"
+        )
+    update(meta_info, testing_repo, ["complex_app/models/product.py"])
+
+    multiply_numbers = meta_info.target_repo_hierarchical_tree.find(["complex_app", "core", "utils.py", "multiply_numbers"])
+    assert [item.get_full_name() for item in multiply_numbers.who_reference_me] == [
+        "complex_app/models/product.py/new_helper"
+    ]
+    assert reference_summary(meta_info) == reference_summary(parse_repo())
+
+
+def test_new_files_and_directories_are_in_walk_order(testing_repo):
+    meta_info = parse_repo()
+    (testing_repo / "complex_app/aaa").mkdir()
+    (testing_repo / "complex_app/aaa/x.py").write_text("from complex_app.a_first import first\n\n\ndef x_func():\n    return first()\n")
+    (testing_repo / "complex_app/a_first.py").write_text("def first():\n    return 1\n")
+    (testing_repo / "zz_last.py").write_text("def last():\n    return 2\n")
+    update(meta_info, testing_repo, ["complex_app/aaa/x.py", "zz_last.py", "complex_app/a_first.py"])
+
+    fresh_meta_info = parse_repo()
+    assert list(meta_info.target_repo_hierarchical_tree.children["complex_app"].children)[:3] == ["a_first.py", "main.py", "aaa"]
+    assert reference_summary(meta_info) == reference_summary(fresh_meta_info)
+    assert list(meta_info.to_hierarchy_json()) == list(fresh_meta_info.to_hierarchy_json())
+
+
+def test_replaced_source_snapshots_are_removed(testing_repo):
+    meta_info = parse_repo()
+    blob_dir = testing_repo / setting.project.hierarchy_name / "source_blobs"
+    for i in range(3):
+        with open(testing_repo / "complex_app/models/product.py", "a") as writer:
+            writer.write(f"\n\ndef helper_{i}():\n    return {i}\n")
+        update(meta_info, testing_repo, ["complex_app/models/product.py"])
+
+    live_hashes = {
+        item.content["source_hash"]
+        for item in meta_info.target_repo_hierarchical_tree.iter_preorder()
+        if "source_hash" in item.content
+    }
+    assert {path.name for path in blob_dir.glob("*/*")} == live_hashes